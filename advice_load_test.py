@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+from datetime import datetime
+import numpy as np
+from advice_providers import LocalAdviceProvider, GeminiProvider
+from financial_advice import FinancialAdvisor, AdviceContextRegistry
+from request_coalescing import SingleFlight, CoalescingModel
+from deadline_advice import DeadlineRunner
+from synthetic_statements import SyntheticStatementGenerator
+from statement_pipeline import StatementPipeline
+from recurring_detector import RecurringPaymentDetector
+from statement_summary import StatementSummarizer
+from statement_cleaning import clean_statement
+
+# Topics offered on the advice page
+TOPICS = ["Saving Strategies", "Debt Management", "Investment Options", "Budget Planning", "Expense Reduction"]
+
+
+class _CountingProvider:
+    """Wraps a provider to count the requests that reach it and how many run at once"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.outstanding = 0
+        self.max_outstanding = 0
+
+    def generate_content(self, prompt, **kwargs):
+        return self.count(lambda: self.provider.generate_content(prompt, **kwargs))
+
+    def create_context(self, text, ttl):
+        return self.count(lambda: self.provider.create_context(text, ttl))
+
+    def generate_in_context(self, context, prompt, **kwargs):
+        return self.count(lambda: self.provider.generate_in_context(context, prompt, **kwargs))
+
+    def count(self, request):
+        with self.lock:
+            self.calls += 1
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        try:
+            return request()
+        finally:
+            with self.lock:
+                self.outstanding -= 1
+
+
+class AdviceLoadTest:
+    """
+    A class to load test the advice flow with many concurrent sessions.
+
+    Every session does what the advice page does: it probes the provider,
+    asks for advice on a statement summary and then for advice on each topic.
+    Each session's calls go to the provider; only identical prompts that are
+    in flight at the same time share a request.
+    Calls go through the same layers as in the app (FinancialAdvisor,
+    request coalescing with a capped number of outstanding requests, and a
+    deadline runner), but each provider gets its own instances of them, so
+    providers are measured independently. Summaries are built from
+    synthetic statements, so prompts have realistic sizes and the test runs
+    fully offline with the local provider.
+    """
+
+    def __init__(self, sessions=200, statements=8, topics=2, deadline=8.0, max_concurrent=4,
+                 runner_workers=8, seed=0, shared_context=True):
+        """
+        Initialize the AdviceLoadTest.
+
+        Args:
+            sessions: Concurrent sessions
+            statements: Distinct statements the sessions are spread over
+            topics: Topic advice requests per session
+            deadline: Seconds a session waits for an answer before it counts as missed
+            max_concurrent: Maximum outstanding requests to the provider
+            runner_workers: Background threads of the deadline runner
+            seed: Seed of the synthetic statements
+            shared_context: Whether topic questions refer to a shared context of
+                the summary instead of embedding it
+        """
+        self.sessions = sessions
+        self.statements = statements
+        self.topics = topics
+        self.deadline = deadline
+        self.max_concurrent = max_concurrent
+        self.runner_workers = runner_workers
+        self.seed = seed
+        self.shared_context = shared_context
+
+    def params(self):
+        return {'sessions': self.sessions, 'statements': self.statements, 'topics': self.topics,
+                'deadline': self.deadline, 'max_concurrent': self.max_concurrent,
+                'runner_workers': self.runner_workers, 'seed': self.seed, 'shared_context': self.shared_context}
+
+    def build_summaries(self, rows=500):
+        """
+        Build the advice and category summaries of the synthetic statements.
+
+        Returns:
+            List of (advice summary, category summary) tuples
+        """
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        cwd = os.getcwd()
+
+        with tempfile.TemporaryDirectory(prefix='advice_load_test_') as work_dir:
+            # The pipeline keeps its state files in the working directory
+            os.chdir(work_dir)
+            try:
+                pipeline = StatementPipeline(base_dir)
+                summarizer = StatementSummarizer(RecurringPaymentDetector(pipeline.categorizer),
+                                                 pipeline.anomaly_detector)
+                summaries = []
+                for index in range(self.statements):
+                    generator = SyntheticStatementGenerator(seed=self.seed + index)
+                    df = pipeline.categorize(clean_statement(generator.generate_transactions(rows)))
+                    summaries.append((summarizer.build_gemini_summary(df, f"user{index}"),
+                                      summarizer.build_category_summary(df)))
+            finally:
+                os.chdir(cwd)
+        return summaries
+
+    def run(self, providers, summaries):
+        """
+        Run the load test against each provider.
+
+        Args:
+            providers: Dictionary of provider name -> provider
+            summaries: Statement summaries from build_summaries
+
+        Returns:
+            Dictionary of results
+        """
+        results = {}
+        for name, provider in providers.items():
+            print(f"Running {self.sessions} sessions against {name}")
+            results[name] = self.run_provider(provider, summaries)
+        return {
+            'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'params': self.params(),
+            'providers': results,
+        }
+
+    def run_provider(self, provider, summaries):
+        """Run every session against one provider and summarize the calls"""
+        counter = _CountingProvider(provider)
+        model = CoalescingModel(counter, name=getattr(provider, 'name', ''), flight=SingleFlight(),
+                                semaphore=threading.BoundedSemaphore(self.max_concurrent))
+        advisor = FinancialAdvisor(model, model.name, contexts=AdviceContextRegistry(),
+                                   shared_context=self.shared_context)
+        runner = DeadlineRunner(max_workers=self.runner_workers)
+        barrier = threading.Barrier(self.sessions)
+        calls = []
+        lock = threading.Lock()
+
+        def call(kind, key, func):
+            start = time.perf_counter()
+            error = None
+            future = runner.submit(key, func)
+            try:
+                done, _ = runner.wait(future, self.deadline)
+                if not done:
+                    # The page would show the fallback now; the answer is still measured
+                    future.result()
+            except Exception as e:
+                done, error = True, f"{type(e).__name__}: {e}"
+            with lock:
+                calls.append((kind, time.perf_counter() - start, not done, error))
+
+        def probe():
+            working, message = advisor.probe()
+            if not working:
+                raise RuntimeError(message)
+
+        def session(index):
+            summary, category_summary = summaries[index % len(summaries)]
+            # Runner keys are per session: the runner keeps finished results for
+            # minutes, so shared keys would measure its cache instead of the provider.
+            # Identical prompts in flight at once are still coalesced by the model.
+            prefix = f"session{index}"
+            barrier.wait()
+            call('probe', f"{prefix}:advice_probe", probe)
+            call('advice', f"{prefix}:advice:{summary}", lambda: advisor.request_advice(summary))
+            for offset in range(self.topics):
+                topic = TOPICS[(index + offset) % len(TOPICS)]
+                call('topic', f"{prefix}:topic:{topic}:{category_summary}",
+                     lambda topic=topic: advisor.request_topic_advice(topic, category_summary))
+
+        threads = [threading.Thread(target=session, args=(index,)) for index in range(self.sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        runner.executor.shutdown(wait=True)
+
+        result = {
+            'seconds': elapsed,
+            'sessions_per_second': self.sessions / elapsed,
+            'calls': len(calls),
+            'upstream_calls': counter.calls,
+            'max_outstanding_calls': counter.max_outstanding,
+            'errors': sum(error is not None for _, _, _, error in calls),
+            'deadline_misses': sum(missed for _, _, missed, _ in calls),
+            'latency': self.latency_summary([latency for _, latency, _, _ in calls]),
+            'token_usage': advisor.token_usage,
+            'kinds': {},
+        }
+        for kind in ('probe', 'advice', 'topic'):
+            kind_calls = [entry for entry in calls if entry[0] == kind]
+            if kind_calls:
+                result['kinds'][kind] = {
+                    'calls': len(kind_calls),
+                    'errors': sum(error is not None for _, _, _, error in kind_calls),
+                    'deadline_misses': sum(missed for _, _, missed, _ in kind_calls),
+                    'latency': self.latency_summary([latency for _, latency, _, _ in kind_calls]),
+                }
+        errors = [error for _, _, _, error in calls if error is not None]
+        if errors:
+            result['first_error'] = errors[0]
+        return result
+
+    def latency_summary(self, latencies):
+        """p50, p95, p99 and maximum of call latencies in seconds"""
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(max(latencies))}
+
+
+def print_results(results):
+    print(f"\n{'provider':12} {'kind':8} {'calls':>7} {'errors':>7} {'missed':>7} "
+          f"{'p50 s':>8} {'p95 s':>8} {'p99 s':>8}")
+    for name, result in results['providers'].items():
+        rows = [('all', result)] + list(result['kinds'].items())
+        for kind, entry in rows:
+            latency = entry['latency']
+            print(f"{name:12} {kind:8} {entry['calls']:>7} {entry['errors']:>7} {entry['deadline_misses']:>7} "
+                  f"{latency['p50']:>8.3f} {latency['p95']:>8.3f} {latency['p99']:>8.3f}")
+        print(f"{name:12} {result['sessions_per_second']:.1f} sessions/s, {result['upstream_calls']} upstream calls, "
+              f"at most {result['max_outstanding_calls']} outstanding")
+        for kind, usage in result['token_usage'].items():
+            print(f"{name:12} {kind:8} {usage['prompt_tokens'] / usage['calls']:.0f} input tokens per call "
+                  f"({usage['cached_tokens'] / usage['calls']:.0f} cached), "
+                  f"{usage['output_tokens'] / usage['calls']:.0f} output tokens per call")
+        if 'first_error' in result:
+            print(f"{name:12} first error: {result['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the advice flow with concurrent sessions")
+    parser.add_argument('--providers', default='local',
+                        help="Comma-separated providers to test: local, gemini (default: local)")
+    parser.add_argument('--sessions', type=int, default=200, help="Concurrent sessions")
+    parser.add_argument('--statements', type=int, default=8, help="Distinct statements the sessions use")
+    parser.add_argument('--topics', type=int, default=2, help="Topic advice requests per session")
+    parser.add_argument('--deadline', type=float, default=8.0, help="Seconds before a call counts as missed")
+    parser.add_argument('--max-concurrent', type=int, default=int(os.getenv('GEMINI_MAX_CONCURRENT', '4')),
+                        help="Maximum outstanding requests per provider")
+    parser.add_argument('--runner-workers', type=int, default=8, help="Background threads of the deadline runner")
+    parser.add_argument('--local-latency', type=float, default=1.0, help="Seconds per local provider call")
+    parser.add_argument('--local-jitter', type=float, default=0.5, help="Maximum extra seconds per local call")
+    parser.add_argument('--local-concurrency', type=int, help="Calls the local provider serves at once")
+    parser.add_argument('--local-token-latency', type=float, default=0.2,
+                        help="Extra seconds per 1000 uncached input tokens of a local call")
+    parser.add_argument('--local-min-cache-tokens', type=int,
+                        help="Smallest context the local provider caches (default: the Gemini model's minimum)")
+    parser.add_argument('--no-shared-context', action='store_true',
+                        help="Embed the summary in every topic prompt instead of sharing a context")
+    parser.add_argument('--gemini-model', default=os.getenv('GEMINI_MODEL', 'gemini-2.0-flash'),
+                        help="Gemini model to test")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic statements")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    providers = {}
+    for name in [name.strip() for name in args.providers.split(',') if name.strip()]:
+        if name == 'local':
+            min_cache_tokens = args.local_min_cache_tokens
+            if min_cache_tokens is None:
+                min_cache_tokens = GeminiProvider.model_min_tokens(args.gemini_model) or 0
+            providers[name] = LocalAdviceProvider(args.local_latency, args.local_jitter, args.local_concurrency,
+                                                  args.local_token_latency, min_cache_tokens)
+        elif name == 'gemini':
+            api_key = os.getenv('GOOGLE_API_KEY')
+            if not api_key:
+                print("GOOGLE_API_KEY is not set; cannot test the gemini provider")
+                sys.exit(1)
+            providers[name] = GeminiProvider(api_key, args.gemini_model)
+        else:
+            print(f"Unknown provider: {name}")
+            sys.exit(1)
+
+    load_test = AdviceLoadTest(args.sessions, args.statements, args.topics, args.deadline,
+                               args.max_concurrent, args.runner_workers, args.seed, not args.no_shared_context)
+    summaries = load_test.build_summaries()
+    print(f"Built summaries of {len(summaries)} synthetic statements")
+    results = load_test.run(providers, summaries)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
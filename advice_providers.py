@@ -0,0 +1,294 @@
+import os
+import re
+import time
+import hashlib
+import datetime
+import threading
+from abc import ABC, abstractmethod
+from request_coalescing import CoalescingModel
+
+
+def estimate_tokens(text):
+    """Rough token count of a text, for providers that do not report one"""
+    return max(1, len(text) // 4)
+
+
+class AdviceUsage:
+    """Token counts of one response, with the attribute names of Gemini's usage metadata"""
+
+    def __init__(self, prompt_token_count=0, cached_content_token_count=0, candidates_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class AdviceResponse:
+    """Response of an advice provider, shaped like a Gemini response"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class AdviceContext:
+    """
+    Text shared by several prompts, such as a statement summary that every
+    topic question refers to.
+
+    A cached context was sent to the provider once and is referred to by
+    name; otherwise its text is sent inline with every prompt.
+    """
+
+    def __init__(self, text, ttl, name=None, model=None):
+        """
+        Initialize the AdviceContext.
+
+        Args:
+            text: Text of the context
+            ttl: Seconds the provider keeps the context
+            name: Provider name of the cached context, None if it is sent inline
+            model: Provider model bound to the cached context
+        """
+        self.text = text
+        self.key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        self.name = name
+        self.model = model
+        self.expires = time.monotonic() + ttl
+
+    @property
+    def cached(self):
+        return self.name is not None
+
+
+class AdviceProvider(ABC):
+    """
+    Interface of the models that write financial advice.
+
+    Providers implement generate_content(prompt) and return an object with
+    a 'text' attribute, as the Gemini SDK does, so they can be wrapped by
+    CoalescingModel and read by the same response handling. Providers that
+    can keep a context on their side override create_context and
+    generate_in_context; the defaults send the context inline.
+    """
+
+    name = 'provider'
+
+    @abstractmethod
+    def generate_content(self, prompt, **kwargs):
+        """Generate content for a prompt"""
+
+    def create_context(self, text, ttl):
+        """Create a context that later prompts can refer to"""
+        return AdviceContext(text, ttl)
+
+    def generate_in_context(self, context, prompt, **kwargs):
+        """Generate content for a prompt that refers to a context"""
+        return self.generate_content(f"{context.text}\n\n{prompt}", **kwargs)
+
+
+class GeminiProvider(AdviceProvider):
+    """
+    A class to request advice from Google Gemini.
+
+    Contexts use Gemini context caching, which only some models support and
+    which refuses contents below a per-model minimum size. Smaller contexts,
+    such as most statement summaries, are sent inline without asking.
+    """
+
+    # Minimum tokens Gemini caches per model family; models not listed cannot cache
+    CACHE_MIN_TOKENS = {
+        'gemini-2.5-pro': 4096,
+        'gemini-2.5-flash': 1024,
+        'gemini-2.0-flash': 4096,
+        'gemini-2.0-flash-lite': None,
+        'gemini-1.5-pro': 4096,
+        'gemini-1.5-flash': 4096,
+    }
+
+    def __init__(self, api_key, model_name='gemini-2.0-flash', min_cache_tokens=None):
+        """
+        Initialize the GeminiProvider.
+
+        Args:
+            api_key: Google API key
+            model_name: Gemini model to use
+            min_cache_tokens: Smallest context worth caching (default: the
+                model's minimum from CACHE_MIN_TOKENS)
+        """
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self.min_cache_tokens = min_cache_tokens if min_cache_tokens is not None else self.model_min_tokens(model_name)
+
+    @classmethod
+    def model_min_tokens(cls, model_name):
+        """Return the minimum cacheable tokens of a model, or None if it cannot cache"""
+        name = model_name.split('/')[-1]
+        families = [family for family in cls.CACHE_MIN_TOKENS if name.startswith(family)]
+        return cls.CACHE_MIN_TOKENS[max(families, key=len)] if families else None
+
+    def generate_content(self, prompt, **kwargs):
+        return self.model.generate_content(prompt, **kwargs)
+
+    def create_context(self, text, ttl):
+        """Cache the context with Gemini context caching, or send it inline if it cannot be cached"""
+        if self.min_cache_tokens is None or estimate_tokens(text) < self.min_cache_tokens:
+            return AdviceContext(text, ttl)
+        try:
+            from google.generativeai import caching
+            cache = caching.CachedContent.create(model=self.name, contents=[text],
+                                                 ttl=datetime.timedelta(seconds=ttl))
+            model = self.genai.GenerativeModel.from_cached_content(cached_content=cache)
+            return AdviceContext(text, ttl, name=cache.name, model=model)
+        except Exception as e:
+            print(f"Context caching not available, sending the context inline: {type(e).__name__}: {e}")
+            return AdviceContext(text, ttl)
+
+    def generate_in_context(self, context, prompt, **kwargs):
+        if context.model is None:
+            return super().generate_in_context(context, prompt, **kwargs)
+        return context.model.generate_content(prompt, **kwargs)
+
+
+class LocalAdviceProvider(AdviceProvider):
+    """
+    A class to write deterministic advice locally, without any network.
+
+    The same prompt always gets the same answer. Latency and throughput are
+    configurable, so the advice flow can be load tested offline and
+    compared with a real provider: every call takes latency seconds (plus
+    up to jitter seconds, derived from the prompt, plus token_latency
+    seconds per 1000 input tokens that are not cached), and at most
+    concurrency calls are served at once, so throughput is about
+    concurrency / latency. Contexts are cached like Gemini context caching,
+    including its minimum size: smaller contexts are sent inline.
+    """
+
+    name = 'local'
+
+    TIPS = [
+        "Set aside a fixed share of income for savings on the day it arrives.",
+        "Review recurring payments and cancel the ones you no longer use.",
+        "Cap discretionary categories with a monthly budget and track it weekly.",
+        "Build an emergency fund covering three to six months of expenses.",
+        "Move surplus cash into a recurring deposit or an index fund SIP.",
+        "Pay card balances in full to avoid interest charges.",
+    ]
+
+    def __init__(self, latency=0.0, jitter=0.0, concurrency=None, token_latency=0.0, min_cache_tokens=0):
+        """
+        Initialize the LocalAdviceProvider.
+
+        Args:
+            latency: Seconds every call takes
+            jitter: Maximum extra seconds, fixed per prompt
+            concurrency: Maximum calls served at once (None for unlimited)
+            token_latency: Extra seconds per 1000 input tokens that are not cached
+            min_cache_tokens: Smallest context that is cached
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.min_cache_tokens = min_cache_tokens
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency else None
+
+    def generate_content(self, prompt, **kwargs):
+        return self.respond(prompt, estimate_tokens(prompt), 0)
+
+    def create_context(self, text, ttl):
+        if estimate_tokens(text) < self.min_cache_tokens:
+            return AdviceContext(text, ttl)
+        self.wait(self.token_latency * estimate_tokens(text) / 1000)
+        return AdviceContext(text, ttl, name=f"local/{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}")
+
+    def generate_in_context(self, context, prompt, **kwargs):
+        if not context.cached:
+            return super().generate_in_context(context, prompt, **kwargs)
+        return self.respond(f"{context.text}\n\n{prompt}", estimate_tokens(prompt), estimate_tokens(context.text))
+
+    def respond(self, prompt, prompt_tokens, cached_tokens):
+        """Answer a prompt after the configured delay"""
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        self.wait(self.latency + self.jitter * digest[0] / 255 + self.token_latency * prompt_tokens / 1000)
+
+        text = self.write_advice(prompt, digest)
+        # Like Gemini, the prompt count includes the cached tokens
+        usage = AdviceUsage(prompt_tokens + cached_tokens, cached_tokens, estimate_tokens(text))
+        return AdviceResponse(text, usage)
+
+    def wait(self, delay):
+        """Sleep for delay seconds in one of the serving slots"""
+        if self.slots is not None:
+            with self.slots:
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+
+    def write_advice(self, prompt, digest):
+        """Write advice from the amounts and topic found in the prompt"""
+        topic = re.search(r'specifically on (.+?)\s*\n', prompt)
+        heading = f"## {topic.group(1).strip()}" if topic else "## Spending Review"
+
+        # Category lines of the summary, e.g. '* FOOD: ₹1234.56 (12.3%)' or '- FOOD: ₹1234.56'
+        categories = re.findall(r'[*-]\s*([A-Z_]+):\s*₹([\d,]+\.\d{2})', prompt)
+        lines = [heading]
+        for category, amount in categories[:3]:
+            lines.append(f"* Your {category} spending of ₹{amount} is one of your largest; "
+                         f"set a monthly limit for it.")
+        for index in range(3):
+            lines.append(f"* {self.TIPS[(digest[1] + index) % len(self.TIPS)]}")
+        return "\n".join(lines)
+
+
+def create_advice_provider():
+    """
+    Create the advice provider configured in the environment.
+
+    ADVICE_PROVIDER selects 'gemini' (the default, needs GOOGLE_API_KEY) or
+    'local'. The local provider reads LOCAL_ADVICE_LATENCY, LOCAL_ADVICE_JITTER,
+    LOCAL_ADVICE_CONCURRENCY, LOCAL_ADVICE_TOKEN_LATENCY and
+    LOCAL_ADVICE_MIN_CACHE_TOKENS; Gemini reads GEMINI_MODEL and
+    GEMINI_MIN_CACHE_TOKENS.
+
+    Returns:
+        The provider, or None if the configured one is not available
+    """
+    provider = os.getenv('ADVICE_PROVIDER', 'gemini').lower()
+    if provider == 'local':
+        concurrency = os.getenv('LOCAL_ADVICE_CONCURRENCY')
+        return LocalAdviceProvider(latency=float(os.getenv('LOCAL_ADVICE_LATENCY', '0')),
+                                   jitter=float(os.getenv('LOCAL_ADVICE_JITTER', '0')),
+                                   concurrency=int(concurrency) if concurrency else None,
+                                   token_latency=float(os.getenv('LOCAL_ADVICE_TOKEN_LATENCY', '0')),
+                                   min_cache_tokens=int(os.getenv('LOCAL_ADVICE_MIN_CACHE_TOKENS', '0')))
+    if provider == 'gemini':
+        api_key = os.getenv('GOOGLE_API_KEY')
+        min_cache_tokens = os.getenv('GEMINI_MIN_CACHE_TOKENS')
+        return GeminiProvider(api_key, os.getenv('GEMINI_MODEL', 'gemini-2.0-flash'),
+                              int(min_cache_tokens) if min_cache_tokens else None) if api_key else None
+
+    print(f"Unknown advice provider: {provider}")
+    return None
+
+
+_advice_model = None
+_advice_model_lock = threading.Lock()
+
+
+def get_advice_model():
+    """
+    Return the process-wide advice model: the configured provider behind
+    request coalescing, or None if no provider is available.
+
+    Streamlit re-executes the app script on every interaction, so the model
+    lives in this module, which is imported once per server process.
+    """
+    global _advice_model
+    with _advice_model_lock:
+        if _advice_model is None:
+            provider = create_advice_provider()
+            if provider is not None:
+                _advice_model = CoalescingModel(provider, name=provider.name)
+        return _advice_model
@@ -0,0 +1,243 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from file_lock import FileLock
+from statement_cleaning import to_rupees, format_rupees
+
+
+class CategoryAnomalyDetector:
+    """
+    A class to flag unusual withdrawals by comparing each amount with the
+    running statistics of its category.
+
+    Statistics are kept per user and category as Welford accumulators
+    (count, mean, M2) over log amounts, so each new statement is merged in
+    once without rescanning earlier statements.
+    """
+
+    def __init__(self, stats_file='category_stats.json', threshold=3.0, min_history=5):
+        """
+        Initialize the CategoryAnomalyDetector.
+
+        Args:
+            stats_file: Path to the JSON file holding the running statistics
+            threshold: Score (standard deviations above the mean) that marks an anomaly
+            min_history: Minimum withdrawals seen in a category before it is scored
+        """
+        self.stats_file = stats_file
+        self.threshold = threshold
+        self.min_history = min_history
+
+        # Statements can be ingested concurrently by background workers and the batch CLI
+        self.lock = FileLock(self.stats_file)
+
+        if not os.path.exists(self.stats_file):
+            with open(self.stats_file, 'w') as f:
+                json.dump({}, f)
+
+    def load_stats(self):
+        """Load the running statistics for all users"""
+        try:
+            with open(self.stats_file, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_stats(self, stats):
+        """Save the running statistics for all users"""
+        temp_file = f"{self.stats_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(stats, f, indent=4)
+        os.replace(temp_file, self.stats_file)
+
+    def update(self, username, df, statement_id):
+        """
+        Merge the withdrawals of one statement into the user's running statistics.
+
+        Args:
+            username: Owner of the statement
+            df: Categorized DataFrame with 'Category' and 'Withdrawl' columns
+            statement_id: Identifier of the statement, so it is only counted once
+
+        Returns:
+            Dictionary of updated per-category statistics for the user
+        """
+        batch = self._batch_stats(df)
+
+        with self.lock:
+            return self._add_batch(self.load_stats(), username, batch, statement_id)
+
+    def move(self, username, old_df, new_df, statement_id):
+        """
+        Replace rows of a counted statement in the running statistics, such as rows whose category was corrected.
+
+        Args:
+            username: Owner of the statement
+            old_df: The rows as they were counted
+            new_df: The same rows now
+            statement_id: Identifier of the statement
+
+        Returns:
+            True if the statistics changed, False if the statement was never counted
+        """
+        removed = self._batch_stats(old_df)
+        added = self._batch_stats(new_df)
+
+        with self.lock:
+            stats = self.load_stats()
+            user_stats = stats.get(username)
+            if user_stats is None or statement_id not in user_stats['statements']:
+                return False
+
+            categories = user_stats['categories']
+            for category, row in removed.iterrows():
+                if category in categories:
+                    remaining = self._unmerge(categories[category], row)
+                    if remaining is None:
+                        del categories[category]
+                    else:
+                        categories[category] = remaining
+            for category, row in added.iterrows():
+                current = categories.get(category, {'count': 0, 'mean': 0.0, 'm2': 0.0})
+                categories[category] = self._merge(current, row)
+
+            self.save_stats(stats)
+            return True
+
+    def score(self, username, df):
+        """
+        Score every withdrawal against the user's running category statistics.
+
+        Args:
+            username: Owner of the statement
+            df: Categorized DataFrame with 'Category' and 'Withdrawl' columns
+
+        Returns:
+            Copy of df with an added 'AnomalyScore' column (0 for deposits and
+            categories without enough history)
+        """
+        return self._score(df, self.load_stats().get(username, {}).get('categories', {}))
+
+    def score_and_update(self, username, df, statement_id):
+        """
+        Score a newly ingested statement against the user's history, then merge it in.
+
+        Scoring comes first: statistics that already include a withdrawal
+        are pulled towards it, so on a short history an outlier could never
+        reach the threshold. Both steps run under one lock, so concurrent
+        ingests never score against statistics that miss each other.
+        """
+        batch = self._batch_stats(df)
+        with self.lock:
+            stats = self.load_stats()
+            scored_df = self._score(df, stats.get(username, {}).get('categories', {}))
+            self._add_batch(stats, username, batch, statement_id)
+        return scored_df
+
+    def _score(self, df, categories):
+        """Score every withdrawal of df against one user's category statistics"""
+        result_df = df.copy()
+        if not categories or 'Category' not in df.columns or 'Withdrawl' not in df.columns:
+            result_df['AnomalyScore'] = 0.0
+            return result_df
+
+        table = pd.DataFrame.from_dict(categories, orient='index')
+        std = np.sqrt(table['m2'] / (table['count'] - 1).clip(lower=1))
+        enough = (table['count'] >= self.min_history) & (std > 0)
+
+        mean = df['Category'].map(table['mean'][enough]).to_numpy(dtype=float)
+        std = df['Category'].map(std[enough]).to_numpy(dtype=float)
+
+        log_amount = self._log_withdrawals(df)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = (log_amount - mean) / std
+        result_df['AnomalyScore'] = np.nan_to_num(scores, nan=0.0, posinf=0.0, neginf=0.0).round(2)
+        return result_df
+
+    def _add_batch(self, stats, username, batch, statement_id):
+        """Merge one statement's batch statistics into stats and save them; the lock must be held"""
+        user_stats = stats.setdefault(username, {'statements': [], 'categories': {}})
+        if statement_id in user_stats['statements']:
+            return user_stats['categories']
+
+        for category, row in batch.iterrows():
+            current = user_stats['categories'].get(category, {'count': 0, 'mean': 0.0, 'm2': 0.0})
+            user_stats['categories'][category] = self._merge(current, row)
+
+        user_stats['statements'].append(statement_id)
+        self.save_stats(stats)
+        return user_stats['categories']
+
+    def flagged(self, df):
+        """Return the withdrawals whose score exceeds the threshold, most unusual first"""
+        if df is None or 'AnomalyScore' not in df.columns:
+            return pd.DataFrame()
+        return df[df['AnomalyScore'] > self.threshold].sort_values('AnomalyScore', ascending=False)
+
+    def typical_amount(self, username, category, stats=None):
+        """Return the typical (geometric mean) withdrawal for a user's category"""
+        stats = self.load_stats() if stats is None else stats
+        category_stats = stats.get(username, {}).get('categories', {}).get(category)
+        if not category_stats or category_stats['count'] == 0:
+            return None
+        return float(np.expm1(category_stats['mean']))
+
+    def format_for_summary(self, flagged, username, limit=10):
+        """Format flagged withdrawals as bullet points for text summaries"""
+        if flagged is None or flagged.empty:
+            return "* No unusual transactions detected\n"
+
+        # Statistics are read once for every flagged row
+        stats = self.load_stats()
+        lines = ""
+        for _, row in flagged.head(limit).iterrows():
+            typical = self.typical_amount(username, row['Category'], stats)
+            typical_text = f", usual {row['Category']} spend is about ₹{typical:.2f}" if typical else ""
+            lines += (f"* {row.get('Date', '')}: {format_rupees(row['Withdrawl'])} on \"{row.get('Particulars', '')}\" "
+                      f"({row['Category']}, {row['AnomalyScore']:.1f} std devs above normal{typical_text})\n")
+        return lines
+
+    def _log_withdrawals(self, df):
+        """Return log(1 + rupees) for withdrawals, NaN for everything else"""
+        amounts = to_rupees(df['Withdrawl']).to_numpy()
+        amounts = np.where(amounts > 0, amounts, np.nan)
+        return np.log1p(amounts)
+
+    def _batch_stats(self, df):
+        """Compute count, mean and M2 of log withdrawals per category for one batch"""
+        if 'Category' not in df.columns or 'Withdrawl' not in df.columns:
+            return pd.DataFrame(columns=['count', 'mean', 'm2'])
+
+        values = pd.DataFrame({'Category': df['Category'].to_numpy(),
+                               'LogAmount': self._log_withdrawals(df)}).dropna()
+        grouped = values.groupby('Category')['LogAmount']
+        batch = grouped.agg(['count', 'mean', 'var'])
+        batch['m2'] = batch['var'].fillna(0.0) * (batch['count'] - 1)
+        return batch[['count', 'mean', 'm2']]
+
+    def _merge(self, current, batch):
+        """Combine two Welford accumulators (Chan et al. parallel update)"""
+        count_a, mean_a, m2_a = current['count'], current['mean'], current['m2']
+        count_b, mean_b, m2_b = int(batch['count']), float(batch['mean']), float(batch['m2'])
+
+        count = count_a + count_b
+        delta = mean_b - mean_a
+        mean = mean_a + delta * count_b / count
+        m2 = m2_a + m2_b + delta * delta * count_a * count_b / count
+        return {'count': count, 'mean': mean, 'm2': m2}
+
+    def _unmerge(self, total, batch):
+        """Remove a batch from a Welford accumulator that includes it; None if nothing is left"""
+        count, mean, m2 = total['count'], total['mean'], total['m2']
+        count_b, mean_b, m2_b = int(batch['count']), float(batch['mean']), float(batch['m2'])
+
+        count_a = count - count_b
+        if count_a <= 0:
+            return None
+        mean_a = (count * mean - count_b * mean_b) / count_a
+        delta = mean_b - mean_a
+        m2_a = m2 - m2_b - delta * delta * count_a * count_b / count
+        # Rounding can leave a tiny negative sum of squares
+        return {'count': count_a, 'mean': mean_a, 'm2': max(m2_a, 0.0)}
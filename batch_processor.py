@@ -0,0 +1,311 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statement_pipeline import StatementPipeline, register_statement
+
+# Pipeline of the current worker process, created once by _init_worker
+_worker_pipeline = None
+
+
+def _init_worker(base_dir):
+    """Create the pipeline of a worker process, so models are loaded once per worker"""
+    global _worker_pipeline
+    # Workers would each keep their own copy of the shadow statistics and overwrite the file
+    _worker_pipeline = StatementPipeline(base_dir, shadow=False)
+
+
+def _process_statement(pdf_path, password, username):
+    """
+    Extract, categorize and validate one statement in a worker process.
+
+    Returns:
+        Dictionary with the processed DataFrame (or the error) and timings
+    """
+    pages = {'count': 0}
+
+    def on_page(page_num, page_count, rows_found):
+        pages['count'] = page_count
+
+    start = time.perf_counter()
+    try:
+        df, validation = _worker_pipeline.process(pdf_path, password, page_callback=on_page,
+                                                   username=username)
+        error = None if df is not None else "No tables found in the PDF or extraction failed."
+    except Exception as e:
+        traceback.print_exc()
+        df, validation, error = None, None, f"{type(e).__name__}: {e}"
+    return {'df': df, 'validation': validation, 'error': error,
+            'pages': pages['count'], 'seconds': time.perf_counter() - start}
+
+
+class BatchStatementProcessor:
+    """
+    A class to back-process archived statements from the command line.
+
+    Statements are extracted, categorized and validated on a pool of worker
+    processes. Anomaly scoring and persistence stay in the main process, so
+    the user's running statistics are only ever written by one process.
+
+    Progress is kept in a JSON state file keyed by the content hash of each
+    PDF: statements already processed are skipped, even under another file
+    name, and an interrupted run resumes where it stopped.
+    """
+
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, username, password=None, workers=None, state_file='batch_state.json',
+                 retry_failed=False, base_dir=None, metadata_file='pdf_metadata.json'):
+        """
+        Initialize the BatchStatementProcessor.
+
+        Args:
+            username: Owner of the statements, whose category history they update
+            password: Password for protected PDFs
+            workers: Number of worker processes (default: CPU count); 1 processes in this process
+            state_file: Path to the JSON state file used to skip and resume
+            retry_failed: Whether statements that failed in an earlier run are tried again
+            base_dir: Directory holding the model files (default: this file's directory)
+            metadata_file: JSON file listing uploaded statements, to which processed
+                statements are added so the app and the jobs see them
+        """
+        self.username = username
+        self.password = password
+        self.workers = workers or os.cpu_count() or 1
+        self.state_file = state_file
+        self.retry_failed = retry_failed
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+        self.metadata_file = metadata_file
+
+        # Created before the workers start, so they find the vault key and statistics file
+        self.pipeline = StatementPipeline(self.base_dir)
+
+    def load_state(self):
+        """Load the state file"""
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_state(self, state):
+        """Write the state file atomically, so an interrupted run never leaves a partial file"""
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(state, f, indent=4)
+        os.replace(temp_file, self.state_file)
+
+    def find_statements(self, inputs):
+        """
+        Expand directories (searched recursively) and glob patterns to PDF paths.
+
+        Returns:
+            Sorted list of unique absolute paths
+        """
+        paths = set()
+        for item in inputs:
+            if os.path.isdir(item):
+                matches = glob.glob(os.path.join(item, '**', '*.pdf'), recursive=True)
+                matches += glob.glob(os.path.join(item, '**', '*.PDF'), recursive=True)
+            else:
+                matches = glob.glob(item, recursive=True)
+            paths.update(os.path.abspath(path) for path in matches
+                         if os.path.isfile(path) and path.lower().endswith('.pdf'))
+        return sorted(paths)
+
+    def plan(self, paths, state):
+        """
+        Decide which statements need processing.
+
+        Returns:
+            Tuple of (content hash -> path to process, number of statements skipped)
+        """
+        uploaded = self.uploaded_statements()
+        pending = {}
+        skipped = 0
+        for path in paths:
+            content_hash = self.pipeline.statement_cache.content_hash(path)
+            entry = state.get(content_hash)
+
+            done = (entry is not None and entry['status'] == self.STATUS_DONE
+                    and os.path.exists(self.pipeline.processed_path(entry['pdf_path'])))
+            # A copy of a statement the user already uploaded through the app would be listed twice
+            done = done or content_hash in uploaded
+            failed = entry is not None and entry['status'] == self.STATUS_FAILED and not self.retry_failed
+            # The same content under several names is processed once
+            if done or failed or content_hash in pending:
+                skipped += 1
+                continue
+            pending[content_hash] = path
+        return pending, skipped
+
+    def uploaded_statements(self):
+        """Return the content hashes of the user's processed statements listed in the metadata file"""
+        try:
+            with open(self.metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return set()
+        return {self.pipeline.statement_cache.content_hash(file_data['filename'])
+                for file_data in metadata.values()
+                if file_data['username'] == self.username
+                and os.path.exists(self.pipeline.processed_path(file_data['filename']))}
+
+    def run(self, inputs):
+        """
+        Process every statement found in inputs.
+
+        Args:
+            inputs: Directories or glob patterns of PDFs
+
+        Returns:
+            Dictionary report of throughput and failures
+        """
+        started = datetime.now()
+        start = time.perf_counter()
+
+        paths = self.find_statements(inputs)
+        state = self.load_state()
+        pending, skipped = self.plan(paths, state)
+        print(f"Found {len(paths)} statement(s): {len(pending)} to process, {skipped} skipped")
+
+        totals = {'processed': 0, 'failed': 0, 'rows': 0, 'pages': 0, 'worker_seconds': 0.0}
+        interrupted = False
+        try:
+            for content_hash, pdf_path, result in self.results(pending):
+                entry = self.finish(pdf_path, result)
+                state[content_hash] = entry
+                self.save_state(state)
+
+                totals['processed' if entry['status'] == self.STATUS_DONE else 'failed'] += 1
+                totals['rows'] += entry['rows']
+                totals['pages'] += entry['pages']
+                totals['worker_seconds'] += entry['seconds']
+                done = totals['processed'] + totals['failed']
+                print(f"[{done}/{len(pending)}] {entry['status']}: {pdf_path}"
+                      + (f" ({entry['error']})" if entry['error'] else ""))
+        except KeyboardInterrupt:
+            interrupted = True
+            print("\nInterrupted; run again with the same state file to resume")
+
+        seconds = time.perf_counter() - start
+        finished_hashes = [content_hash for content_hash in pending if content_hash in state]
+        return {
+            'started': started.strftime("%Y-%m-%d %H:%M:%S"),
+            'finished': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'interrupted': interrupted,
+            'workers': self.workers,
+            'seconds': seconds,
+            'statements_found': len(paths),
+            'statements_skipped': skipped,
+            'statements_processed': totals['processed'],
+            'statements_failed': totals['failed'],
+            'statements_remaining': len(pending) - totals['processed'] - totals['failed'],
+            'rows': totals['rows'],
+            'pages': totals['pages'],
+            'statements_per_second': (totals['processed'] + totals['failed']) / seconds if seconds else 0.0,
+            'rows_per_second': totals['rows'] / seconds if seconds else 0.0,
+            'pages_per_second': totals['pages'] / seconds if seconds else 0.0,
+            'worker_seconds': totals['worker_seconds'],
+            'failures': [{'pdf_path': state[h]['pdf_path'], 'error': state[h]['error']}
+                         for h in finished_hashes if state[h]['status'] == self.STATUS_FAILED],
+            'balance_breaks': [{'pdf_path': state[h]['pdf_path'], 'breaks': state[h]['balance_breaks']}
+                               for h in finished_hashes if state[h].get('balance_breaks')],
+        }
+
+    def results(self, pending):
+        """Yield (content hash, path, worker result) as statements finish, in completion order"""
+        if self.workers == 1:
+            _init_worker(self.base_dir)
+            for content_hash, pdf_path in pending.items():
+                yield content_hash, pdf_path, _process_statement(pdf_path, self.password, self.username)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.base_dir,)) as executor:
+            futures = {executor.submit(_process_statement, pdf_path, self.password, self.username): (content_hash, pdf_path)
+                       for content_hash, pdf_path in pending.items()}
+            try:
+                for future in as_completed(futures):
+                    content_hash, pdf_path = futures[future]
+                    yield content_hash, pdf_path, future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def finish(self, pdf_path, result):
+        """Score and save a processed statement in this process, returning its state entry"""
+        entry = {
+            'pdf_path': pdf_path,
+            'status': self.STATUS_FAILED,
+            'rows': 0,
+            'pages': result['pages'],
+            'seconds': result['seconds'],
+            'balance_breaks': 0,
+            'error': result['error'],
+            'processed': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if result['df'] is None:
+            return entry
+
+        try:
+            df = self.pipeline.record(self.username, result['df'], result['validation'], pdf_path)
+            register_statement(self.username, pdf_path, os.path.basename(pdf_path), self.metadata_file)
+        except Exception as e:
+            traceback.print_exc()
+            entry['error'] = f"{type(e).__name__}: {e}"
+            return entry
+
+        entry.update(status=self.STATUS_DONE, rows=len(df), balance_breaks=result['validation']['breaks'])
+        return entry
+
+
+def print_report(report):
+    print(f"\nProcessed {report['statements_processed']} statement(s), "
+          f"{report['statements_failed']} failed, {report['statements_skipped']} skipped, "
+          f"{report['statements_remaining']} remaining")
+    print(f"{report['rows']} rows from {report['pages']} pages in {report['seconds']:.1f}s with "
+          f"{report['workers']} worker(s): {report['statements_per_second']:.2f} statements/s, "
+          f"{report['rows_per_second']:.0f} rows/s")
+    for failure in report['failures']:
+        print(f"Failed: {failure['pdf_path']}: {failure['error']}")
+    for item in report['balance_breaks']:
+        print(f"Does not reconcile: {item['pdf_path']} ({item['breaks']} row(s))")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract, categorize and save statement PDFs in bulk")
+    parser.add_argument('inputs', nargs='+', help="Directories (searched recursively) or glob patterns of PDFs")
+    parser.add_argument('--username', required=True, help="Owner of the statements")
+    parser.add_argument('--password', default=os.getenv('STATEMENT_PASSWORD'),
+                        help="Password for protected PDFs (default: $STATEMENT_PASSWORD)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--state', default='batch_state.json', help="State file used to skip and resume")
+    parser.add_argument('--report', default='batch_report.json', help="Write the summary report to this JSON file")
+    parser.add_argument('--retry-failed', action='store_true', help="Try statements that failed before again")
+    parser.add_argument('--metadata', default='pdf_metadata.json',
+                        help="JSON file listing uploaded statements, to which processed statements are added")
+    args = parser.parse_args()
+
+    processor = BatchStatementProcessor(args.username, args.password, args.workers, args.state, args.retry_failed,
+                                        metadata_file=args.metadata)
+    report = processor.run(args.inputs)
+    print_report(report)
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nReport written to {args.report}")
+
+    if report['interrupted'] or report['statements_failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
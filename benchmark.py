@@ -0,0 +1,344 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+import threading
+from datetime import datetime
+from synthetic_statements import SyntheticStatementGenerator
+from statement_parsers import extract_statement_table
+from statement_pipeline import StatementPipeline
+from recurring_detector import RecurringPaymentDetector
+from statement_summary import StatementSummarizer
+from statement_cleaning import clean_statement, parse_dates, CATEGORICAL_COLUMNS
+from request_coalescing import SingleFlight, CoalescingModel
+
+BENCHMARK_VERSION = 1
+
+# Metric name -> (unit, whether a higher value is better)
+METRICS = {
+    'extract_text_layer_pages_per_second': ('pages/s', True),
+    'extract_table_detection_pages_per_second': ('pages/s', True),
+    'ingest_seconds': ('s', False),
+    'categorize_per_row_rows_per_second': ('rows/s', True),
+    'categorize_batch_rows_per_second': ('rows/s', True),
+    'categorize_batch_mismatches': ('rows', False),
+    'load_seconds': ('s', False),
+    'drilldown_rows_seconds': ('s', False),
+    'drilldown_cube_seconds': ('s', False),
+    'statement_memory_mb_per_100k_rows': ('MB', False),
+    'statement_memory_saved_mb_per_100k_rows': ('MB', True),
+    'gemini_summary_seconds': ('s', False),
+    'category_summary_seconds': ('s', False),
+    'advice_upstream_calls': ('calls', False),
+    'advice_max_outstanding_calls': ('calls', False),
+    'advice_concurrent_seconds': ('s', False),
+}
+
+# Counts that must never get worse, whatever the tolerance
+EXACT_METRICS = {'categorize_batch_mismatches', 'advice_upstream_calls', 'advice_max_outstanding_calls'}
+
+
+class StubAdviceModel:
+    """Stand-in for the Gemini model that sleeps instead of calling the API"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.outstanding = 0
+        self.max_outstanding = 0
+
+    def generate_content(self, prompt):
+        with self.lock:
+            self.calls += 1
+            self.outstanding += 1
+            self.max_outstanding = max(self.max_outstanding, self.outstanding)
+        time.sleep(self.latency)
+        with self.lock:
+            self.outstanding -= 1
+        return f"Advice for {prompt}"
+
+
+class PipelineBenchmark:
+    """
+    A class to benchmark the statement pipeline end to end on synthetic data.
+
+    Statements are generated in the IndusInd layout, so the benchmark runs
+    fully offline and gives the same input on every machine. All files the
+    pipeline writes (processed CSVs, vault, statistics) go to a temporary
+    directory.
+    """
+
+    def __init__(self, pages=10, rows=20000, per_row_rows=2000, repeat=3, seed=0, sessions=64):
+        """
+        Initialize the PipelineBenchmark.
+
+        Args:
+            pages: Pages of the synthetic PDF used for extraction
+            rows: Transactions used for categorization, storage and summaries
+            per_row_rows: Transactions used for the slower per-row categorization path
+            repeat: Runs per measurement; the median is reported
+            seed: Seed of the synthetic statements
+            sessions: Concurrent sessions requesting advice through the coalescing layer
+        """
+        self.pages = pages
+        self.rows = rows
+        self.per_row_rows = per_row_rows
+        self.repeat = repeat
+        self.seed = seed
+        self.sessions = sessions
+        self.generator = SyntheticStatementGenerator(seed=seed)
+
+    def params(self):
+        return {'pages': self.pages, 'rows': self.rows, 'per_row_rows': self.per_row_rows,
+                'repeat': self.repeat, 'seed': self.seed, 'sessions': self.sessions}
+
+    def run(self):
+        """
+        Run every benchmark.
+
+        Returns:
+            Dictionary of results, ready to be saved as a baseline
+        """
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        results = {}
+        cwd = os.getcwd()
+
+        with tempfile.TemporaryDirectory(prefix='statement_benchmark_') as work_dir:
+            # The pipeline keeps its state files in the working directory
+            os.chdir(work_dir)
+            try:
+                pipeline = StatementPipeline(base_dir)
+                summarizer = StatementSummarizer(RecurringPaymentDetector(pipeline.categorizer),
+                                                 pipeline.anomaly_detector)
+
+                pdf_path = os.path.join(work_dir, 'statement.pdf')
+                self.generator.write_statement(pdf_path, self.pages)
+                print(f"Generated a {self.pages}-page statement")
+
+                results.update(self.bench_extraction(pdf_path))
+                results.update(self.bench_ingest(pipeline, pdf_path))
+
+                transactions = self.generator.generate_transactions(self.rows)
+                print(f"Generated {len(transactions)} transactions")
+                results.update(self.bench_categorization(pipeline, transactions))
+
+                # Storage and summaries work on the pipeline's paise representation
+                categorized_df = pipeline.categorize(clean_statement(transactions))
+                results.update(self.bench_storage(pipeline, categorized_df, os.path.join(work_dir, 'large.pdf')))
+                results.update(self.bench_drilldown(pipeline, categorized_df))
+                results.update(self.bench_memory(categorized_df))
+                results.update(self.bench_summaries(summarizer, categorized_df))
+                results.update(self.bench_advice_coalescing())
+            finally:
+                os.chdir(cwd)
+
+        return {
+            'version': BENCHMARK_VERSION,
+            'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'params': self.params(),
+            'metrics': {name: {'value': value, 'unit': METRICS[name][0]} for name, value in results.items()},
+        }
+
+    def bench_extraction(self, pdf_path):
+        """Pages per second of the text-layer fast path and of per-page table detection"""
+        text_layer = self.measure(lambda: extract_statement_table(pdf_path, fast=True))
+        table_detection = self.measure(lambda: extract_statement_table(pdf_path, fast=False))
+        return {
+            'extract_text_layer_pages_per_second': self.pages / text_layer,
+            'extract_table_detection_pages_per_second': self.pages / table_detection,
+        }
+
+    def bench_ingest(self, pipeline, pdf_path):
+        """Seconds to extract, categorize, score and save one statement"""
+        # Only the first ingest parses the PDF; later ones would read the vault
+        start = time.perf_counter()
+        pipeline.ingest('benchmark', pdf_path)
+        return {'ingest_seconds': time.perf_counter() - start}
+
+    def bench_categorization(self, pipeline, transactions):
+        """Rows per second of the per-row and batch paths, and rows where they disagree"""
+        categorizer = pipeline.categorizer
+        sample = transactions.head(self.per_row_rows)
+
+        per_row = self.measure(lambda: [categorizer.categorize(row) for _, row in sample.iterrows()])
+        batch = self.measure(lambda: categorizer.categorize_batch(transactions))
+
+        expected = [categorizer.categorize(row) for _, row in sample.iterrows()]
+        mismatches = int((categorizer.categorize_batch(sample) != expected).sum())
+        return {
+            'categorize_per_row_rows_per_second': len(sample) / per_row,
+            'categorize_batch_rows_per_second': len(transactions) / batch,
+            'categorize_batch_mismatches': mismatches,
+        }
+
+    def bench_storage(self, pipeline, categorized_df, pdf_path):
+        """Seconds to load a processed statement from storage"""
+        pipeline.save_dataframe(categorized_df, pdf_path)
+        return {'load_seconds': self.measure(lambda: pipeline.load_dataframe(pdf_path))}
+
+    def bench_drilldown(self, pipeline, categorized_df):
+        """
+        Seconds to answer the analysis page's drilldowns (monthly spend per
+        category and spend per payee) from the transactions and from the cube
+        """
+        def from_rows():
+            withdrawals = categorized_df[categorized_df['Withdrawl'] > 0]
+            months = parse_dates(withdrawals['Date']).dt.to_period('M')
+            withdrawals.groupby([months, withdrawals['Category'].astype(str)])['Withdrawl'].sum()
+            withdrawals.groupby(pipeline.categorizer.normalize_payees(withdrawals['Particulars']))['Withdrawl'].sum()
+
+        cube = pipeline.build_cube(categorized_df)
+
+        def from_cube():
+            pipeline.cube.query(cube, 'month', types=['Withdrawal'], by=('Period', 'Category'))
+            pipeline.cube.query(cube, 'month', types=['Withdrawal'], by=('Payee',))
+
+        return {'drilldown_rows_seconds': self.measure(from_rows), 'drilldown_cube_seconds': self.measure(from_cube)}
+
+    def bench_memory(self, categorized_df):
+        """
+        Memory of a categorized statement per 100k rows, and the memory its
+        categorical columns save compared with holding them as strings
+        """
+        as_strings = categorized_df.astype({col: 'str' for col in CATEGORICAL_COLUMNS if col in categorized_df.columns})
+        compact_bytes = categorized_df.memory_usage(deep=True).sum()
+        string_bytes = as_strings.memory_usage(deep=True).sum()
+        scale = 100000 / len(categorized_df) / (1024 * 1024)
+        return {
+            'statement_memory_mb_per_100k_rows': compact_bytes * scale,
+            'statement_memory_saved_mb_per_100k_rows': (string_bytes - compact_bytes) * scale,
+        }
+
+    def bench_summaries(self, summarizer, categorized_df):
+        """Seconds to build the Gemini and category summaries"""
+        return {
+            'gemini_summary_seconds': self.measure(lambda: summarizer.build_gemini_summary(categorized_df, 'benchmark')),
+            'category_summary_seconds': self.measure(lambda: summarizer.build_category_summary(categorized_df)),
+        }
+
+    def bench_advice_coalescing(self, prompts=5, max_concurrent=4, latency=0.2):
+        """
+        Upstream calls, peak outstanding calls and wall time when every session
+        asks for advice at once, spread over a few distinct prompts.
+        """
+        stub = StubAdviceModel(latency)
+        model = CoalescingModel(stub, name='stub', flight=SingleFlight(),
+                                semaphore=threading.BoundedSemaphore(max_concurrent))
+        barrier = threading.Barrier(self.sessions)
+
+        def session(index):
+            barrier.wait()
+            model.generate_content(f"topic {index % prompts}")
+
+        threads = [threading.Thread(target=session, args=(index,)) for index in range(self.sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'advice_upstream_calls': stub.calls,
+            'advice_max_outstanding_calls': stub.max_outstanding,
+            'advice_concurrent_seconds': time.perf_counter() - start,
+        }
+
+    def measure(self, func):
+        """Return the median wall time of func over the configured runs"""
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline.
+
+    Args:
+        results: Results of the current run
+        baseline: Results loaded from a baseline file
+        tolerance: Allowed relative slowdown before a metric counts as a regression
+
+    Returns:
+        List of (metric, baseline value, current value, change, regressed) tuples
+    """
+    rows = []
+    for name, entry in baseline['metrics'].items():
+        if name not in results['metrics'] or name not in METRICS:
+            continue
+        before = entry['value']
+        after = results['metrics'][name]['value']
+        higher_is_better = METRICS[name][1]
+
+        if name in EXACT_METRICS:
+            regressed = after > before
+        elif higher_is_better:
+            regressed = after < before * (1 - tolerance)
+        else:
+            regressed = after > before * (1 + tolerance)
+
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change, regressed))
+    return rows
+
+
+def print_results(results):
+    for name, entry in results['metrics'].items():
+        print(f"{name:45} {entry['value']:>14.4f} {entry['unit']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the statement pipeline on synthetic statements")
+    parser.add_argument('--pages', type=int, default=10, help="Pages of the synthetic PDF")
+    parser.add_argument('--rows', type=int, default=20000, help="Transactions for categorization and storage")
+    parser.add_argument('--per-row-rows', type=int, default=2000, help="Transactions for the per-row categorizer")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per measurement")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic statements")
+    parser.add_argument('--sessions', type=int, default=64, help="Concurrent sessions requesting advice")
+    parser.add_argument('--output', help="Write results to this JSON file")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write results as the baseline")
+    parser.add_argument('--compare', metavar='PATH', help="Compare with a baseline and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative slowdown before failing (default: 0.25)")
+    args = parser.parse_args()
+
+    benchmark = PipelineBenchmark(args.pages, args.rows, args.per_row_rows, args.repeat, args.seed, args.sessions)
+    results = benchmark.run()
+    print()
+    print_results(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=4)
+            print(f"\nResults written to {path}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != results['params']:
+            print(f"\nWarning: baseline was recorded with {baseline.get('params')}")
+
+        print(f"\nComparison with {args.compare} (tolerance {args.tolerance:.0%}):")
+        regressions = 0
+        for name, before, after, change, regressed in compare(results, baseline, args.tolerance):
+            regressions += regressed
+            print(f"{name:45} {before:>14.4f} -> {after:>14.4f} {change:+8.1%} {'REGRESSION' if regressed else 'ok'}")
+
+        if regressions:
+            print(f"\n{regressions} metric(s) regressed")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class DeadlineRunner:
+    """
+    A class to run slow calls (AI advice, connection probes) in the
+    background and wait for them only until a deadline.
+
+    Calls are keyed, and a finished call is kept for a while, so a result
+    that missed its deadline on one page run is shown at once on the next
+    one instead of being requested again. Failed calls are not kept.
+    """
+
+    def __init__(self, max_workers=8, keep_seconds=300):
+        """
+        Initialize the DeadlineRunner.
+
+        Args:
+            max_workers: Number of background threads
+            keep_seconds: How long a finished result stays available
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='advice')
+        self.keep_seconds = keep_seconds
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def submit(self, key, func):
+        """Start func in the background, or return the running or recent call with the same key"""
+        with self.lock:
+            self._prune()
+            entry = self.calls.get(key)
+            if entry is not None:
+                future = entry['future']
+                if not future.done() or future.exception() is None:
+                    return future
+
+            future = self.executor.submit(func)
+            entry = self.calls[key] = {'future': future, 'finished': None}
+            future.add_done_callback(lambda _: entry.update(finished=time.monotonic()))
+            return future
+
+    def wait(self, future, timeout):
+        """
+        Wait for a call until the timeout.
+
+        Returns:
+            Tuple of (whether the call finished, its result); exceptions of
+            the call are raised
+        """
+        try:
+            return True, future.result(timeout=max(0.0, timeout))
+        except FutureTimeoutError:
+            return False, None
+
+    def _prune(self):
+        """Forget finished calls older than keep_seconds, and failed ones"""
+        now = time.monotonic()
+        for key in [key for key, entry in self.calls.items()
+                    if entry['finished'] is not None
+                    and (now - entry['finished'] > self.keep_seconds or entry['future'].exception() is not None)]:
+            del self.calls[key]
+
+
+# Seconds a page waits for AI output before settling on the local analysis
+ADVICE_DEADLINE_SECONDS = float(os.getenv('ADVICE_DEADLINE_SECONDS', '8'))
+
+# Process-wide runner, so background calls outlive the page run that started them
+advice_runner = DeadlineRunner()
@@ -0,0 +1,107 @@
+import os
+import json
+import pandas as pd
+
+# Bump whenever the stored columns or their meaning change; older files are ignored
+FEATURE_SCHEMA_VERSION = 1
+
+# Stored feature columns and their compact on-disk dtypes
+FEATURE_COLUMNS = {
+    'TransactionType': 'category',
+    'PayeeKey': 'category',
+    'HasPayee': 'int8',
+    'TransactionAmount': 'float64',
+    'HasShoppingKeyword': 'bool',
+    'HasEntertainmentKeyword': 'bool',
+    'HasTravelKeyword': 'bool',
+    'HasTelecomKeyword': 'bool',
+    'DayOfWeek': 'int8',
+    'IsWeekend': 'int8',
+    'Month': 'int8',
+    'IsRoundAmount': 'int8',
+    'is_small_upi_no_payee': 'int8',
+    'is_upi_with_payee': 'int8',
+    'is_large_amount': 'int8',
+}
+
+# Parquet file metadata key holding the schema version
+SCHEMA_METADATA_KEY = b'feature_schema_version'
+
+
+class FeatureStore:
+    """
+    A class to keep the categorizer features of every processed statement,
+    so a new model can re-score history without extracting anything again.
+
+    Features are stored per statement as a Parquet file next to the PDF,
+    one row per transaction in the order of the processed statement, with
+    small integer and dictionary-encoded columns. The schema version is
+    written into the file metadata; files of another version are treated
+    as missing. Parquet support needs pyarrow; without it nothing is stored.
+    """
+
+    def __init__(self):
+        try:
+            import pyarrow  # noqa: F401
+            self.available = True
+        except ImportError:
+            print("pyarrow is not installed; categorizer features will not be stored")
+            self.available = False
+
+    def feature_path(self, pdf_path):
+        """Return the path of the feature file for a statement"""
+        return pdf_path + ".features.parquet"
+
+    def save(self, pdf_path, features):
+        """
+        Store the features of a statement.
+
+        Args:
+            pdf_path: Path of the uploaded PDF
+            features: DataFrame from TransactionCategorizer.extract_features_batch
+                with an added 'PayeeKey' column
+
+        Returns:
+            Path of the feature file, or None if features cannot be stored
+        """
+        if not self.available:
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        compact = pd.DataFrame({col: features[col].astype(dtype) for col, dtype in FEATURE_COLUMNS.items()})
+        table = pa.Table.from_pandas(compact.reset_index(drop=True), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               SCHEMA_METADATA_KEY: json.dumps(FEATURE_SCHEMA_VERSION).encode()})
+
+        path = self.feature_path(pdf_path)
+        temp_file = f"{path}.tmp"
+        pq.write_table(table, temp_file, compression='zstd')
+        os.replace(temp_file, path)
+        return path
+
+    def load(self, pdf_path):
+        """
+        Load the features of a statement.
+
+        Returns:
+            DataFrame with the dtypes extract_features_batch produces, or None
+            if the statement has no feature file of the current schema version
+        """
+        path = self.feature_path(pdf_path)
+        if not self.available or not os.path.exists(path):
+            return None
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        version = (table.schema.metadata or {}).get(SCHEMA_METADATA_KEY)
+        if version is None or json.loads(version) != FEATURE_SCHEMA_VERSION:
+            return None
+
+        features = table.to_pandas()
+        for col, dtype in FEATURE_COLUMNS.items():
+            if dtype == 'category':
+                features[col] = features[col].astype(object)
+            elif dtype == 'int8':
+                features[col] = features[col].astype(int)
+        return features
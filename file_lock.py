@@ -0,0 +1,62 @@
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    """
+    A class to serialize load-modify-save cycles of a shared state file
+    across threads and processes.
+
+    The app server and the batch CLI update the same JSON files, and each
+    replaces the whole file, so a thread lock alone lets one process
+    silently overwrite the other's update. Entering the lock takes a thread
+    lock and then an exclusive flock on a '<file>.lock' sidecar file.
+    Without fcntl (on Windows) only threads are serialized. The lock is not
+    re-entrant.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the FileLock.
+
+        Args:
+            path: Path of the state file the lock guards
+        """
+        self.lock_file = f"{path}.lock"
+        self.lock = threading.Lock()
+        self.handle = None
+
+    def __getstate__(self):
+        # Locks and open files cannot be sent to worker processes
+        return {'lock_file': self.lock_file}
+
+    def __setstate__(self, state):
+        self.lock_file = state['lock_file']
+        self.lock = threading.Lock()
+        self.handle = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if fcntl is not None:
+            try:
+                self.handle = open(self.lock_file, 'a')
+                fcntl.flock(self.handle, fcntl.LOCK_EX)
+            except Exception:
+                if self.handle is not None:
+                    self.handle.close()
+                    self.handle = None
+                self.lock.release()
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.lock.release()
+        return False
@@ -0,0 +1,283 @@
+import os
+import time
+import threading
+from instrumentation import metrics
+from advice_providers import estimate_tokens
+
+# Seconds the provider keeps a shared context of a statement summary
+ADVICE_CONTEXT_TTL = int(os.getenv('ADVICE_CONTEXT_TTL', '900'))
+
+
+class AdviceContextRegistry:
+    """
+    A class to keep the shared contexts of statement summaries, so every
+    topic asked about a statement refers to one context instead of sending
+    the summary again.
+
+    Contexts are kept per model and summary text until shortly before the
+    provider drops them. The registry is process-wide, so reruns and
+    sessions asking about the same statement share a context. A context the
+    provider would not cache (with Gemini, one below the model's minimum
+    cacheable size, which most summaries are) is still sent with every
+    topic; the advice_contexts_inline counter shows how often that happens.
+    """
+
+    def __init__(self, ttl=ADVICE_CONTEXT_TTL, max_contexts=256):
+        """
+        Initialize the AdviceContextRegistry.
+
+        Args:
+            ttl: Seconds the provider keeps a context
+            max_contexts: Maximum contexts kept; the oldest are dropped first
+        """
+        self.ttl = ttl
+        self.max_contexts = max_contexts
+        self.lock = threading.Lock()
+        self.contexts = {}
+
+    def get(self, model, text):
+        """Return the context of text for model, creating it if needed"""
+        key = (getattr(model, 'name', ''), text)
+        with self.lock:
+            self._prune()
+            context = self.contexts.get(key)
+        if context is not None:
+            return context
+
+        # Concurrent callers are coalesced by the model, so one context is created
+        context = model.create_context(text, self.ttl)
+        metrics.count('advice_contexts_cached' if context.cached else 'advice_contexts_inline')
+        with self.lock:
+            self.contexts[key] = context
+            while len(self.contexts) > self.max_contexts:
+                del self.contexts[next(iter(self.contexts))]
+        return context
+
+    def _prune(self):
+        """Drop contexts that expire within a tenth of their lifetime"""
+        limit = time.monotonic() + self.ttl / 10
+        for key in [key for key, context in self.contexts.items() if context.expires < limit]:
+            del self.contexts[key]
+
+
+class FinancialAdvisor:
+    """
+    A class to ask an advice provider for financial advice on statement
+    summaries, without any UI.
+
+    It builds the prompts, sends them through the model (any provider,
+    usually behind request coalescing) and reads the responses, so the
+    Streamlit pages and the offline load test run the same advice flow.
+    Request errors are raised, not shown, so calls can run on background
+    threads.
+
+    Topic questions about a statement share one context holding its summary,
+    so each topic is a short follow-up rather than the whole summary again
+    when the provider caches the context. The summary always comes first,
+    so the topic prompts of a statement share it as a prefix.
+    Token counts of every call are recorded per kind of request.
+    """
+
+    PROBE_PROMPT = "Give a one-sentence financial tip."
+
+    def __init__(self, model, provider_name='', contexts=None, shared_context=True):
+        """
+        Initialize the FinancialAdvisor.
+
+        Args:
+            model: Object with a generate_content(prompt) method, or None if
+                no provider is available
+            provider_name: Name of the provider, recorded with request metrics
+            contexts: AdviceContextRegistry to use (default: the process-wide one)
+            shared_context: Whether topic questions refer to a shared context
+                of the summary instead of embedding it
+        """
+        self.model = model
+        self.provider_name = provider_name
+        self.contexts = contexts or advice_contexts
+        self.shared_context = shared_context and hasattr(model, 'create_context')
+        self.usage_lock = threading.Lock()
+        self.token_usage = {}
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def build_advice_prompt(self, transaction_summary):
+        """Build the prompt for general advice on a transaction summary"""
+        return f"""
+            You are a professional financial advisor. Based on the following detailed bank transaction analysis,
+            provide specific, actionable financial advice in bullet points.
+
+            Focus on:
+            - Spending patterns that could be optimized
+            - Savings opportunities based on the category breakdown
+            - Budget recommendations considering income and expenses
+            - Investment suggestions based on cash flow
+            - Any concerning financial behaviors visible in the data
+
+            Make your advice practical and specific to this data. Be direct and helpful.
+
+            Transaction Analysis:
+            {transaction_summary}
+
+            Provide your advice in bullet points, with clear headings for different sections.
+            """
+
+    def build_topic_prompt(self, topic, category_summary):
+        """Build the prompt for advice on one topic"""
+        return f"""
+                            As a financial advisor, provide detailed advice specifically on {topic}
+                            based on the following transaction data summary:
+
+                            {category_summary}
+
+                            Focus only on {topic} with practical, actionable points.
+                            Format your advice in bullet points with clear headings.
+                            """
+
+    def build_topic_context(self, category_summary):
+        """Build the shared context that topic questions about a statement refer to"""
+        return ("You are a professional financial advisor. The following transaction data summary "
+                "is the context for the questions that follow.\n\n"
+                f"Transaction data summary:\n{category_summary}")
+
+    def build_topic_question(self, topic):
+        """Build the short follow-up asking about one topic of the shared context"""
+        return f"""
+            Based on the transaction data summary in the context, provide detailed advice specifically on {topic}
+            Focus only on {topic} with practical, actionable points.
+            Format your advice in bullet points with clear headings.
+            """
+
+    def response_text(self, response):
+        """Extract the text of a model response, whatever format it comes in"""
+        if hasattr(response, 'text'):
+            advice_text = response.text
+            print(f"Received advice text, length: {len(advice_text)} chars")
+            return advice_text
+        elif isinstance(response, dict) and 'candidates' in response:
+            # Handle dictionary response format with candidates
+            candidates = response['candidates']
+            if candidates and len(candidates) > 0:
+                if 'content' in candidates[0] and 'parts' in candidates[0]['content']:
+                    parts = candidates[0]['content']['parts']
+                    if parts and len(parts) > 0:
+                        return parts[0]['text']
+        elif isinstance(response, dict) and 'text' in response:
+            # Direct text in dictionary format
+            return response['text']
+        elif hasattr(response, 'candidates') and len(response.candidates) > 0:
+            # Handle object with candidates attribute
+            if hasattr(response.candidates[0], 'content'):
+                return response.candidates[0].content.text
+        elif isinstance(response, str):
+            # Already a string
+            return response
+
+        # If we got here, try to convert the whole response to a string
+        try:
+            return str(response)
+        except:
+            # Last resort fallback
+            return "Unable to process the AI model response. Using fallback analysis."
+
+    def response_usage(self, response, prompt, context=None):
+        """
+        Token counts of a response, estimated from the prompt when the
+        provider does not report them.
+
+        Returns:
+            Dictionary of prompt_tokens (including cached ones), cached_tokens
+            and output_tokens
+        """
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and getattr(usage, 'prompt_token_count', 0):
+            return {
+                'prompt_tokens': int(usage.prompt_token_count),
+                'cached_tokens': int(getattr(usage, 'cached_content_token_count', 0) or 0),
+                'output_tokens': int(getattr(usage, 'candidates_token_count', 0) or 0),
+            }
+
+        prompt_tokens = estimate_tokens(prompt)
+        cached_tokens = 0
+        if context is not None:
+            if context.cached:
+                cached_tokens = estimate_tokens(context.text)
+            prompt_tokens += estimate_tokens(context.text)
+        try:
+            output_tokens = estimate_tokens(self.response_text(response))
+        except Exception:
+            output_tokens = 0
+        return {'prompt_tokens': prompt_tokens, 'cached_tokens': cached_tokens, 'output_tokens': output_tokens}
+
+    def record_usage(self, kind, usage, seconds):
+        """Add the token counts and time of one call to the totals of its kind"""
+        with self.usage_lock:
+            totals = self.token_usage.setdefault(
+                kind, {'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'output_tokens': 0, 'seconds': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            for name, value in usage.items():
+                totals[name] += value
+        metrics.count('advice_prompt_tokens', usage['prompt_tokens'])
+        metrics.count('advice_cached_tokens', usage['cached_tokens'])
+        metrics.count('advice_output_tokens', usage['output_tokens'])
+
+    def generate(self, prompt, kind, context=None):
+        """Send one prompt to the model, referring to context if given, and return the response"""
+        if self.model is None:
+            raise RuntimeError("No advice provider is configured")
+        start = time.perf_counter()
+        with metrics.span('advice_request', kind=kind, provider=self.provider_name) as span:
+            if context is not None:
+                response = self.model.generate_in_context(context, prompt)
+            else:
+                response = self.model.generate_content(prompt)
+            usage = self.response_usage(response, prompt, context)
+            span.add(prompt_chars=len(prompt), **usage)
+        self.record_usage(kind, usage, time.perf_counter() - start)
+        return response
+
+    def request_advice(self, transaction_summary):
+        """Ask for general advice on a transaction summary"""
+        # Log what we're sending to the model for debugging
+        print(f"Sending to {self.provider_name or 'model'}: {transaction_summary[:100]}...")
+        return self.response_text(self.generate(self.build_advice_prompt(transaction_summary), 'advice'))
+
+    def request_topic_advice(self, topic, category_summary):
+        """Ask for advice on one topic, as a follow-up to the shared context of the summary"""
+        if not self.shared_context:
+            return self.response_text(self.generate(self.build_topic_prompt(topic, category_summary), 'topic'))
+
+        context = self.contexts.get(self.model, self.build_topic_context(category_summary))
+        return self.response_text(self.generate(self.build_topic_question(topic), 'topic', context=context))
+
+    def probe(self):
+        """
+        Check that the provider answers.
+
+        Returns:
+            Tuple of (whether it works, status message)
+        """
+        if self.model is None:
+            return False, "No advice provider configured"
+
+        try:
+            response = self.generate(self.PROBE_PROMPT, 'probe')
+
+            # Try to access the response in different ways
+            if hasattr(response, 'text') and response.text:
+                return True, "Connection successful"
+            elif isinstance(response, dict) and ('text' in response or 'candidates' in response):
+                return True, "Connection successful (dictionary response)"
+            else:
+                # If we got a response but can't extract text
+                return False, f"Connection working but unexpected response format: {type(response)}"
+
+        except Exception as e:
+            return False, f"Connection failed: {type(e).__name__}: {str(e)}"
+
+
+# Process-wide registry, so shared contexts outlive the page run that created them
+advice_contexts = AdviceContextRegistry()
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from statement_pipeline import StatementPipeline
+
+
+class IngestionJobQueue:
+    """
+    A class to run statement ingestion out of band on a local worker pool.
+
+    Jobs are kept in a persistent JSON job table, so their progress can be
+    polled from any page run, jobs left unfinished by a server restart are
+    picked up again, and failed jobs can be retried without re-uploading.
+    Page and row progress is kept in memory and written to the table at most
+    every progress_interval seconds; only the newest keep_finished finished
+    jobs are kept.
+    """
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    def __init__(self, pipeline, jobs_file='ingestion_jobs.json', max_workers=2, progress_interval=2.0,
+                 keep_finished=200):
+        """
+        Initialize the IngestionJobQueue and resume unfinished jobs.
+
+        Args:
+            pipeline: StatementPipeline used to process statements
+            jobs_file: Path to the JSON job table
+            max_workers: Number of worker threads
+            progress_interval: Minimum seconds between progress writes of a job
+            keep_finished: Number of done or failed jobs kept in the table
+        """
+        self.pipeline = pipeline
+        self.jobs_file = jobs_file
+        self.progress_interval = progress_interval
+        self.keep_finished = keep_finished
+        self.lock = threading.Lock()
+
+        # Latest progress of running jobs, and when it was last written to the table
+        self.progress = {}
+        self.progress_written = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingestion')
+
+        if not os.path.exists(self.jobs_file):
+            with open(self.jobs_file, 'w') as f:
+                json.dump({}, f)
+
+        # Jobs that were queued or running when the server stopped start again
+        for job_id, job in self.load_jobs().items():
+            if job['status'] in (self.STATUS_QUEUED, self.STATUS_RUNNING):
+                self.update_job(job_id, status=self.STATUS_QUEUED)
+                self.executor.submit(self.run_job, job_id)
+
+    def load_jobs(self):
+        """Load the job table"""
+        try:
+            with open(self.jobs_file, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_jobs(self, jobs):
+        """Write the job table atomically, so pollers never read a partial file"""
+        temp_file = f"{self.jobs_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(jobs, f, indent=4)
+        os.replace(temp_file, self.jobs_file)
+
+    def update_job(self, job_id, expected_status=None, **fields):
+        """
+        Update fields of a job in the job table.
+
+        Args:
+            job_id: Job to update
+            expected_status: If given, the job is only updated while it has
+                this status, so checking and changing the status is one step
+            **fields: Fields to set
+
+        Returns:
+            The updated job, or None if it does not exist or had another status
+        """
+        with self.lock:
+            jobs = self.load_jobs()
+            if job_id not in jobs:
+                return None
+            if expected_status is not None and jobs[job_id]['status'] != expected_status:
+                return None
+            jobs[job_id].update(self.progress.get(job_id, {}))
+            jobs[job_id].update(fields)
+            jobs[job_id]['updated'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if fields.get('status') in (self.STATUS_DONE, self.STATUS_FAILED):
+                self.progress.pop(job_id, None)
+                self.progress_written.pop(job_id, None)
+                self.prune(jobs, job_id)
+            self.save_jobs(jobs)
+            return jobs[job_id]
+
+    def update_progress(self, job_id, **fields):
+        """Record progress of a running job, writing it to the table at most every progress_interval seconds"""
+        with self.lock:
+            self.progress.setdefault(job_id, {}).update(fields)
+            now = time.monotonic()
+            if now - self.progress_written.get(job_id, 0.0) < self.progress_interval:
+                return
+            self.progress_written[job_id] = now
+        self.update_job(job_id)
+
+    def prune(self, jobs, finished_job_id):
+        """Drop the oldest finished jobs beyond keep_finished from a job table, keeping the one just finished"""
+        finished = [job_id for job_id, job in jobs.items()
+                    if job_id != finished_job_id and job['status'] in (self.STATUS_DONE, self.STATUS_FAILED)]
+        finished.sort(key=lambda job_id: jobs[job_id]['updated'], reverse=True)
+        for job_id in finished[max(0, self.keep_finished - 1):]:
+            del jobs[job_id]
+
+    def submit(self, username, pdf_path, original_filename, password=None):
+        """
+        Queue a statement for ingestion.
+
+        Args:
+            username: Owner of the statement
+            pdf_path: Path of the uploaded PDF
+            original_filename: Name of the file as uploaded
+            password: Password for protected PDFs, kept encrypted until the job succeeds
+
+        Returns:
+            Job ID
+        """
+        job_id = str(uuid.uuid4())
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        job = {
+            'username': username,
+            'pdf_path': pdf_path,
+            'original_filename': original_filename,
+            'status': self.STATUS_QUEUED,
+            'pages_done': 0,
+            'pages_total': 0,
+            'rows_categorized': 0,
+            'rows_total': 0,
+            'attempts': 0,
+            'error': None,
+            'password_token': self.pipeline.statement_vault.encrypt_secret(password) if password else None,
+            'created': now,
+            'updated': now,
+        }
+
+        with self.lock:
+            jobs = self.load_jobs()
+            jobs[job_id] = job
+            self.save_jobs(jobs)
+
+        self.executor.submit(self.run_job, job_id)
+        return job_id
+
+    def retry(self, job_id):
+        """Queue a failed job again; returns False if the job is not retryable"""
+        # A double click must not queue the job twice
+        job = self.update_job(job_id, expected_status=self.STATUS_FAILED, status=self.STATUS_QUEUED,
+                              error=None, pages_done=0, rows_categorized=0)
+        if job is None:
+            return False
+        self.executor.submit(self.run_job, job_id)
+        return True
+
+    def user_jobs(self, username):
+        """Return a user's jobs, newest first"""
+        jobs = {job_id: job for job_id, job in self.load_jobs().items() if job['username'] == username}
+        with self.lock:
+            # Progress not written to the table yet is newer than what the table holds
+            for job_id, progress in self.progress.items():
+                if job_id in jobs:
+                    jobs[job_id].update(progress)
+        return dict(sorted(jobs.items(), key=lambda item: item[1]['created'], reverse=True))
+
+    def run_job(self, job_id):
+        """Process one job on a worker thread, recording progress in the job table"""
+        # Only one worker can move a queued job to running, so it never runs twice
+        job = self.update_job(job_id, expected_status=self.STATUS_QUEUED, status=self.STATUS_RUNNING)
+        if job is None:
+            return
+
+        self.update_job(job_id, attempts=job['attempts'] + 1)
+        password = None
+        if job['password_token']:
+            password = self.pipeline.statement_vault.decrypt_secret(job['password_token'])
+
+        try:
+            df = self.pipeline.ingest(
+                job['username'], job['pdf_path'], password,
+                page_callback=lambda page_num, page_count, rows: self.update_progress(
+                    job_id, pages_done=page_num, pages_total=page_count),
+                row_callback=lambda rows_done, rows_total: self.update_progress(
+                    job_id, rows_categorized=rows_done, rows_total=rows_total))
+
+            if df is None:
+                self.update_job(job_id, status=self.STATUS_FAILED,
+                                error="No tables found in the PDF or extraction failed.")
+            else:
+                # The password is no longer needed once the statement is in the vault
+                validation = df.attrs.get('validation', {})
+                self.update_job(job_id, status=self.STATUS_DONE, password_token=None,
+                                rows_categorized=len(df), rows_total=len(df),
+                                balance_breaks=validation.get('breaks', 0))
+        except Exception as e:
+            traceback.print_exc()
+            self.update_job(job_id, status=self.STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Return the process-wide job queue.
+
+    Streamlit re-executes the app script on every interaction, so the queue
+    lives in this module, which is imported once per server process.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = IngestionJobQueue(StatementPipeline())
+        return _job_queue
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from functools import wraps
+
+
+class _NullSpan:
+    """Span returned while metrics are disabled; every operation is a no-op"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def add(self, **units):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed pipeline stage, with optional unit counts such as rows or pages"""
+
+    def __init__(self, metrics, stage, attrs):
+        self.metrics = metrics
+        self.stage = stage
+        self.attrs = attrs
+        self.units = {}
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        duration = time.perf_counter() - self.start
+        self.metrics.record(self.stage, duration, self.units, self.attrs, error=exc_type is not None)
+        return False
+
+    def add(self, **units):
+        """Add unit counts (e.g. rows=500, pages=1, bytes=2048) processed in this span"""
+        for unit, value in units.items():
+            self.units[unit] = self.units.get(unit, 0) + value
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+
+
+class Metrics:
+    """
+    A class to collect timings and throughput of pipeline stages.
+
+    Stages are wrapped in spans that feed per-stage histograms of latency
+    and units per second, plus a ring buffer of the most recent spans. When
+    disabled, span() hands back a shared no-op object, so instrumented code
+    costs one attribute check per call.
+    """
+
+    SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf')]
+    RATE_BUCKETS = [1, 10, 100, 1000, 10000, 100000, 1000000, 10000000, float('inf')]
+
+    def __init__(self, enabled=False, recent_size=200, log_path=None):
+        """
+        Initialize the Metrics registry.
+
+        Args:
+            enabled: Whether spans and counters are recorded
+            recent_size: Number of recent spans kept for the admin page
+            log_path: Optional file that receives one JSON line per span
+        """
+        self.enabled = enabled
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.recent = deque(maxlen=recent_size)
+
+    def span(self, stage, **attrs):
+        """Return a context manager timing one run of a stage"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, stage, attrs)
+
+    def timed(self, stage):
+        """Decorator timing every call of a function as a stage"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        """Increment a counter such as cache hits"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, stage, duration, units, attrs, error=False):
+        """Record a finished span"""
+        entry = {
+            'stage': stage,
+            'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'seconds': round(duration, 6),
+            'error': error,
+        }
+        entry.update(units)
+        entry.update(attrs)
+
+        with self.lock:
+            self._histogram(f"{stage}_seconds", self.SECONDS_BUCKETS).observe(duration)
+            for unit, value in units.items():
+                self.counters[f"{stage}_{unit}_total"] = self.counters.get(f"{stage}_{unit}_total", 0) + value
+                if duration > 0:
+                    self._histogram(f"{stage}_{unit}_per_second", self.RATE_BUCKETS).observe(value / duration)
+            if error:
+                self.counters[f"{stage}_errors_total"] = self.counters.get(f"{stage}_errors_total", 0) + 1
+            self.recent.append(entry)
+
+            if self.log_path:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def recent_spans(self, limit=None):
+        """Return the most recent spans, newest first"""
+        with self.lock:
+            spans = list(self.recent)[::-1]
+        return spans[:limit] if limit else spans
+
+    def to_prometheus(self):
+        """Export counters and histograms in the Prometheus text format"""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE app_{name} counter")
+                lines.append(f"app_{name} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE app_{name} histogram")
+                for bound, count in histogram.cumulative():
+                    label = '+Inf' if bound == float('inf') else f"{bound:g}"
+                    lines.append(f'app_{name}_bucket{{le="{label}"}} {count}')
+                lines.append(f"app_{name}_sum {histogram.total:.6f}")
+                lines.append(f"app_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        """Export counters, histogram summaries and recent spans as JSON"""
+        with self.lock:
+            payload = {
+                'counters': dict(self.counters),
+                'histograms': {name: {'count': histogram.count,
+                                      'sum': histogram.total,
+                                      'buckets': [[bound if bound != float('inf') else '+Inf', count]
+                                                  for bound, count in histogram.cumulative()]}
+                               for name, histogram in self.histograms.items()},
+                'recent': list(self.recent),
+            }
+        return json.dumps(payload, indent=2)
+
+    def reset(self):
+        """Clear all recorded metrics"""
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.recent.clear()
+
+    def _histogram(self, name, buckets):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(buckets)
+        return self.histograms[name]
+
+
+def configure_from_env():
+    """
+    Apply metrics settings from the environment to the process-wide registry.
+
+    PIPELINE_METRICS=1 enables recording, PIPELINE_METRICS_RECENT sets how
+    many recent spans are kept and PIPELINE_METRICS_LOG names a JSON-lines
+    log file.
+    """
+    metrics.enabled = os.getenv('PIPELINE_METRICS', '') == '1'
+    metrics.log_path = os.getenv('PIPELINE_METRICS_LOG') or None
+    recent_size = int(os.getenv('PIPELINE_METRICS_RECENT', '200'))
+    if recent_size != metrics.recent.maxlen:
+        with metrics.lock:
+            metrics.recent = deque(metrics.recent, maxlen=recent_size)
+
+
+# Process-wide registry shared by every instrumented module
+metrics = Metrics()
+configure_from_env()
@@ -3,29 +3,31 @@ import hashlib
 import os
 import json
 from datetime import datetime
-import uuid
-import pdfplumber
+import time
 import pandas as pd
 from io import BytesIO
 import matplotlib.pyplot as plt
 import seaborn as sns
-from transaction_categorizer import TransactionCategorizer
-import google.generativeai as genai
+from recurring_detector import RecurringPaymentDetector
+from statement_summary import StatementSummarizer
+from statement_pipeline import register_statement
+from statement_cleaning import rupee_view, to_rupees, format_rupees
+from ingestion_jobs import get_job_queue
+from instrumentation import metrics, configure_from_env
+from advice_providers import get_advice_model
+from financial_advice import FinancialAdvisor
+from deadline_advice import advice_runner, ADVICE_DEADLINE_SECONDS
 import os
 from dotenv import load_dotenv
 import base64
 from urllib.parse import urlencode
 
 load_dotenv()
+configure_from_env()
 
-# Configure Gemini AI
-GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    # Initialize the model
-    gemini_model = genai.GenerativeModel('gemini-2.0-flash')
-else:
-    gemini_model = None
+# Advice model of the provider selected by ADVICE_PROVIDER (Gemini by default);
+# identical concurrent prompts share one request
+advice_model = get_advice_model()
 
 class MobileAuthApp:
     def __init__(self):
@@ -42,11 +44,21 @@ class MobileAuthApp:
             with open(self.pdf_metadata_file, 'w') as f:
                 json.dump({}, f)
         
-        # Initialize transaction categorizer
-        model_path = os.path.join(os.path.dirname(__file__), 'transaction_categorizer_model.pkl')
-        preprocessor_path = os.path.join(os.path.dirname(__file__), 'transaction_preprocessor.pkl')
-        self.transaction_categorizer = TransactionCategorizer(model_path if os.path.exists(model_path) else None, 
-                                                            preprocessor_path if os.path.exists(preprocessor_path) else None)
+        # Background ingestion queue and the pipeline it shares with the pages
+        self.job_queue = get_job_queue()
+        self.pipeline = self.job_queue.pipeline
+        self.transaction_categorizer = self.pipeline.categorizer
+        self.anomaly_detector = self.pipeline.anomaly_detector
+        
+        # Loaded statements and their derived views survive page reruns here
+        self.statement_cache = self.pipeline.statement_cache
+        
+        # Initialize recurring payment detector
+        self.recurring_detector = RecurringPaymentDetector(self.transaction_categorizer)
+        
+        # Text summaries of a statement for the analysis page and Gemini
+        self.statement_summarizer = StatementSummarizer(self.recurring_detector, self.anomaly_detector,
+                                                        self.pipeline.merchant_sketches, self.pipeline.peer_benchmark)
         
         # Custom CSS for dark-themed mobile-like design
         self.apply_custom_css()
@@ -57,8 +69,11 @@ class MobileAuthApp:
         self.current_username = st.query_params.get("username", "")
         self.current_pdf = st.query_params.get("pdf", "")
         
-        # Check if Gemini API is available
-        if not GOOGLE_API_KEY or gemini_model is None:
+        # Prompts, requests and response handling of the AI advice
+        self.advisor = FinancialAdvisor(advice_model, advice_model.name if advice_model else '')
+        
+        # Check if an advice provider is available
+        if not self.advisor.available:
             st.warning("Financial advice features will not be available.")
     
     def apply_custom_css(self):
@@ -223,6 +238,9 @@ class MobileAuthApp:
         if login_btn:
             if username and password:
                 if self.validate_login(username, password):
+                    # The URL only names the user; admin pages also need this browser session to have logged in
+                    st.session_state['authenticated_user'] = username
+                    
                     # Set URL parameters for file_upload page
                     st.query_params.page = "file_upload"
                     st.query_params.username = username
@@ -311,138 +329,25 @@ class MobileAuthApp:
 
     def extract_category_data_for_gemini(self, df):
         """Extract category data from DataFrame in a format optimized for Gemini AI"""
-        if df is None or 'Category' not in df.columns:
-            return "No category data available."
-            
-        try:
-            # Create a detailed summary specifically formatted for Gemini
-            gemini_summary = "Transaction Analysis:\n\n"
-            
-            # 1. Basic transaction stats
-            gemini_summary += f"Total Transactions: {len(df)}\n"
-            gemini_summary += f"Date Range: {df['Date'].min()} to {df['Date'].max() if 'Date' in df.columns else 'Unknown'}\n\n"
-            
-            # 2. Category breakdown
-            gemini_summary += "## Category Distribution:\n"
-            category_counts = df['Category'].value_counts()
-            total_count = len(df)
-            for category, count in category_counts.items():
-                percentage = (count / total_count) * 100
-                gemini_summary += f"* {category}: {count} transactions ({percentage:.1f}%)\n"
-            
-            # 3. Financial summary - if withdrawal/deposit columns exist
-            if 'Withdrawl' in df.columns and 'Deposit' in df.columns:
-                # Convert to numeric if they aren't already
-                withdrawals = pd.to_numeric(df['Withdrawl'], errors='coerce').fillna(0)
-                deposits = pd.to_numeric(df['Deposit'], errors='coerce').fillna(0)
-                
-                total_expense = withdrawals.sum()
-                total_income = deposits.sum()
-                net_flow = total_income - total_expense
-                
-                gemini_summary += "\n## Financial Summary:\n"
-                gemini_summary += f"* Total Expenses: ₹{total_expense:.2f}\n"
-                gemini_summary += f"* Total Income: ₹{total_income:.2f}\n"
-                gemini_summary += f"* Net Cash Flow: ₹{net_flow:.2f} ({net_flow >= 0 and 'Positive' or 'Negative'})\n\n"
-                
-                # 4. Category-wise spending
-                gemini_summary += "## Spending by Category:\n"
-                category_expenses = df.groupby('Category')['Withdrawl'].sum().sort_values(ascending=False)
-                for category, amount in category_expenses.items():
-                    if amount > 0:  # Only include categories with expenses
-                        percent = (amount / total_expense) * 100
-                        gemini_summary += f"* {category}: ₹{amount:.2f} ({percent:.1f}% of total expenses)\n"
-                
-                # 5. Category-wise income
-                if deposits.sum() > 0:
-                    gemini_summary += "\n## Income by Category:\n"
-                    category_income = df.groupby('Category')['Deposit'].sum().sort_values(ascending=False)
-                    for category, amount in category_income.items():
-                        if amount > 0:  # Only include categories with income
-                            percent = (amount / total_income) * 100
-                            gemini_summary += f"* {category}: ₹{amount:.2f} ({percent:.1f}% of total income)\n"
-            
-            # 6. Common merchants/particulars if available
-            if 'Particulars' in df.columns:
-                gemini_summary += "\n## Common Transaction Descriptions:\n"
-                common_descriptions = df['Particulars'].value_counts().head(5)
-                for desc, count in common_descriptions.items():
-                    gemini_summary += f"* \"{desc}\": {count} transactions\n"
-            
-            return gemini_summary
-        
-        except Exception as e:
-            return f"Error generating category data for Gemini: {str(e)}"
+        return self.statement_summarizer.build_gemini_summary(df, self.current_username)
 
     def extract_table_pdfplumber(self, pdf_path, password=None):
-        """Extract tables from PDF using pdfplumber"""
-        all_data = []
-        column_names = None
-        
+        """Extract, categorize and save a statement synchronously, showing progress on the page"""
         try:
-            # Open PDF with password if provided
-            with pdfplumber.open(pdf_path, password=password) as pdf:
-                # Process each page
-                for page_num, page in enumerate(pdf.pages, 1):
-                    extracted_table = page.extract_table()
-                    
-                    if extracted_table:
-                        # For the first table with data, get column names
-                        if column_names is None and len(extracted_table) > 0:
-                            column_names = extracted_table[0]
-                            # Add data rows from first table (skip header row)
-                            all_data.extend(extracted_table[1:])
-                        else:
-                            # Check if subsequent tables have the same column structure
-                            if len(extracted_table) > 0:
-                                if extracted_table[0] == column_names:
-                                    # Same structure, skip header
-                                    all_data.extend(extracted_table[1:])
-                                else:
-                                    # Different header structure, try to map columns or add as is
-                                    all_data.extend(extracted_table)
-                                    
-                        st.write(f"Processed page {page_num}: Found {len(extracted_table)} rows")
-
-            # Create DataFrame from collected data
-            if all_data and column_names:
-                # Create DataFrame with consistent column names
-                all_data = [row[:5] + row[6:] if len(row) > 5 else row for row in all_data]
-                df = pd.DataFrame(all_data, columns=column_names)
-                
-                # Clean data - convert numeric columns
-                for col in df.columns:
-                    # Try to convert to numeric if possible
-                    try:
-                        df[col] = pd.to_numeric(df[col])
-                    except:
-                        pass  # Keep as is if conversion fails
-                
-                # Drop NaN rows that don't contain essential information
-                if 'Particulars' in df.columns:
-                    df = df.dropna(subset=['Particulars'])
-                if 'Balance' in df.columns:
-                    df = df.dropna(subset=['Balance'])
-                
-                # Categorize transactions using the TransactionCategorizer
-                try:
-                    categorized_df = self.transaction_categorizer.categorize_dataframe(df)
-                    
-                    # Convert DataFrame to a URL-safe format for passing to next page
-                    self.save_dataframe_to_disk(categorized_df, pdf_path)
-                    
-                    # Create URL parameters for the next page
-                    # Update how query parameters are set
-                    st.query_params.page = "view_dataframe"
-                    st.query_params.username = self.current_username
-                    st.query_params.pdf = pdf_path
-                    
-                    return categorized_df
-                except Exception as e:
-                    st.error(f"Error categorizing transactions: {e}")
-                    return df
-            else:
+            categorized_df = self.pipeline.ingest(
+                self.current_username, pdf_path, password,
+                page_callback=lambda page_num, page_count, rows: st.write(
+                    f"Processed page {page_num} of {page_count}: Found {rows} rows"))
+            
+            if categorized_df is None:
                 return None
+            
+            # Create URL parameters for the next page
+            st.query_params.page = "view_dataframe"
+            st.query_params.username = self.current_username
+            st.query_params.pdf = pdf_path
+            
+            return categorized_df
                 
         except Exception as e:
             st.error(f"Error extracting tables: {e}")
@@ -450,97 +355,154 @@ class MobileAuthApp:
 
     def save_dataframe_to_disk(self, df, pdf_path):
         """Save DataFrame to disk for temporary storage"""
-        # Create a temporary CSV file based on PDF path
-        csv_path = pdf_path + ".csv"
-        df.to_csv(csv_path, index=False)
-        return csv_path
+        return self.pipeline.save_dataframe(df, pdf_path)
 
     def load_dataframe_from_disk(self, pdf_path):
-        """Load DataFrame from disk"""
-        csv_path = pdf_path + ".csv"
-        if os.path.exists(csv_path):
-            return pd.read_csv(csv_path)
-        return None
+        """Load DataFrame from disk, reusing the copy loaded by an earlier rerun"""
+        return self.statement_cache.get(self.current_username, pdf_path, 'df',
+                                        lambda: self.pipeline.load_dataframe(pdf_path))
+    
+    def validation_report(self, username, pdf_path, df):
+        """Return the balance-continuity report of a loaded statement"""
+        return self.statement_cache.get(username, pdf_path, 'validation', lambda: self.pipeline.validate(df))
+    
+    def user_pdf_paths(self, username):
+        """Return the paths of every statement a user has uploaded"""
+        try:
+            with open(self.pdf_metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return []
+        return [file_data['filename'] for file_data in metadata.values() if file_data['username'] == username]
+    
+    def payee_categories(self, df):
+        """Return each payee of a statement with its most common category and transaction count"""
+        payees = pd.DataFrame({'Payee': self.transaction_categorizer.normalize_payees(df['Particulars']).to_numpy(),
+                               'Category': df['Category'].to_numpy()})
+        payees = payees[payees['Payee'] != '']
+        summary = payees.groupby('Payee')['Category'].agg(
+            Category=lambda categories: categories.mode().iloc[0], Transactions='size')
+        return summary.sort_values('Transactions', ascending=False)
+    
+    def category_correction_section(self, username, df, cached):
+        """Let the user correct the category of a payee across all of their statements"""
+        # The confirmation of a correction is carried across the rerun that shows its result
+        if 'notice' in st.query_params:
+            st.success(st.query_params['notice'])
+            del st.query_params['notice']
+        
+        with st.expander("Correct a category"):
+            payees = cached('payee_categories', lambda: self.payee_categories(df))
+            if payees.empty:
+                st.info("No payees found in this statement.")
+                return
+            
+            payee = st.selectbox("Payee", payees.index.tolist(), format_func=lambda key: (
+                f"{key} ({payees.loc[key, 'Category']}, {payees.loc[key, 'Transactions']} transaction(s))"))
+            categories = self.transaction_categorizer.categories
+            current = payees.loc[payee, 'Category']
+            category = st.selectbox("Category", categories,
+                                    index=categories.index(current) if current in categories else 0)
+            
+            overrides = self.pipeline.knowledge_base.user_overrides(username)
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Apply to all my statements"):
+                    self.pipeline.knowledge_base.set_override(username, payee, category)
+                    changed = self.pipeline.recategorize_payee(username, payee, self.user_pdf_paths(username))
+                    st.query_params.notice = f"Re-categorized {changed} transaction(s) of {payee} as {category}"
+                    st.rerun()
+            with col2:
+                if payee in overrides and st.button("Remove my correction"):
+                    self.pipeline.knowledge_base.remove_override(username, payee)
+                    changed = self.pipeline.recategorize_payee(username, payee, self.user_pdf_paths(username))
+                    st.query_params.notice = f"Re-categorized {changed} transaction(s) of {payee}"
+                    st.rerun()
+            if payee in overrides:
+                st.caption(f"You categorized {payee} as {overrides[payee]}.")
+    
+    def cube_explorer_section(self, username, pdf_path, df, cached):
+        """Let the user slice the statement by period, category, type and payee, answered from its cube"""
+        cube = cached('cube', lambda: self.pipeline.load_cube(pdf_path, df))
+        if cube is None or cube.empty:
+            st.info("No dated transactions to explore.")
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            level = st.selectbox("Group by", ['month', 'week', 'day'], format_func=str.title, key='cube_level')
+            kind = st.radio("Transactions", ['Withdrawal', 'Deposit'], horizontal=True, key='cube_type')
+        with col2:
+            first, last = cube['Day'].min().date(), cube['Day'].max().date()
+            dates = st.date_input("Date range", value=(first, last), min_value=first, max_value=last,
+                                  key='cube_dates')
+            # The range has one date while the user is still picking it
+            start, end = (dates[0], dates[-1]) if isinstance(dates, (list, tuple)) and dates else (first, last)
+            categories = st.multiselect("Categories", sorted(cube['Category'].astype(str).unique()),
+                                        key='cube_categories')
+        
+        with metrics.span('cube_query') as span:
+            selection = dict(start=start, end=end, categories=categories or None, types=[kind])
+            payees = self.pipeline.cube.query(cube, level, by=('Payee',), **selection).sort_values(
+                'Amount', ascending=False)
+            payee_options = ['All payees'] + [key for key in payees['Payee'].astype(str) if key][:50]
+            payee = st.selectbox("Payee", payee_options, key='cube_payee')
+            if payee != 'All payees':
+                selection['payees'] = [payee]
+            
+            periods = self.pipeline.cube.query(cube, level, by=('Period',), **selection)
+            by_category = self.pipeline.cube.query(cube, level, by=('Category',), **selection).sort_values(
+                'Amount', ascending=False)
+            span.add(cells=len(cube))
+        
+        if periods.empty:
+            st.info("No transactions match these filters.")
+            return
+        
+        st.write(f"{periods['Count'].sum()} transaction(s), {format_rupees(periods['Amount'].sum())}")
+        st.bar_chart(pd.Series(to_rupees(periods['Amount']).to_numpy(),
+                               index=periods['Period'].dt.strftime('%Y-%m-%d'), name='Amount'))
+        st.dataframe(pd.DataFrame({'Category': by_category['Category'].astype(str),
+                                   'Transactions': by_category['Count'],
+                                   'Amount': to_rupees(by_category['Amount'])}), hide_index=True)
+        if payee == 'All payees':
+            top_payees = payees[payees['Payee'].astype(str) != ''].head(10)
+            st.dataframe(pd.DataFrame({'Payee': top_payees['Payee'].astype(str),
+                                       'Transactions': top_payees['Count'],
+                                       'Amount': to_rupees(top_payees['Amount'])}), hide_index=True)
+    
+    def render_bar_chart(self, series):
+        """Render a bar chart of a Series to PNG bytes"""
+        fig, ax = plt.subplots(figsize=(10, 6))
+        # A categorical index would be drawn in category order, not in the order of the series
+        sns.barplot(x=series.index.astype(str), y=series.values, ax=ax)
+        plt.xticks(rotation=45, ha='right')
+        plt.tight_layout()
+        output = BytesIO()
+        fig.savefig(output, format='png')
+        plt.close(fig)
+        return output.getvalue()
+    
+    def build_search_index(self, df):
+        """Join each row's cells into one lowercase string, so a search is one column scan"""
+        text = df.astype(str).fillna('')
+        return text.iloc[:, 0].str.cat(text.iloc[:, 1:], sep='\x1f').str.lower()
+    
+    def build_excel(self, df):
+        """Write a DataFrame to Excel bytes"""
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False)
+        return output.getvalue()
 
     def generate_category_summary(self, df):
         """Generate a summary of spending by category"""
-        if 'Category' not in df.columns:
-            return "No category data available"
-            
-        try:
-            # Create a copy of the DataFrame to avoid modifying the original
-            summary_df = df.copy()
-            
-            # Handle withdrawals and deposits if they exist
-            if 'Withdrawl' in summary_df.columns and 'Deposit' in summary_df.columns:
-                # Convert to numeric if they aren't already
-                summary_df['Withdrawl'] = pd.to_numeric(summary_df['Withdrawl'], errors='coerce').fillna(0)
-                summary_df['Deposit'] = pd.to_numeric(summary_df['Deposit'], errors='coerce').fillna(0)
-                
-                # Calculate total withdrawals by category (expenses)
-                category_expenses = summary_df.groupby('Category')['Withdrawl'].sum().sort_values(ascending=False)
-                
-                # Calculate total deposits by category (income)
-                category_income = summary_df.groupby('Category')['Deposit'].sum().sort_values(ascending=False)
-                
-                # Generate summary text
-                summary_text = "Transaction Summary:\n\n"
-                
-                summary_text += "Expenses by Category:\n"
-                for category, amount in category_expenses.items():
-                    if amount > 0:  # Only include categories with expenses
-                        summary_text += f"- {category}: ₹{amount:.2f}\n"
-                
-                summary_text += "\nIncome by Category:\n"
-                for category, amount in category_income.items():
-                    if amount > 0:  # Only include categories with income
-                        summary_text += f"- {category}: ₹{amount:.2f}\n"
-                
-                # Calculate totals
-                total_expense = summary_df['Withdrawl'].sum()
-                total_income = summary_df['Deposit'].sum()
-                net_flow = total_income - total_expense
-                
-                summary_text += f"\nTotal Expense: ₹{total_expense:.2f}"
-                summary_text += f"\nTotal Income: ₹{total_income:.2f}"
-                summary_text += f"\nNet Cash Flow: ₹{net_flow:.2f} ({'Positive' if net_flow >= 0 else 'Negative'})"
-                
-                return summary_text
-            else:
-                # If no withdrawals/deposits columns, just count transactions by category
-                category_counts = df['Category'].value_counts()
-                
-                summary_text = "Transaction Categories:\n\n"
-                for category, count in category_counts.items():
-                    summary_text += f"- {category}: {count} transactions\n"
-                
-                return summary_text
-                
-        except Exception as e:
-            return f"Error generating summary: {str(e)}"
+        return self.statement_summarizer.build_category_summary(df)
     
     def save_pdf_metadata(self, username, filename, original_filename):
         """Save metadata about uploaded PDF files"""
         try:
-            # Read existing metadata
-            with open(self.pdf_metadata_file, 'r') as f:
-                metadata = json.load(f)
-            
-            # Add new file metadata
-            file_id = str(uuid.uuid4())
-            metadata[file_id] = {
-                'username': username,
-                'filename': filename,
-                'original_filename': original_filename,
-                'upload_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'file_size': os.path.getsize(filename)
-            }
-            
-            # Write updated metadata
-            with open(self.pdf_metadata_file, 'w') as f:
-                json.dump(metadata, f, indent=4)
-                
-            return file_id
+            return register_statement(username, filename, original_filename, self.pdf_metadata_file)
         except Exception as e:
             st.error(f"Error saving file metadata: {str(e)}")
             return None
@@ -584,6 +546,16 @@ class MobileAuthApp:
         
         logout_btn = st.button("Logout")
         
+        # Pipeline metrics are only available to administrators
+        if self.is_admin(username) and st.button("Pipeline Metrics"):
+            st.query_params.page = "admin_metrics"
+            st.query_params.username = username
+            st.rerun()
+        if self.is_admin(username) and st.button("Model Evaluation"):
+            st.query_params.page = "admin_models"
+            st.query_params.username = username
+            st.rerun()
+        
         if upload_btn and uploaded_file is not None:
             try:
                 # Validate file extension
@@ -618,22 +590,18 @@ class MobileAuthApp:
                     st.success(f"PDF '{uploaded_file.name}' uploaded successfully!")
                     st.info(f"File ID: {file_id}")
                     
-                    # Process the PDF to extract tables
-                    with st.spinner("Extracting data from PDF..."):
-                        password = pdf_password if pdf_password else None
-                        df = self.extract_table_pdfplumber(unique_filename, password)
-                        
-                        if df is not None:
-                            # The extract_table_pdfplumber method should have set URL params already
-                            st.success("Data extracted successfully! View the data table.")
-                            st.rerun()  # Refresh to apply the new URL parameters
-                        else:
-                            st.warning("No tables found in the PDF or extraction failed.")
+                    # Process the PDF in the background so the page stays responsive
+                    password = pdf_password if pdf_password else None
+                    self.job_queue.submit(username, unique_filename, uploaded_file.name, password)
+                    st.success("Statement queued for processing. Progress is shown below.")
                 else:
                     st.warning("File uploaded but metadata could not be saved.")
             except Exception as e:
                 st.error(f"Error uploading PDF: {str(e)}")
         
+        # Show progress of background processing jobs
+        self.ingestion_status_section(username)
+        
         if view_files_btn:
             # Set parameters for view_files page
             st.query_params.page = "view_files"
@@ -642,12 +610,48 @@ class MobileAuthApp:
         
         if logout_btn:
             # Clear to login page
+            st.session_state.pop('authenticated_user', None)
             st.query_params.clear()
             st.query_params.page = "login"
             st.rerun()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
+    def ingestion_status_section(self, username):
+        """Show the user's background processing jobs with progress and actions"""
+        jobs = self.job_queue.user_jobs(username)
+        if not jobs:
+            return
+        
+        st.subheader("Processing Status")
+        if st.button("Refresh Status"):
+            st.rerun()
+        
+        for job_id, job in list(jobs.items())[:10]:
+            st.write(f"**{job['original_filename']}** ({job['created']}): {job['status']}")
+            
+            if job['status'] == 'running':
+                if job['rows_total']:
+                    st.progress(job['rows_categorized'] / job['rows_total'],
+                                text=f"Categorized {job['rows_categorized']} of {job['rows_total']} rows")
+                elif job['pages_total']:
+                    st.progress(job['pages_done'] / job['pages_total'],
+                                text=f"Extracted {job['pages_done']} of {job['pages_total']} pages")
+            elif job['status'] == 'done':
+                if job.get('balance_breaks'):
+                    st.warning(f"{job['balance_breaks']} row(s) do not reconcile with the running balance; "
+                               "analysis is disabled for this statement.")
+                if st.button("View Data", key=f"view_{job_id}"):
+                    st.query_params.page = "view_dataframe"
+                    st.query_params.username = username
+                    st.query_params.pdf = job['pdf_path']
+                    st.rerun()
+            elif job['status'] == 'failed':
+                st.error(f"Processing failed: {job['error']}")
+                if st.button("Retry", key=f"retry_{job_id}"):
+                    self.job_queue.retry(job_id)
+                    st.rerun()
+    
     def view_dataframe_page(self, username, pdf_path):
         """Display the extracted DataFrame from PDF"""
         st.markdown('<div class="login-container">', unsafe_allow_html=True)
@@ -656,6 +660,9 @@ class MobileAuthApp:
         # Load DataFrame from disk based on PDF path
         df = self.load_dataframe_from_disk(pdf_path)
         
+        def cached(name, compute):
+            return self.statement_cache.get(username, pdf_path, name, compute)
+        
         if df is not None:
             # Show PDF file name
             st.write(f"Data from: {os.path.basename(pdf_path)}")
@@ -663,6 +670,14 @@ class MobileAuthApp:
             # Display DataFrame statistics
             st.write(f"Found {len(df)} rows and {len(df.columns)} columns")
             
+            # Analytics and advice only run on statements that reconcile with their balance
+            validation = self.validation_report(username, pdf_path, df)
+            reconciled = validation['valid']
+            if not reconciled:
+                st.error(f"{self.pipeline.validator.describe(validation)} "
+                         "Analysis is disabled until the statement is uploaded again.")
+                st.dataframe(pd.DataFrame(validation['break_rows']))
+            
             # Display tabs for data view, analysis, and financial advice
             tab1, tab2, tab3 = st.tabs(["Data", "Analysis", "Financial Advice"])
             
@@ -670,11 +685,14 @@ class MobileAuthApp:
                 # Add search/filter capability
                 search_term = st.text_input("Search in data", "")
                 
+                # Amounts are kept in paise and shown in rupees
+                display_df = cached('display_df', lambda: rupee_view(df))
+                
                 # Filter DataFrame if search term is provided
-                filtered_df = df
+                filtered_df = display_df
                 if search_term:
-                    filtered_df = df[df.astype(str).apply(
-                        lambda row: row.str.contains(search_term, case=False).any(), axis=1)]
+                    search_index = cached('search_index', lambda: self.build_search_index(display_df))
+                    filtered_df = display_df[search_index.str.contains(search_term.lower(), regex=False).to_numpy()]
                     st.write(f"Found {len(filtered_df)} matching rows")
                 
                 # Display the DataFrame
@@ -683,8 +701,9 @@ class MobileAuthApp:
                 # Download options
                 col1, col2 = st.columns(2)
                 with col1:
-                    # Download as CSV
-                    csv = filtered_df.to_csv(index=False).encode('utf-8')
+                    # Download as CSV; only the export of the whole statement is cached
+                    csv = (filtered_df.to_csv(index=False).encode('utf-8') if search_term else
+                           cached('csv', lambda: display_df.to_csv(index=False).encode('utf-8')))
                     st.download_button(
                         label="Download as CSV",
                         data=csv,
@@ -693,11 +712,9 @@ class MobileAuthApp:
                     )
                 
                 with col2:
-                    # Download as Excel - Fixed implementation using BytesIO
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        filtered_df.to_excel(writer, index=False)
-                    output.seek(0)  # Go to the beginning of the BytesIO buffer
+                    # Download as Excel
+                    output = (self.build_excel(filtered_df) if search_term else
+                              cached('xlsx', lambda: self.build_excel(display_df)))
                     
                     st.download_button(
                         label="Download as Excel",
@@ -705,11 +722,17 @@ class MobileAuthApp:
                         file_name=f"extracted_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
+                
+                # Corrections are remembered per payee and applied to every statement
+                if 'Category' in df.columns and 'Particulars' in df.columns:
+                    self.category_correction_section(username, df, cached)
             
             with tab2:
-                if 'Category' in df.columns:
+                if not reconciled:
+                    st.info("Analysis is not available for a statement that does not reconcile.")
+                elif 'Category' in df.columns:
                     # Generate category summary on-demand directly from the DataFrame
-                    category_summary = self.generate_category_summary(df)
+                    category_summary = cached('category_summary', lambda: self.generate_category_summary(df))
                     
                     # Show category summary
                     st.subheader("Transaction Summary")
@@ -717,29 +740,77 @@ class MobileAuthApp:
                     
                     # Show category distribution chart
                     st.subheader("Category Distribution")
-                    fig, ax = plt.subplots(figsize=(10, 6))
-                    category_counts = df['Category'].value_counts()
-                    sns.barplot(x=category_counts.index, y=category_counts.values, ax=ax)
-                    plt.xticks(rotation=45, ha='right')
-                    plt.tight_layout()
-                    st.pyplot(fig)
+                    st.image(cached('chart_category_counts',
+                                    lambda: self.render_bar_chart(
+                                        df.groupby('Category', observed=True).size().sort_values(ascending=False))))
                     
                     # If we have withdrawal/deposit data, show spending by category
                     if 'Withdrawl' in df.columns:
                         st.subheader("Spending by Category")
-                        fig2, ax2 = plt.subplots(figsize=(10, 6))
-                        category_spending = df.groupby('Category')['Withdrawl'].sum().sort_values(ascending=False)
-                        sns.barplot(x=category_spending.index, y=category_spending.values, ax=ax2)
-                        plt.xticks(rotation=45, ha='right')
-                        plt.tight_layout()
-                        st.pyplot(fig2)
+                        st.image(cached('chart_category_spending', lambda: self.render_bar_chart(
+                            to_rupees(df.groupby('Category', observed=True)['Withdrawl'].sum().sort_values(ascending=False)))))
+                    
+                    # Drilldowns by period, category, type and payee, from the statement's aggregate cube
+                    st.subheader("Explore Transactions")
+                    self.cube_explorer_section(username, pdf_path, df, cached)
+                    
+                    # Show recurring payments and subscriptions
+                    st.subheader("Recurring Payments")
+                    recurring = cached('recurring', lambda: self.recurring_detector.detect(df))
+                    if not recurring.empty:
+                        st.write(f"Found {len(recurring)} recurring payment(s), "
+                                 f"about ₹{recurring['AnnualCost'].sum():.2f} per year")
+                        st.dataframe(recurring)
+                    else:
+                        st.info("No recurring payments detected.")
+                    
+                    # Most frequent merchants over all of the user's statements
+                    st.subheader("Top Merchants Across Your Statements")
+                    top_merchants = self.pipeline.merchant_sketches.top(10, [username])
+                    if top_merchants:
+                        st.dataframe(pd.DataFrame([{'Merchant': item['merchant'], 'Payments': item['count'],
+                                                    'Spent': to_rupees(item['amount'])} for item in top_merchants]))
+                    else:
+                        st.info("No merchant history yet.")
+                    
+                    # Monthly spend per category against all other users, from the spend totals;
+                    # other users' statements change it, so it is cached per version of the totals
+                    st.subheader("How Your Spending Compares")
+                    comparison = self.statement_cache.get(
+                        username, pdf_path, 'peer_comparison', lambda: self.pipeline.peer_benchmark.compare(df, username),
+                        depends_on=self.pipeline.peer_benchmark.version())
+                    if not comparison.empty:
+                        st.write("Your average monthly spend per category, against every other user who "
+                                 "spends in that category in the same months")
+                        st.dataframe(pd.DataFrame({
+                            'Category': comparison['Category'],
+                            'Your Monthly Spend': to_rupees(comparison['MonthlySpend']),
+                            'Typical Monthly Spend': to_rupees(comparison['PeerMedian']),
+                            'Percentile': comparison['Percentile'].round(0),
+                            'Monthly Totals Compared': comparison['Peers'],
+                        }))
+                    else:
+                        st.info("Not enough spending data from other users yet.")
+                    
+                    # Show withdrawals that are unusual for their category
+                    st.subheader("Unusual Transactions")
+                    flagged = cached('flagged', lambda: self.anomaly_detector.flagged(
+                        df if 'AnomalyScore' in df.columns else self.anomaly_detector.score(username, df)))
+                    if not flagged.empty:
+                        st.write(f"{len(flagged)} withdrawal(s) are well above your usual spend in their category")
+                        st.dataframe(rupee_view(flagged)[[col for col in ['Date', 'Particulars', 'Withdrawl', 'Category', 'AnomalyScore']
+                                              if col in flagged.columns]])
+                    else:
+                        st.info("No unusual transactions detected.")
                 else:
                     st.info("No category information available. Unable to show analysis.")
             
             with tab3:
-                if 'Category' in df.columns:
+                if not reconciled:
+                    st.info("Financial advice is not available for a statement that does not reconcile.")
+                elif 'Category' in df.columns:
                     # Extract data for Gemini directly from DataFrame
-                    gemini_data = self.extract_category_data_for_gemini(df)
+                    gemini_data = cached('gemini_summary', lambda: self.extract_category_data_for_gemini(df))
                     
                     # Debug option
                     if st.checkbox("Show Raw Data Sent to Gemini"):
@@ -748,15 +819,13 @@ class MobileAuthApp:
                     
                     # Generate advice button
                     if st.button("Generate Financial Advice"):
-                        with st.spinner("Generating financial insights..."):
-                            prepared_summary = self.prepare_transaction_summary(gemini_data)
-                            financial_advice = self.get_financial_advice(prepared_summary)
-                            
-                        st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
-                        st.markdown("## 💰 Your Financial Insights")
-                        st.markdown("Below is personalized financial advice based on your transaction data:")
-                        st.markdown(financial_advice)
-                        st.markdown("</div>", unsafe_allow_html=True)
+                        # The local analysis shows at once; AI advice replaces it if it arrives in time
+                        prepared_summary = self.prepare_transaction_summary(gemini_data)
+                        self.render_advice_with_deadline(
+                            f"advice:{prepared_summary}", lambda: self.request_financial_advice(prepared_summary),
+                            "## 💰 Your Financial Insights\n\nBelow is personalized financial advice based on your transaction data:",
+                            cached('fallback_analysis', lambda: self.generate_fallback_analysis(df)),
+                            time.monotonic() + ADVICE_DEADLINE_SECONDS)
                 else:
                     st.info("No category information available. Unable to generate financial advice.")
         else:
@@ -773,6 +842,7 @@ class MobileAuthApp:
         
         with col2:
             if st.button("Logout"):
+                st.session_state.pop('authenticated_user', None)
                 st.query_params.clear()
                 st.query_params.page = "login"
                 st.rerun()
@@ -810,8 +880,19 @@ class MobileAuthApp:
                                     label="Download PDF",
                                     data=f,
                                     file_name=file_data['original_filename'],
-                                    mime="application/pdf"
+                                    mime="application/pdf",
+                                    key=f"download_{file_id}"
                                 )
+                            
+                            # Re-run categorization from the stored extraction, no password needed
+                            if st.button("Re-process", key=f"reprocess_{file_id}"):
+                                self.current_username = username
+                                with st.spinner("Re-processing statement..."):
+                                    df = self.extract_table_pdfplumber(file_data['filename'])
+                                if df is not None:
+                                    st.rerun()
+                                else:
+                                    st.warning("Statement could not be re-processed. Please upload it again.")
         except Exception as e:
             st.error(f"Error loading your files: {str(e)}")
         
@@ -825,76 +906,196 @@ class MobileAuthApp:
         
         with col2:
             if st.button("Logout"):
+                st.session_state.pop('authenticated_user', None)
                 st.query_params.clear()
                 st.query_params.page = "login"
                 st.rerun()
         
         st.markdown('</div>', unsafe_allow_html=True)
     
-    def get_financial_advice(self, transaction_summary):
-        """Generate financial advice using Gemini AI based on transaction summary"""
-        if not GOOGLE_API_KEY or gemini_model is None:
-            return "Financial advice not available. Google API Key is missing."
+    def is_admin(self, username):
+        """
+        Check if a user is listed in the ADMIN_USERS environment variable and
+        logged in as that user in this browser session.
+
+        The username in the URL alone is not trusted: anyone can type an
+        administrator's name into it.
+        """
+        admins = [name.strip() for name in os.getenv('ADMIN_USERS', '').split(',') if name.strip()]
+        return username in admins and st.session_state.get('authenticated_user') == username
+    
+    def admin_metrics_page(self, username):
+        """Show pipeline timings, throughput and counters for administrators"""
+        st.markdown('<div class="login-container">', unsafe_allow_html=True)
+        st.markdown('<h2 style="text-align:center; color:var(--accent-primary);">Pipeline Metrics</h2>', unsafe_allow_html=True)
+        
+        if not metrics.enabled:
+            st.info("Metrics are disabled. Set PIPELINE_METRICS=1 to start recording.")
+        
+        recent = metrics.recent_spans()
+        if recent:
+            recent_df = pd.DataFrame(recent)
             
-        try:
-            # Log what we're sending to Gemini for debugging
-            print(f"Sending to Gemini: {transaction_summary[:100]}...")
+            # Per-stage latency over the recent spans
+            st.subheader("Stage Latency")
+            stage_summary = recent_df.groupby('stage')['seconds'].describe(percentiles=[0.5, 0.95])
+            st.dataframe(stage_summary[['count', 'mean', '50%', '95%', 'max']])
             
-            prompt = f"""
-            You are a professional financial advisor. Based on the following detailed bank transaction analysis, 
-            provide specific, actionable financial advice in bullet points.
+            # Throughput for stages that report units
+            rate_columns = [col for col in ['pages', 'rows', 'bytes'] if col in recent_df.columns]
+            if rate_columns:
+                st.subheader("Throughput (per second)")
+                rates = recent_df[['stage', 'seconds'] + rate_columns].dropna(subset=rate_columns, how='all')
+                for col in rate_columns:
+                    rates[col] = rates[col] / rates['seconds']
+                st.dataframe(rates.groupby('stage')[rate_columns].median())
             
-            Focus on:
-            - Spending patterns that could be optimized
-            - Savings opportunities based on the category breakdown
-            - Budget recommendations considering income and expenses
-            - Investment suggestions based on cash flow
-            - Any concerning financial behaviors visible in the data
+            st.subheader("Recent Spans")
+            limit = st.number_input("Show last N spans", min_value=1, max_value=len(recent), value=min(50, len(recent)))
+            st.dataframe(recent_df.head(int(limit)))
+        else:
+            st.write("No spans recorded yet.")
+        
+        st.subheader("Counters")
+        st.json(json.loads(metrics.to_json())['counters'])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Download Prometheus", data=metrics.to_prometheus(),
+                               file_name="metrics.prom", mime="text/plain")
+        with col2:
+            st.download_button("Download JSON", data=metrics.to_json(),
+                               file_name="metrics.json", mime="application/json")
+        
+        if st.button("Back to Upload"):
+            st.query_params.page = "file_upload"
+            st.query_params.username = username
+            st.rerun()
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    def admin_models_page(self, username):
+        """Show how a shadow candidate model compares with production, and promote it"""
+        st.markdown('<div class="login-container">', unsafe_allow_html=True)
+        st.markdown('<h2 style="text-align:center; color:var(--accent-primary);">Model Evaluation</h2>', unsafe_allow_html=True)
+        
+        shadow = self.transaction_categorizer.shadow
+        if shadow is None:
+            st.info("No candidate model. Set SHADOW_MODEL_PATH and SHADOW_PREPROCESSOR_PATH to evaluate one in shadow.")
+        else:
+            report = shadow.report()
+            st.write(f"Candidate: {report['candidate']['model_path']} (since {report['since']}, "
+                     f"sampling {shadow.sample_rate:.0%} of model-scored rows)")
             
-            Make your advice practical and specific to this data. Be direct and helpful.
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Rows categorized", report['rows'])
+            col2.metric("Rows compared", report['sampled_rows'])
+            col3.metric("Disagreement", f"{report['disagreement_rate']:.1%}")
             
-            Transaction Analysis:
-            {transaction_summary}
+            low, high = report['disagreement_interval']
+            st.write(f"The models disagree on {low:.1%}–{high:.1%} of model-scored rows (95% interval). "
+                     f"About {report['expected_changed_share']:.1%} of all transactions would change category.")
             
-            Provide your advice in bullet points, with clear headings for different sections.
-            """
+            if report['top_disagreements']:
+                st.subheader("Most Common Disagreements")
+                st.dataframe(pd.DataFrame(report['top_disagreements'], columns=['Production -> Candidate', 'Rows']))
             
-            response = gemini_model.generate_content(prompt)
+            st.subheader("Category Drift")
+            distribution = pd.DataFrame({'Recent': pd.Series(report['window_counts'], dtype=float),
+                                         'Reference': pd.Series(report['reference_counts'] or {}, dtype=float)}).fillna(0)
+            st.dataframe(distribution / distribution.sum().replace(0, 1))
+            if report['drift'] is None:
+                st.info("Collecting the reference window for drift detection.")
+            elif report['drifted']:
+                st.warning(f"The category mix has drifted from the reference (PSI {report['drift']:.3f}).")
+            else:
+                st.write(f"No significant drift (PSI {report['drift']:.3f}).")
             
-            # Handle different response formats from Gemini models
-            if hasattr(response, 'text'):
-                advice_text = response.text
-                print(f"Received advice text, length: {len(advice_text)} chars")
-                return advice_text
-            elif isinstance(response, dict) and 'candidates' in response:
-                # Handle dictionary response format with candidates
-                candidates = response['candidates']
-                if candidates and len(candidates) > 0:
-                    if 'content' in candidates[0] and 'parts' in candidates[0]['content']:
-                        parts = candidates[0]['content']['parts']
-                        if parts and len(parts) > 0:
-                            return parts[0]['text']
-            elif isinstance(response, dict) and 'text' in response:
-                # Direct text in dictionary format
-                return response['text']
-            elif hasattr(response, 'candidates') and len(response.candidates) > 0:
-                # Handle object with candidates attribute
-                if hasattr(response.candidates[0], 'content'):
-                    return response.candidates[0].content.text
-            elif isinstance(response, str):
-                # Already a string
-                return response
+            # Promotion needs enough compared rows to be a decision on evidence
+            min_rows = int(os.getenv('SHADOW_MIN_ROWS', '500'))
+            if report['sampled_rows'] < min_rows:
+                st.info(f"Promotion is available after {min_rows} compared rows.")
+            else:
+                # Overwriting the production model is confirmed with the administrator's password
+                password = st.text_input("Password to confirm promotion", type="password", key='promote_password')
+                if st.button("Promote Candidate"):
+                    if not self.is_admin(username) or not self.validate_login(username, password):
+                        st.error("Invalid password")
+                    elif shadow.promote(self.transaction_categorizer, self.pipeline.model_path,
+                                        self.pipeline.preprocessor_path):
+                        st.success("Candidate promoted. Run rescore_job.py to re-categorize existing statements.")
+                    else:
+                        st.error("The candidate model could not be loaded.")
             
-            # If we got here, try to convert the whole response to a string
-            try:
-                return str(response)
-            except:
-                # Last resort fallback
-                return "Unable to process the AI model response. Using fallback analysis."
-                
+            if st.button("Reset Drift Reference"):
+                shadow.reset_reference()
+                st.rerun()
+        
+        if st.button("Back to Upload"):
+            st.query_params.page = "file_upload"
+            st.query_params.username = username
+            st.rerun()
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    def request_financial_advice(self, transaction_summary):
+        """Ask the advice provider for advice on a transaction summary; errors are raised, not shown"""
+        return self.advisor.request_advice(transaction_summary)
+    
+    def request_topic_advice(self, topic, category_summary):
+        """Ask the advice provider for advice on one topic; errors are raised, not shown"""
+        return self.advisor.request_topic_advice(topic, category_summary)
+    
+    def get_financial_advice(self, transaction_summary):
+        """Generate financial advice with the advice provider based on transaction summary"""
+        if not self.advisor.available:
+            return "Financial advice not available. No advice provider is configured."
+            
+        try:
+            return self.request_financial_advice(transaction_summary)
         except Exception as e:
             st.warning(f"Debug info: {type(e).__name__}: {str(e)}")
             return f"Error generating financial advice: {str(e)}"
+    
+    def render_advice_box(self, placeholder, title, text):
+        """Render advice in the styled box, replacing whatever the placeholder shows"""
+        with placeholder.container():
+            st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
+            if title:
+                st.markdown(title)
+            st.markdown(text)
+            st.markdown("</div>", unsafe_allow_html=True)
+    
+    def render_advice_with_deadline(self, key, request, title, fallback, deadline):
+        """
+        Show the local fallback at once and replace it with the AI answer if
+        that arrives before the deadline; otherwise the fallback stays.
+        
+        Args:
+            key: Key of the request, so a rerun picks up a call still running
+            request: Function returning the AI answer, run in the background
+            title: Heading shown above the AI answer
+            fallback: Markdown shown until, or instead of, the AI answer
+            deadline: time.monotonic() value after which the page stops waiting
+        """
+        placeholder = st.empty()
+        self.render_advice_box(placeholder, "", fallback)
+        if not self.advisor.available:
+            return
+        
+        key = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        try:
+            done, advice = advice_runner.wait(advice_runner.submit(key, request), deadline - time.monotonic())
+        except Exception as e:
+            st.caption(f"AI advice failed ({type(e).__name__}: {e}); showing the basic analysis instead.")
+            return
+        
+        if done:
+            self.render_advice_box(placeholder, title, advice)
+        else:
+            metrics.count('advice_deadline_missed')
+            st.caption(f"AI advice is taking longer than {ADVICE_DEADLINE_SECONDS:.0f}s, so the basic analysis "
+                       "is shown. Reload the page to see the AI advice once it is ready.")
 
     def generate_fallback_analysis(self, df):
         """Generate basic analysis if Gemini model fails to provide analysis"""
@@ -906,23 +1107,23 @@ class MobileAuthApp:
             
             # Calculate basic statistics
             if 'Withdrawl' in df.columns and 'Deposit' in df.columns:
-                total_expense = df['Withdrawl'].sum()
-                total_income = df['Deposit'].sum()
+                total_expense = int(df['Withdrawl'].sum())
+                total_income = int(df['Deposit'].sum())
                 net_flow = total_income - total_expense
                 
                 # Overall summary
                 analysis += f"## Summary\n"
-                analysis += f"* Total Expenses: ₹{total_expense:.2f}\n"
-                analysis += f"* Total Income: ₹{total_income:.2f}\n"
-                analysis += f"* Net Cash Flow: ₹{net_flow:.2f} ({net_flow >= 0 and 'Positive' or 'Negative'})\n\n"
+                analysis += f"* Total Expenses: {format_rupees(total_expense)}\n"
+                analysis += f"* Total Income: {format_rupees(total_income)}\n"
+                analysis += f"* Net Cash Flow: {format_rupees(net_flow)} ({net_flow >= 0 and 'Positive' or 'Negative'})\n\n"
                 
                 # Category analysis
                 analysis += f"## Spending by Category\n"
-                category_expenses = df.groupby('Category')['Withdrawl'].sum().sort_values(ascending=False)
+                category_expenses = df.groupby('Category', observed=True)['Withdrawl'].sum().sort_values(ascending=False)
                 for category, amount in category_expenses.items():
                     if amount > 0:
                         percent = (amount / total_expense) * 100
-                        analysis += f"* {category}: ₹{amount:.2f} ({percent:.1f}%)\n"
+                        analysis += f"* {category}: {format_rupees(amount)} ({percent:.1f}%)\n"
                 
                 # Basic advice
                 analysis += "\n## Basic Recommendations\n"
@@ -947,83 +1148,65 @@ class MobileAuthApp:
             return f"Error generating fallback analysis: {str(e)}"
 
     def test_gemini_connection(self):
-        """Test if the Gemini model is working properly and return status"""
-        if not GOOGLE_API_KEY or gemini_model is None:
-            return False, "API key not configured"
-            
-        try:
-            # Simple test prompt
-            test_prompt = "Give a one-sentence financial tip."
-            response = gemini_model.generate_content(test_prompt)
-            
-            # Try to access the response in different ways
-            if hasattr(response, 'text') and response.text:
-                return True, "Connection successful"
-            elif isinstance(response, dict) and ('text' in response or 'candidates' in response):
-                return True, "Connection successful (dictionary response)"
-            else:
-                # If we got a response but can't extract text
-                return False, f"Connection working but unexpected response format: {type(response)}"
-                
-        except Exception as e:
-            return False, f"Connection failed: {type(e).__name__}: {str(e)}"
+        """Test if the advice provider is working properly and return status"""
+        return self.advisor.probe()
 
-    def financial_advice_page(self):
+    def financial_advice_page(self, username, pdf_path):
         """Display detailed financial advice"""
         st.markdown('<div class="login-container">', unsafe_allow_html=True)
         st.markdown('<h2 style="text-align:center; color:var(--accent-primary);">Financial Advice</h2>', unsafe_allow_html=True)
         
+        # Nothing on this page waits for the AI longer than the deadline
+        deadline = time.monotonic() + ADVICE_DEADLINE_SECONDS
+        
         # Get the DataFrame directly from session state instead of depending on multiple state items
-        extracted_df = self.load_dataframe_from_disk(self.current_pdf)
+        extracted_df = self.load_dataframe_from_disk(pdf_path)
         
-        # Add AI model status indicator
-        model_status, status_msg = self.test_gemini_connection()
+        # The AI model status is probed in the background and shown when known
+        status_placeholder = st.empty()
+        probe = advice_runner.submit('advice_probe', self.test_gemini_connection)
         
-        if model_status:
-            st.success(f"AI Model Status: Ready")
-        else:
-            st.error(f"AI Model Status: Issue detected - {status_msg}")
+        # Advice is only generated from statements that reconcile with their balance
+        reconciled = True
+        if extracted_df is not None:
+            validation = self.validation_report(username, pdf_path, extracted_df)
+            reconciled = validation['valid']
         
-        if extracted_df is not None and 'Category' in extracted_df.columns:
+        if not reconciled:
+            st.error(f"{self.pipeline.validator.describe(validation)} "
+                     "Financial advice is disabled until the statement is uploaded again.")
+        elif extracted_df is not None and 'Category' in extracted_df.columns:
             # Generate all data on-demand without depending on session state
-            gemini_data = self.extract_category_data_for_gemini(extracted_df)
+            gemini_data = self.statement_cache.get(username, pdf_path, 'gemini_summary',
+                                                   lambda: self.extract_category_data_for_gemini(extracted_df))
             prepared_summary = self.prepare_transaction_summary(gemini_data)
+            fallback_analysis = self.statement_cache.get(username, pdf_path, 'fallback_analysis',
+                                                         lambda: self.generate_fallback_analysis(extracted_df))
             
-            try:
-                # Generate advice directly using the Gemini model
-                with st.spinner("Generating financial insights..."):
-                    financial_advice = self.get_financial_advice(prepared_summary)
-                
-                # Display the advice
-                st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
-                st.markdown("## 💰 Your Personalized Financial Insights")
-                st.markdown(financial_advice)
-                st.markdown("</div>", unsafe_allow_html=True)
-            except Exception as e:
-                # If Gemini fails, use fallback analysis
-                st.warning(f"AI-powered financial advice failed: {str(e)}. Showing basic analysis instead.")
-                fallback_analysis = self.generate_fallback_analysis(extracted_df)
-                
-                st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
-                st.markdown(fallback_analysis)
-                st.markdown("</div>", unsafe_allow_html=True)
-                
-                # Option to retry with AI
-                if st.button("Try Again with AI"):
-                    with st.spinner("Generating AI financial insights..."):
-                        try:
-                            new_advice = self.get_financial_advice(prepared_summary)
-                            st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
-                            st.markdown("## 💰 Fresh Financial Insights")
-                            st.markdown(new_advice)
-                            st.markdown("</div>", unsafe_allow_html=True)
-                        except Exception as retry_e:
-                            st.error(f"Failed to generate AI advice: {str(retry_e)}")
+            # The local analysis shows at once; AI advice replaces it if it arrives in time
+            self.render_advice_with_deadline(
+                f"advice:{prepared_summary}", lambda: self.request_financial_advice(prepared_summary),
+                "## 💰 Your Personalized Financial Insights", fallback_analysis, deadline)
         else:
             st.error("No transaction data available. Please upload and analyze a statement first.")
         
+        model_status, status_msg = None, None
+        try:
+            done, result = advice_runner.wait(probe, deadline - time.monotonic())
+            if done:
+                model_status, status_msg = result
+        except Exception as e:
+            model_status, status_msg = False, f"{type(e).__name__}: {e}"
+        
+        if model_status:
+            status_placeholder.success(f"AI Model Status: Ready")
+        elif model_status is None:
+            status_placeholder.warning(f"AI Model Status: No response within {ADVICE_DEADLINE_SECONDS:.0f}s")
+        else:
+            status_placeholder.error(f"AI Model Status: Issue detected - {status_msg}")
+        
         # Add options to customize advice
-        if extracted_df is not None:
+        if extracted_df is not None and reconciled:
             st.subheader("Need more specific advice?")
             specific_topic = st.selectbox("Choose a topic:", 
                                         ["Saving Strategies", "Debt Management", "Investment Options", 
@@ -1031,36 +1214,16 @@ class MobileAuthApp:
             
             if st.button("Get Specific Advice"):
                 # Generate category summary directly from DataFrame for specific topics
-                category_summary = self.generate_category_summary(extracted_df)
+                category_summary = self.statement_cache.get(username, pdf_path, 'category_summary',
+                                                            lambda: self.generate_category_summary(extracted_df))
                 
-                with st.spinner(f"Generating advice on {specific_topic}..."):
-                    try:
-                        if gemini_model is not None:
-                            prompt = f"""
-                            As a financial advisor, provide detailed advice specifically on {specific_topic}
-                            based on the following transaction data summary:
-                            
-                            {category_summary}
-                            
-                            Focus only on {specific_topic} with practical, actionable points.
-                            Format your advice in bullet points with clear headings.
-                            """
-                            
-                            response = gemini_model.generate_content(prompt)
-                            st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
-                            st.markdown(f"## {specific_topic} Advice")
-                            st.markdown(response.text)
-                            st.markdown("</div>", unsafe_allow_html=True)
-                        else:
-                            # Fallback for specific topic advice
-                            st.info("AI model not available. Showing general advice for this topic.")
-                            basic_advice = self.get_basic_topic_advice(specific_topic, extracted_df)
-                            st.markdown('<div style="padding: 20px; border-radius: 10px; background-color: var(--bg-secondary);">', unsafe_allow_html=True)
-                            st.markdown(f"## {specific_topic} - General Advice")
-                            st.markdown(basic_advice)
-                            st.markdown("</div>", unsafe_allow_html=True)
-                    except Exception as e:
-                        st.error(f"Error generating advice: {str(e)}")
+                # General advice for the topic shows at once; AI advice replaces it if it arrives in time
+                self.render_advice_with_deadline(
+                    f"topic:{specific_topic}:{category_summary}",
+                    lambda: self.request_topic_advice(specific_topic, category_summary),
+                    f"## {specific_topic} Advice",
+                    self.get_basic_topic_advice(specific_topic, extracted_df),
+                    time.monotonic() + ADVICE_DEADLINE_SECONDS)
         
         col1, col2 = st.columns(2)
         
@@ -1090,6 +1253,12 @@ class MobileAuthApp:
             advice += "* Look for unnecessary subscriptions and recurring charges\n"
             advice += "* Consider using cash for discretionary spending to be more mindful\n"
             advice += "* Set specific savings goals with deadlines to stay motivated\n"
+            
+            # Point at the recurring charges actually found in the statement
+            recurring = self.recurring_detector.detect(df)
+            if not recurring.empty:
+                advice += "\n## Recurring Charges Found\n"
+                advice += self.recurring_detector.format_for_summary(recurring, limit=5)
         
         elif topic == "Debt Management":
             advice += "* List all debts with interest rates and minimum payments\n"
@@ -1116,7 +1285,7 @@ class MobileAuthApp:
             if df is not None and 'Category' in df.columns and 'Withdrawl' in df.columns:
                 # Try to provide data-driven advice
                 try:
-                    top_expenses = df.groupby('Category')['Withdrawl'].sum().sort_values(ascending=False).head(3)
+                    top_expenses = df.groupby('Category', observed=True)['Withdrawl'].sum().sort_values(ascending=False).head(3)
                     advice += f"* Your top spending categories are: {', '.join(top_expenses.index)}\n"
                     advice += "* Focus on reducing expenses in these categories first\n"
                 except:
@@ -1164,6 +1333,20 @@ class MobileAuthApp:
                 st.error("Required parameters missing")
                 st.query_params.page = "login"
                 st.rerun()
+        elif page == "admin_metrics":
+            if username and self.is_admin(username):
+                self.admin_metrics_page(username)
+            else:
+                st.error("Access denied")
+                st.query_params.page = "login"
+                st.rerun()
+        elif page == "admin_models":
+            if username and self.is_admin(username):
+                self.admin_models_page(username)
+            else:
+                st.error("Access denied")
+                st.query_params.page = "login"
+                st.rerun()
         elif page == "financial_advice":
             if username and pdf_path:
                 self.financial_advice_page(username, pdf_path)
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import threading
+import numpy as np
+
+
+class MerchantIndex:
+    """
+    A sorted-array index from payee keys to categories.
+
+    Keys are interned and kept in one sorted object array, with categories
+    stored as small integer codes next to it. A whole column of payees is
+    looked up with a single binary search.
+    """
+
+    def __init__(self, mapping):
+        """
+        Build the index.
+
+        Args:
+            mapping: Dictionary of payee key -> category
+        """
+        self.categories = np.array(sorted(set(mapping.values())), dtype=object)
+        category_codes = {category: code for code, category in enumerate(self.categories)}
+
+        keys = sorted(mapping)
+        self.keys = np.array([sys.intern(key) for key in keys], dtype=object)
+        self.codes = np.array([category_codes[mapping[key]] for key in keys], dtype=np.uint16)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, payees):
+        """
+        Look up an array of payee keys.
+
+        Returns:
+            numpy object array of categories, '' where a payee is not in the index
+        """
+        payees = np.asarray(payees, dtype=object)
+        result = np.full(len(payees), '', dtype=object)
+        if len(self.keys) == 0 or len(payees) == 0:
+            return result
+
+        positions = np.searchsorted(self.keys, payees).clip(max=len(self.keys) - 1)
+        found = self.keys[positions] == payees
+        result[found] = self.categories[self.codes[positions[found]]]
+        return result
+
+
+class MerchantKnowledgeBase:
+    """
+    A class to keep what is known about merchants outside the code: a shared
+    dictionary of payee -> category and each user's own corrections.
+
+    Payees are identified by the keys of TransactionCategorizer.normalize_payees
+    (the VPA for UPI payments). A user's corrections take precedence over the
+    shared dictionary, and both take precedence over the built-in rules and
+    the model. Both are kept in JSON files and reloaded when they change, so
+    every process sees corrections made by another.
+    """
+
+    def __init__(self, merchants_file='merchant_categories.json', overrides_file='merchant_overrides.json'):
+        """
+        Initialize the MerchantKnowledgeBase.
+
+        Args:
+            merchants_file: Path to the JSON file of shared payee categories
+            overrides_file: Path to the JSON file of per-user corrections
+        """
+        self.merchants_file = merchants_file
+        self.overrides_file = overrides_file
+        self.lock = threading.Lock()
+
+        # File stamp and index of the shared dictionary and of each user's corrections
+        self.merchants_stamp = None
+        self.merchants_index = MerchantIndex({})
+        self.overrides_stamp = None
+        self.user_indexes = {}
+
+        for path in (self.merchants_file, self.overrides_file):
+            if not os.path.exists(path):
+                with open(path, 'w') as f:
+                    json.dump({}, f)
+
+    def __getstate__(self):
+        # Locks cannot be sent to worker processes
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def load_json(self, path):
+        """Load one of the knowledge base files"""
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_json(self, path, data):
+        """Write one of the knowledge base files atomically"""
+        temp_file = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+        os.replace(temp_file, path)
+
+    def file_stamp(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def refresh(self):
+        """Rebuild the indexes of files changed since they were last read"""
+        with self.lock:
+            stamp = self.file_stamp(self.merchants_file)
+            if stamp != self.merchants_stamp:
+                self.merchants_index = MerchantIndex(self.load_json(self.merchants_file))
+                self.merchants_stamp = stamp
+
+            stamp = self.file_stamp(self.overrides_file)
+            if stamp != self.overrides_stamp:
+                self.user_indexes = {username: MerchantIndex(overrides)
+                                     for username, overrides in self.load_json(self.overrides_file).items()}
+                self.overrides_stamp = stamp
+
+    def is_empty(self, username=None):
+        """Whether nothing is known that could change a categorization for this user"""
+        self.refresh()
+        user_index = self.user_indexes.get(username)
+        return len(self.merchants_index) == 0 and (user_index is None or len(user_index) == 0)
+
+    def lookup(self, payees, username=None):
+        """
+        Look up the known categories of a column of payee keys.
+
+        Args:
+            payees: Sequence of payee keys
+            username: User whose corrections apply, if any
+
+        Returns:
+            numpy object array of categories, '' where nothing is known
+        """
+        self.refresh()
+        categories = self.merchants_index.lookup(payees)
+        user_index = self.user_indexes.get(username)
+        if user_index is not None:
+            corrected = user_index.lookup(payees)
+            categories = np.where(corrected != '', corrected, categories)
+        return categories
+
+    def user_overrides(self, username):
+        """Return a user's corrections as a dictionary of payee key -> category"""
+        return self.load_json(self.overrides_file).get(username, {})
+
+    def set_override(self, username, payee, category):
+        """Record a user's category for a payee"""
+        with self.lock:
+            overrides = self.load_json(self.overrides_file)
+            overrides.setdefault(username, {})[payee] = category
+            self.save_json(self.overrides_file, overrides)
+
+    def remove_override(self, username, payee):
+        """Forget a user's category for a payee; returns False if there was none"""
+        with self.lock:
+            overrides = self.load_json(self.overrides_file)
+            if payee not in overrides.get(username, {}):
+                return False
+            del overrides[username][payee]
+            self.save_json(self.overrides_file, overrides)
+            return True
+
+    def set_merchant(self, payee, category):
+        """Record the shared category of a payee, for every user"""
+        with self.lock:
+            merchants = self.load_json(self.merchants_file)
+            merchants[payee] = category
+            self.save_json(self.merchants_file, merchants)
@@ -0,0 +1,284 @@
+import os
+import json
+import argparse
+import threading
+from file_lock import FileLock
+from statement_cleaning import format_rupees
+
+
+class SpaceSavingSketch:
+    """
+    A class to keep the most frequent merchants of a stream in bounded space
+    (the Space-Saving summary).
+
+    At most capacity merchants are kept, each with an overestimate of its
+    payment count and the largest possible overestimate (error). A merchant
+    that is not kept was paid at most min_count times, so any merchant paid
+    more than total / capacity times is kept. Sketches merge without the
+    transactions they summarize (Agarwal et al., "Mergeable Summaries"), so
+    months and users can be combined at query time.
+
+    Amounts are the spend seen while a merchant was kept, so they are a
+    lower bound for merchants whose error is not zero.
+    """
+
+    def __init__(self, capacity=100, items=None, total=0):
+        """
+        Initialize the SpaceSavingSketch.
+
+        Args:
+            capacity: Maximum merchants kept
+            items: Dictionary of merchant -> [count, error, amount in paise]
+            total: Payments summarized, including those of merchants not kept
+        """
+        self.capacity = capacity
+        self.items = items or {}
+        self.total = total
+
+    @classmethod
+    def from_counts(cls, counts, capacity=100):
+        """
+        Summarize exact counts, keeping the capacity most frequent merchants.
+
+        Args:
+            counts: Dictionary of merchant -> (count, amount in paise)
+            capacity: Maximum merchants kept
+
+        Returns:
+            SpaceSavingSketch of the counts
+        """
+        ranked = sorted(counts.items(), key=lambda item: (-item[1][0], item[0]))[:capacity]
+        return cls(capacity, {merchant: [int(count), 0, int(amount)] for merchant, (count, amount) in ranked},
+                   total=sum(int(count) for count, _ in counts.values()))
+
+    @property
+    def min_count(self):
+        """Most payments a merchant that is not kept can have"""
+        if len(self.items) < self.capacity:
+            return 0
+        return min(count for count, _, _ in self.items.values())
+
+    def merge(self, other):
+        """
+        Combine two sketches into a new one.
+
+        A merchant missing from a full sketch may have up to its min_count
+        payments there, so that bound is added to both its count and error.
+        """
+        capacity = max(self.capacity, other.capacity)
+        floor_a, floor_b = self.min_count, other.min_count
+        merged = {}
+        for merchant in self.items.keys() | other.items.keys():
+            count_a, error_a, amount_a = self.items.get(merchant, (floor_a, floor_a, 0))
+            count_b, error_b, amount_b = other.items.get(merchant, (floor_b, floor_b, 0))
+            merged[merchant] = [count_a + count_b, error_a + error_b, amount_a + amount_b]
+
+        ranked = sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))[:capacity]
+        return SpaceSavingSketch(capacity, dict(ranked), self.total + other.total)
+
+    def top(self, n=10):
+        """
+        Return the n most frequent merchants.
+
+        Returns:
+            List of dictionaries with 'merchant', 'count' (an overestimate),
+            'error', 'guaranteed' (count - error, a lower bound) and 'amount'
+            (paise), most frequent first
+        """
+        ranked = sorted(self.items.items(), key=lambda item: (-item[1][0], item[0]))[:n]
+        return [{'merchant': merchant, 'count': count, 'error': error, 'guaranteed': count - error, 'amount': amount}
+                for merchant, (count, error, amount) in ranked]
+
+    def to_dict(self):
+        return {'capacity': self.capacity, 'total': self.total, 'items': self.items}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['capacity'], {merchant: list(values) for merchant, values in data['items'].items()},
+                   data['total'])
+
+
+class MerchantSketchStore:
+    """
+    A class to keep top-merchant sketches per user and month, and for all
+    users per month, updated as statements are ingested.
+
+    Each statement's withdrawals are counted exactly per month and merchant,
+    summarized and merged into the user's and the platform's sketch of that
+    month. Queries merge the sketches of the requested users and months, so
+    their cost depends on the number of sketches, not on the transactions.
+    Sketches are kept in a JSON file.
+    """
+
+    GLOBAL_KEY = '*'
+
+    def __init__(self, sketch_file='merchant_sketches.json', capacity=100):
+        """
+        Initialize the MerchantSketchStore.
+
+        Args:
+            sketch_file: Path to the JSON file holding the sketches
+            capacity: Merchants kept per sketch
+        """
+        self.sketch_file = sketch_file
+        self.capacity = capacity
+
+        # Statements can be ingested concurrently by background workers and the batch CLI
+        self.lock = FileLock(self.sketch_file)
+        self.state = None
+        self.stamp = None
+
+    def empty_state(self):
+        return {'statements': {}, 'sketches': {}}
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.sketch_file)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def load(self):
+        """Return the sketches, reading the file again only if it changed"""
+        stamp = self.file_stamp()
+        if self.state is None or stamp != self.stamp:
+            try:
+                with open(self.sketch_file, 'r') as f:
+                    self.state = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.state = self.empty_state()
+            self.stamp = stamp
+        return self.state
+
+    def save(self, state):
+        temp_file = f"{self.sketch_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_file, self.sketch_file)
+        self.state = state
+        self.stamp = self.file_stamp()
+
+    def update(self, username, activity, statement_id):
+        """
+        Merge the withdrawals of one statement into the user's and the global sketches.
+
+        Args:
+            username: Owner of the statement
+            activity: DataFrame with 'Month' ('YYYY-MM'), 'Merchant' and
+                'Amount' (paise) columns, one row per withdrawal
+            statement_id: Identifier of the statement, so it is only counted once
+
+        Returns:
+            True if the statement was merged, False if it was already counted
+        """
+        batch = activity.groupby(['Month', 'Merchant'], sort=False)['Amount'].agg(['size', 'sum'])
+        counts = {}
+        for (month, merchant), row in batch.iterrows():
+            counts.setdefault(month, {})[merchant] = (int(row['size']), int(row['sum']))
+
+        with self.lock:
+            state = self.load()
+            statements = state['statements'].setdefault(username, [])
+            if statement_id in statements:
+                return False
+
+            for month, month_counts in counts.items():
+                sketch = SpaceSavingSketch.from_counts(month_counts, self.capacity)
+                for owner in (username, self.GLOBAL_KEY):
+                    months = state['sketches'].setdefault(owner, {})
+                    current = months.get(month)
+                    merged = sketch if current is None else SpaceSavingSketch.from_dict(current).merge(sketch)
+                    months[month] = merged.to_dict()
+
+            statements.append(statement_id)
+            self.save(state)
+            return True
+
+    def sketch(self, usernames=None, start=None, end=None):
+        """
+        Merge the sketches of some users and months.
+
+        Args:
+            usernames: Users to include (default: all users, from the global sketches)
+            start: First month included, as 'YYYY-MM' (default: the earliest)
+            end: Last month included, as 'YYYY-MM' (default: the latest)
+
+        Returns:
+            SpaceSavingSketch of the selected payments
+        """
+        with self.lock:
+            sketches = self.load()['sketches']
+        owners = [self.GLOBAL_KEY] if usernames is None else usernames
+
+        merged = SpaceSavingSketch(self.capacity)
+        for owner in owners:
+            for month, data in sketches.get(owner, {}).items():
+                if (start is None or month >= start) and (end is None or month <= end):
+                    merged = merged.merge(SpaceSavingSketch.from_dict(data))
+        return merged
+
+    def top(self, n=10, usernames=None, start=None, end=None):
+        """Return the n most frequent merchants of some users and months (see sketch and SpaceSavingSketch.top)"""
+        return self.sketch(usernames, start, end).top(n)
+
+    def months(self, username=None):
+        """Return the months with sketches of a user (or of all users), in order"""
+        with self.lock:
+            sketches = self.load()['sketches']
+        return sorted(sketches.get(self.GLOBAL_KEY if username is None else username, {}))
+
+    def format_for_summary(self, top):
+        """Format top merchants as bullet points for text summaries"""
+        if not top:
+            return "* No merchant history yet\n"
+
+        lines = ""
+        for item in top:
+            approximate = "about " if item['error'] else ""
+            lines += f"* {item['merchant']}: {approximate}{item['count']} payments, {format_rupees(item['amount'])}\n"
+        return lines
+
+
+def backfill(store, metadata_file):
+    """Add the processed statements listed in metadata_file that were ingested before the sketches existed"""
+    from statement_pipeline import StatementPipeline
+    pipeline = StatementPipeline()
+    pipeline.merchant_sketches = store
+
+    with open(metadata_file, 'r') as f:
+        metadata = json.load(f)
+
+    added = 0
+    for file_data in metadata.values():
+        df = pipeline.load_dataframe(file_data['filename'])
+        # Like the anomaly statistics, sketches only count statements that reconcile
+        if df is None or not pipeline.validate(df)['valid']:
+            continue
+        added += store.update(file_data['username'], pipeline.merchant_activity(df),
+                              pipeline.statement_id(file_data['filename']))
+    print(f"Added {added} statement(s) to the merchant sketches")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the top merchants of ingested statements")
+    parser.add_argument('--user', action='append', help="User to include (repeatable; default: all users)")
+    parser.add_argument('--start', help="First month, YYYY-MM")
+    parser.add_argument('--end', help="Last month, YYYY-MM")
+    parser.add_argument('--top', type=int, default=10, help="Merchants to show")
+    parser.add_argument('--sketches', default='merchant_sketches.json', help="Sketch file")
+    parser.add_argument('--backfill', action='store_true',
+                        help="First add processed statements that are not in the sketches yet")
+    parser.add_argument('--metadata', default='pdf_metadata.json', help="JSON file listing uploaded statements")
+    args = parser.parse_args()
+
+    store = MerchantSketchStore(args.sketches)
+    if args.backfill:
+        backfill(store, args.metadata)
+    sketch = store.sketch(args.user, args.start, args.end)
+    print(f"{sketch.total} payments summarized")
+    for item in sketch.top(args.top):
+        print(f"{item['merchant']:40} {item['count']:>8} (±{item['error']}) {format_rupees(item['amount']):>16}")
+
+
+if __name__ == '__main__':
+    main()
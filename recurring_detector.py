@@ -0,0 +1,149 @@
+import pandas as pd
+import numpy as np
+from statement_cleaning import to_rupees, parse_dates
+
+
+class RecurringPaymentDetector:
+    """
+    A class to find recurring payments and subscriptions in categorized
+    bank transactions.
+
+    Transactions are grouped by normalized payee, sorted once by date and
+    scanned as consecutive windows, so the cost is a single sort over the
+    history rather than a pairwise comparison of transactions.
+    """
+
+    # Known billing periods in days, with the tolerance allowed around each
+    PERIODS = [
+        ('Weekly', 7.0, 1.5),
+        ('Fortnightly', 14.0, 2.0),
+        ('Monthly', 30.44, 4.0),
+        ('Quarterly', 91.31, 10.0),
+        ('Yearly', 365.25, 20.0),
+    ]
+
+    def __init__(self, categorizer, amount_tolerance=0.15, min_occurrences=3):
+        """
+        Initialize the RecurringPaymentDetector.
+
+        Args:
+            categorizer: TransactionCategorizer used to normalize payees
+            amount_tolerance: Allowed relative change between consecutive amounts
+            min_occurrences: Minimum number of payments that make up a series
+        """
+        self.categorizer = categorizer
+        self.amount_tolerance = amount_tolerance
+        self.min_occurrences = min_occurrences
+
+    def detect(self, df):
+        """
+        Detect recurring withdrawals in a DataFrame of transactions.
+
+        Args:
+            df: pandas DataFrame with 'Date', 'Particulars' and 'Withdrawl' columns
+
+        Returns:
+            DataFrame with one row per recurring series, most expensive first
+        """
+        columns = ['Payee', 'Frequency', 'Occurrences', 'TypicalAmount', 'AnnualCost',
+                   'FirstDate', 'LastDate', 'NextExpected', 'Category', 'Active']
+        if df is None or not {'Date', 'Particulars', 'Withdrawl'}.issubset(df.columns):
+            return pd.DataFrame(columns=columns)
+
+        txns = pd.DataFrame({
+            'Payee': self.categorizer.normalize_payees(df['Particulars']),
+            'Date': parse_dates(df['Date']),
+            'Amount': to_rupees(df['Withdrawl']),
+            'Category': df['Category'] if 'Category' in df.columns else 'OTHER',
+        })
+        txns = txns[(txns['Amount'] > 0) & txns['Date'].notna() & (txns['Payee'] != '')]
+        if len(txns) < self.min_occurrences:
+            return pd.DataFrame(columns=columns)
+
+        # Series are judged active against the last withdrawal of the statement, not of the series
+        statement_end = txns['Date'].max()
+
+        # One sort puts every payee's history in date order
+        txns = txns.sort_values(['Payee', 'Date'], kind='mergesort').reset_index(drop=True)
+        payee = txns['Payee'].to_numpy()
+        amount = txns['Amount'].to_numpy(dtype=float)
+        same_payee = np.r_[False, payee[1:] == payee[:-1]]
+
+        # Gap to the previous payment of the same payee and the period it fits
+        interval = txns['Date'].diff().dt.days.to_numpy(dtype=float)
+        period_index = self._match_periods(interval)
+
+        # A link joins a payment to the previous one when the gap matches a
+        # known period and the amount stayed within tolerance
+        previous_amount = np.r_[np.nan, amount[:-1]]
+        amount_close = np.abs(amount - previous_amount) <= self.amount_tolerance * np.fmax(amount, previous_amount)
+        link_ok = same_payee & (period_index >= 0) & amount_close
+
+        # Consecutive links with the same period form one series window
+        previous_link_ok = np.r_[False, link_ok[:-1]]
+        previous_period = np.r_[-1, period_index[:-1]]
+        continues = link_ok & (~previous_link_ok | (period_index == previous_period))
+        series_id = np.cumsum(~continues)
+        txns['Series'] = series_id
+        txns['Period'] = np.where(link_ok, period_index, -1)
+        txns['Interval'] = np.where(link_ok, interval, np.nan)
+
+        # Drop short windows before aggregating so most rows never reach groupby
+        series_size = np.bincount(series_id)
+        txns = txns[series_size[series_id] >= self.min_occurrences]
+
+        series = txns.groupby('Series', sort=False).agg(
+            Payee=('Payee', 'first'),
+            Occurrences=('Amount', 'size'),
+            TypicalAmount=('Amount', 'median'),
+            FirstDate=('Date', 'min'),
+            LastDate=('Date', 'max'),
+            Period=('Period', 'max'),
+            Interval=('Interval', 'median'),
+            Category=('Category', lambda values: values.mode().iat[0]),
+        )
+        series = series[(series['Occurrences'] >= self.min_occurrences) & (series['Period'] >= 0)]
+        if series.empty:
+            return pd.DataFrame(columns=columns)
+
+        # Keep only the latest series per payee
+        series = series.sort_values('LastDate').drop_duplicates('Payee', keep='last')
+
+        period_days = np.array([days for _, days, _ in self.PERIODS])
+        names = np.array([name for name, _, _ in self.PERIODS])
+        period = series['Period'].to_numpy(dtype=int)
+        series['Frequency'] = names[period]
+        series['AnnualCost'] = series['TypicalAmount'] * (365.25 / period_days[period])
+        series['NextExpected'] = series['LastDate'] + pd.to_timedelta(series['Interval'].round(), unit='D')
+
+        # A series is active if its next payment is not long overdue
+        overdue_limit = pd.to_timedelta(period_days[period] * 1.5, unit='D')
+        series['Active'] = (series['LastDate'] + overdue_limit) >= statement_end
+
+        series = series.sort_values('AnnualCost', ascending=False).reset_index(drop=True)
+        return series[columns]
+
+    def format_for_summary(self, recurring, limit=10):
+        """Format detected recurring payments as bullet points for text summaries"""
+        if recurring is None or recurring.empty:
+            return "* No recurring payments detected\n"
+
+        lines = ""
+        for _, item in recurring.head(limit).iterrows():
+            status = 'active' if item['Active'] else 'possibly stopped'
+            lines += (f"* {item['Payee']} ({item['Category']}): {item['Frequency']} payment of "
+                      f"₹{item['TypicalAmount']:.2f}, {item['Occurrences']} times since "
+                      f"{item['FirstDate']:%d-%b-%Y}, about ₹{item['AnnualCost']:.2f} per year ({status})\n")
+        return lines
+
+    def _match_periods(self, interval):
+        """Return the index of the known period each interval matches, or -1"""
+        period_days = np.array([days for _, days, _ in self.PERIODS])
+        tolerance = np.array([tol for _, _, tol in self.PERIODS])
+
+        distance = np.abs(interval[:, None] - period_days[None, :])
+        within = distance <= tolerance[None, :]
+        distance = np.where(within, distance, np.inf)
+
+        period_index = np.argmin(distance, axis=1)
+        return np.where(within.any(axis=1), period_index, -1)
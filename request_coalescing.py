@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import threading
+from instrumentation import metrics
+
+
+class _Call:
+    """One in-flight call and the callers waiting for it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    A class to share one in-flight call between concurrent callers with the
+    same key.
+
+    The first caller for a key runs the call; callers arriving while it is
+    running wait for it and get the same result (or the same exception).
+    Nothing is kept once the call finishes, so later callers run it again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        """
+        Run func, or wait for the call already running under key.
+
+        Returns:
+            Tuple of (result, whether it was shared with an earlier caller)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        """Number of calls currently running"""
+        with self.lock:
+            return len(self.calls)
+
+
+class CoalescingModel:
+    """
+    A class to wrap a generative model so identical concurrent prompts share
+    one API request and outstanding requests are capped.
+
+    Prompts are fingerprinted with the model name and request options. The
+    single-flight table and the semaphore are process-wide, so callers from
+    every Streamlit session share them.
+    """
+
+    def __init__(self, model, name='', flight=None, semaphore=None):
+        """
+        Initialize the CoalescingModel.
+
+        Args:
+            model: Object with a generate_content(prompt, **kwargs) method
+            name: Model name, part of the prompt fingerprint
+            flight: SingleFlight to use (default: the process-wide one)
+            semaphore: Semaphore capping outstanding requests (default: the process-wide one)
+        """
+        self.model = model
+        self.name = name
+        self.flight = flight or single_flight
+        self.semaphore = semaphore or api_semaphore
+
+    def fingerprint(self, prompt, kwargs):
+        """Return a stable key for a request"""
+        payload = json.dumps([self.name, prompt, kwargs], sort_keys=True, default=repr)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def generate_content(self, prompt, **kwargs):
+        """Generate content, sharing the request with concurrent identical prompts"""
+        def request():
+            with self.semaphore:
+                metrics.count('gemini_api_calls')
+                return self.model.generate_content(prompt, **kwargs)
+
+        response, shared = self.flight.do(self.fingerprint(prompt, kwargs), request)
+        if shared:
+            metrics.count('gemini_coalesced_calls')
+        return response
+
+    def create_context(self, text, ttl):
+        """Create a shared context, once for concurrent callers with the same text"""
+        def request():
+            with self.semaphore:
+                metrics.count('gemini_api_calls')
+                return self.model.create_context(text, ttl)
+
+        context, shared = self.flight.do(self.fingerprint(['context', text], {'ttl': ttl}), request)
+        if shared:
+            metrics.count('gemini_coalesced_calls')
+        return context
+
+    def generate_in_context(self, context, prompt, **kwargs):
+        """Generate content for a prompt that refers to a context, sharing identical concurrent requests"""
+        def request():
+            with self.semaphore:
+                metrics.count('gemini_api_calls')
+                return self.model.generate_in_context(context, prompt, **kwargs)
+
+        response, shared = self.flight.do(self.fingerprint([context.key, prompt], kwargs), request)
+        if shared:
+            metrics.count('gemini_coalesced_calls')
+        return response
+
+
+# Process-wide state: imported modules survive Streamlit reruns, the app script does not
+single_flight = SingleFlight()
+api_semaphore = threading.BoundedSemaphore(int(os.getenv('GEMINI_MAX_CONCURRENT', '4')))
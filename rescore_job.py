@@ -0,0 +1,104 @@
+import sys
+import json
+import time
+import argparse
+from statement_pipeline import StatementPipeline
+
+
+class RescoreJob:
+    """
+    A class to re-categorize every processed statement after a model rollout.
+
+    Each statement is re-scored from its stored feature file in one batch
+    predict call, so a rollout costs vectorized inference per statement
+    instead of PDF extraction.
+    """
+
+    def __init__(self, pipeline, metadata_file='pdf_metadata.json'):
+        """
+        Initialize the RescoreJob.
+
+        Args:
+            pipeline: StatementPipeline whose categorizer holds the model to roll out
+            metadata_file: Path to the JSON file listing uploaded statements
+        """
+        self.pipeline = pipeline
+        self.metadata_file = metadata_file
+
+    def statements(self, username=None):
+        """Return (username, pdf_path) of every uploaded statement, optionally for one user"""
+        try:
+            with open(self.metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return []
+        return [(file_data['username'], file_data['filename']) for file_data in metadata.values()
+                if username is None or file_data['username'] == username]
+
+    def run(self, username=None, save=True):
+        """
+        Re-score every processed statement.
+
+        Args:
+            username: Only re-score this user's statements
+            save: Whether to save changed categories (False reports changes only)
+
+        Returns:
+            Dictionary report of the run
+        """
+        report = {'statements': 0, 'not_processed': 0, 'features_rebuilt': 0,
+                  'rows': 0, 'rows_changed': 0, 'failed': []}
+        start = time.perf_counter()
+
+        for owner, pdf_path in self.statements(username):
+            try:
+                result = self.pipeline.rescore(owner, pdf_path, save=save)
+            except Exception as e:
+                print(f"Error re-scoring {pdf_path}: {e}")
+                report['failed'].append({'pdf_path': pdf_path, 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+            if result is None:
+                report['not_processed'] += 1
+                continue
+            report['statements'] += 1
+            report['features_rebuilt'] += result['rebuilt']
+            report['rows'] += result['rows']
+            report['rows_changed'] += result['changed']
+
+        report['seconds'] = time.perf_counter() - start
+        report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-categorize processed statements with a new model")
+    parser.add_argument('--model', help="Model pickle to roll out (default: the installed model)")
+    parser.add_argument('--preprocessor', help="Preprocessor pickle of the new model")
+    parser.add_argument('--username', help="Only re-score this user's statements")
+    parser.add_argument('--metadata', default='pdf_metadata.json', help="JSON file listing uploaded statements")
+    parser.add_argument('--dry-run', action='store_true', help="Report changed categories without saving")
+    args = parser.parse_args()
+
+    pipeline = StatementPipeline()
+    if args.model or args.preprocessor:
+        if not (args.model and args.preprocessor):
+            parser.error("--model and --preprocessor must be given together")
+        if not pipeline.categorizer.load_model(args.model, args.preprocessor):
+            sys.exit(1)
+
+    report = RescoreJob(pipeline, args.metadata).run(args.username, save=not args.dry_run)
+    print(f"Re-scored {report['statements']} statement(s), {report['rows']} rows in {report['seconds']:.1f}s "
+          f"({report['rows_per_second']:.0f} rows/s)")
+    print(f"{report['rows_changed']} row(s) {'would change' if args.dry_run else 'changed'} category; "
+          f"features rebuilt for {report['features_rebuilt']} statement(s); "
+          f"{report['not_processed']} statement(s) not processed yet")
+    for failure in report['failed']:
+        print(f"Failed: {failure['pdf_path']}: {failure['error']}")
+
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import threading
+from collections import deque
+from datetime import datetime
+import numpy as np
+from instrumentation import metrics
+from transaction_categorizer import TransactionCategorizer
+
+
+class ShadowModelEvaluator:
+    """
+    A class to evaluate a candidate categorizer model on live traffic
+    without changing what users see.
+
+    Inside each batch categorization, a sampled fraction of the rows sent to
+    the production model is also scored by the candidate, so the overhead is
+    one extra predict call on a bounded number of rows. Agreement between
+    the two models is counted, and the category distribution of production
+    output is kept over a sliding window of recent rows and compared with a
+    reference window to detect drift. Statistics are kept in a JSON file.
+    """
+
+    # Population stability index above which the category mix counts as drifted
+    DRIFT_THRESHOLD = 0.2
+
+    def __init__(self, model_path, preprocessor_path, sample_rate=0.1, window_size=10000,
+                 stats_file='shadow_stats.json', save_interval=10.0):
+        """
+        Initialize the ShadowModelEvaluator and load the candidate model.
+
+        Args:
+            model_path: Path to the candidate model pickle file
+            preprocessor_path: Path to the candidate preprocessor pickle file
+            sample_rate: Fraction of model-scored rows also scored by the candidate
+            window_size: Rows in the sliding window of recent categories
+            stats_file: Path to the JSON file holding the statistics
+            save_interval: Minimum seconds between two writes of the statistics
+        """
+        self.model_path = model_path
+        self.preprocessor_path = preprocessor_path
+        self.sample_rate = sample_rate
+        self.window_size = window_size
+        self.stats_file = stats_file
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng()
+        self.last_save = 0.0
+
+        with open(model_path, 'rb') as f:
+            self.model = pickle.load(f)
+        with open(preprocessor_path, 'rb') as f:
+            self.preprocessor = pickle.load(f)
+
+        self.load_stats()
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create the evaluator configured by SHADOW_MODEL_PATH, SHADOW_PREPROCESSOR_PATH
+        and SHADOW_SAMPLE_RATE, or return None when no candidate is configured.
+        """
+        model_path = os.getenv('SHADOW_MODEL_PATH')
+        preprocessor_path = os.getenv('SHADOW_PREPROCESSOR_PATH')
+        if not model_path or not preprocessor_path:
+            return None
+        try:
+            return cls(model_path, preprocessor_path, sample_rate=float(os.getenv('SHADOW_SAMPLE_RATE', '0.1')))
+        except Exception as e:
+            print(f"Error loading shadow model: {e}")
+            return None
+
+    def __getstate__(self):
+        # Locks cannot be sent to worker processes
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def empty_stats(self):
+        return {
+            'candidate': {'model_path': self.model_path, 'preprocessor_path': self.preprocessor_path},
+            'since': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'rows': 0,
+            'model_rows': 0,
+            'sampled_rows': 0,
+            'disagreements': 0,
+            'confusion': {},
+            'candidate_counts': {},
+            'window': [],
+            'window_counts': {},
+            'window_rows': 0,
+            'reference': None,
+        }
+
+    def load_stats(self):
+        """Load the statistics, starting over if they belong to another candidate"""
+        try:
+            with open(self.stats_file, 'r') as f:
+                stats = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            stats = None
+
+        candidate = {'model_path': self.model_path, 'preprocessor_path': self.preprocessor_path}
+        if stats is None or stats.get('candidate') != candidate:
+            reference = stats.get('reference') if stats else None
+            stats = self.empty_stats()
+            # Drift is measured on production output, whichever candidate is evaluated
+            stats['reference'] = reference
+        self.stats = stats
+        self.window = deque(stats['window'])
+
+    def save_stats(self, force=False):
+        """Write the statistics, at most once per save interval unless forced"""
+        now = time.monotonic()
+        if not force and now - self.last_save < self.save_interval:
+            return
+        self.last_save = now
+        self.stats['window'] = list(self.window)
+        temp_file = f"{self.stats_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.stats, f, indent=4)
+        os.replace(temp_file, self.stats_file)
+
+    def observe(self, features, categories, model_rows):
+        """
+        Record one batch categorization and shadow-score a sample of its model rows.
+
+        Args:
+            features: DataFrame of extracted features of the batch
+            categories: numpy array of production categories of the batch
+            model_rows: Boolean mask of rows categorized by the production model
+        """
+        candidate = None
+        sample = np.flatnonzero(model_rows)
+        sample = sample[self.rng.random(len(sample)) < self.sample_rate]
+        if len(sample):
+            with metrics.span('shadow_predict') as span:
+                model_features = features.iloc[sample][TransactionCategorizer.MODEL_FEATURES]
+                candidate = self.model.predict(self.preprocessor.transform(model_features))
+                span.add(rows=len(sample))
+
+        values, counts = np.unique(np.asarray(categories, dtype=str), return_counts=True)
+        batch_counts = {str(value): int(count) for value, count in zip(values, counts)}
+
+        with self.lock:
+            stats = self.stats
+            stats['rows'] += len(categories)
+            stats['model_rows'] += int(np.count_nonzero(model_rows))
+
+            if candidate is not None:
+                production = np.asarray(categories)[sample]
+                disagree = production != candidate
+                stats['sampled_rows'] += len(sample)
+                stats['disagreements'] += int(disagree.sum())
+                metrics.count('shadow_rows', len(sample))
+                metrics.count('shadow_disagreements', int(disagree.sum()))
+                for prod, cand in zip(production[disagree], candidate[disagree]):
+                    key = f"{prod}->{cand}"
+                    stats['confusion'][key] = stats['confusion'].get(key, 0) + 1
+                for category in candidate:
+                    stats['candidate_counts'][str(category)] = stats['candidate_counts'].get(str(category), 0) + 1
+
+            self._slide(batch_counts, len(categories))
+            self.save_stats()
+
+    def _slide(self, batch_counts, batch_rows):
+        """Add a batch to the sliding window, evicting the oldest batches past its size"""
+        stats = self.stats
+        self.window.append([batch_counts, batch_rows])
+        for category, count in batch_counts.items():
+            stats['window_counts'][category] = stats['window_counts'].get(category, 0) + count
+        stats['window_rows'] += batch_rows
+
+        while len(self.window) > 1 and stats['window_rows'] - self.window[0][1] >= self.window_size:
+            old_counts, old_rows = self.window.popleft()
+            for category, count in old_counts.items():
+                stats['window_counts'][category] -= count
+                if stats['window_counts'][category] == 0:
+                    del stats['window_counts'][category]
+            stats['window_rows'] -= old_rows
+
+        # The first full window becomes the reference that later windows are compared with
+        if stats['reference'] is None and stats['window_rows'] >= self.window_size:
+            stats['reference'] = dict(stats['window_counts'])
+
+    def population_stability(self, current, reference):
+        """Population stability index between two category count dictionaries"""
+        categories = sorted(set(current) | set(reference))
+        if not categories or not sum(current.values()) or not sum(reference.values()):
+            return 0.0
+        p = np.array([current.get(c, 0) for c in categories], dtype=float)
+        q = np.array([reference.get(c, 0) for c in categories], dtype=float)
+        p = np.clip(p / p.sum(), 1e-4, None)
+        q = np.clip(q / q.sum(), 1e-4, None)
+        return float(np.sum((p - q) * np.log(p / q)))
+
+    def report(self):
+        """
+        Summarize the evidence for promoting the candidate.
+
+        Returns:
+            Dictionary with row counts, the disagreement rate and its 95% Wilson
+            interval, the most common disagreements, and the drift of the
+            production category mix
+        """
+        with self.lock:
+            stats = json.loads(json.dumps(self.stats))
+            self.save_stats(force=True)
+
+        n = stats['sampled_rows']
+        rate = stats['disagreements'] / n if n else 0.0
+        low, high = self.wilson_interval(stats['disagreements'], n)
+        model_share = stats['model_rows'] / stats['rows'] if stats['rows'] else 0.0
+
+        drift = None
+        if stats['reference'] is not None:
+            drift = self.population_stability(stats['window_counts'], stats['reference'])
+
+        return {
+            'candidate': stats['candidate'],
+            'since': stats['since'],
+            'rows': stats['rows'],
+            'model_rows': stats['model_rows'],
+            'sampled_rows': n,
+            'disagreements': stats['disagreements'],
+            'disagreement_rate': rate,
+            'disagreement_interval': (low, high),
+            # Rules are shared, so only model rows can change category
+            'expected_changed_share': rate * model_share,
+            'top_disagreements': sorted(stats['confusion'].items(), key=lambda item: item[1], reverse=True)[:10],
+            'candidate_counts': stats['candidate_counts'],
+            'window_counts': stats['window_counts'],
+            'reference_counts': stats['reference'],
+            'drift': drift,
+            'drifted': drift is not None and drift > self.DRIFT_THRESHOLD,
+        }
+
+    def wilson_interval(self, successes, n, z=1.96):
+        """95% Wilson score interval of a proportion"""
+        if n == 0:
+            return (0.0, 1.0)
+        p = successes / n
+        denominator = 1 + z * z / n
+        centre = (p + z * z / (2 * n)) / denominator
+        margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+        return (float(max(0.0, centre - margin)), float(min(1.0, centre + margin)))
+
+    def reset_reference(self):
+        """Use the current window as the drift reference, e.g. after a promotion"""
+        with self.lock:
+            self.stats['reference'] = dict(self.stats['window_counts']) or None
+            self.save_stats(force=True)
+
+    def promote(self, categorizer, model_path, preprocessor_path):
+        """
+        Make the candidate the production model.
+
+        The candidate files are loaded first, so production is left alone if
+        they are unreadable. The current production files are kept with a
+        timestamp suffix, the candidate files are copied over them and loaded
+        by categorizer, and the comparison statistics start over. If the
+        copies cannot be loaded, the production files are restored.
+
+        Returns:
+            True if the candidate was promoted
+        """
+        if not TransactionCategorizer().load_model(self.model_path, self.preprocessor_path):
+            return False
+
+        suffix = datetime.now().strftime("%Y%m%d_%H%M%S")
+        targets = ((self.model_path, model_path), (self.preprocessor_path, preprocessor_path))
+        backups = {}
+        try:
+            for source, target in targets:
+                # None marks a target that did not exist before
+                backups[target] = f"{target}.{suffix}.bak" if os.path.exists(target) else None
+                if backups[target] is not None:
+                    shutil.copy2(target, backups[target])
+                shutil.copy2(source, target)
+            promoted = categorizer.load_model(model_path, preprocessor_path)
+        except OSError as e:
+            print(f"Error promoting candidate model: {e}")
+            promoted = False
+
+        if not promoted:
+            for target, backup in backups.items():
+                if backup is None:
+                    if os.path.exists(target):
+                        os.remove(target)
+                elif os.path.exists(backup):
+                    shutil.copy2(backup, target)
+            categorizer.load_model(model_path, preprocessor_path)
+            return False
+
+        with self.lock:
+            reference = self.stats['window_counts']
+            self.stats = self.empty_stats()
+            self.stats['reference'] = dict(reference) or None
+            self.window = deque()
+            self.save_stats(force=True)
+        return True
@@ -0,0 +1,271 @@
+import os
+import json
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from file_lock import FileLock
+from statement_cleaning import format_rupees, parse_dates
+
+
+class PeerSpendBenchmark:
+    """
+    A class to compare a user's monthly spend in each category with every
+    other user's, without keeping anyone's transactions.
+
+    Each user's total withdrawals per category and month, over all of their
+    statements, are kept exactly, indexed by category and month, so a
+    comparison reads only the totals of the months it covers. A user's
+    percentile is the share of the other users' totals at or below their
+    own; only users who spent in a category that month are counted.
+    Statements are identified by content, so a statement uploaded twice is
+    counted once, and a category correction moves a statement's amounts
+    between categories. The totals are kept in a JSON file.
+    """
+
+    # Bump when the layout of the file changes; older files are started again
+    STATE_VERSION = 2
+
+    def __init__(self, totals_file='spend_totals.json', min_peers=10):
+        """
+        Initialize the PeerSpendBenchmark.
+
+        Args:
+            totals_file: Path to the JSON file holding the totals
+            min_peers: Other users' monthly totals a comparison needs before it is reported
+        """
+        self.totals_file = totals_file
+        self.min_peers = min_peers
+
+        # Statements can be ingested concurrently by background workers and the batch CLI
+        self.lock = FileLock(self.totals_file)
+        self.state = None
+        self.stamp = None
+
+    def empty_state(self):
+        return {'version': self.STATE_VERSION, 'statements': {}, 'totals': {}}
+
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.totals_file)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def load(self):
+        """Return the totals, reading the file again only if it changed"""
+        stamp = self.file_stamp()
+        if self.state is None or stamp != self.stamp:
+            try:
+                with open(self.totals_file, 'r') as f:
+                    self.state = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self.state = self.empty_state()
+            if self.state.get('version') != self.STATE_VERSION:
+                print(f"{self.totals_file} is from an older version; starting the spend totals again "
+                      "(--backfill rebuilds them)")
+                self.state = self.empty_state()
+            self.stamp = stamp
+        return self.state
+
+    def save(self, state):
+        temp_file = f"{self.totals_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_file, self.totals_file)
+        self.state = state
+        self.stamp = self.file_stamp()
+
+    def version(self):
+        """Return a stamp that changes whenever any user's totals change"""
+        return self.file_stamp()
+
+    def update(self, username, monthly_spend, statement_id):
+        """
+        Add a statement's monthly category totals to the user's totals.
+
+        Args:
+            username: Owner of the statement
+            monthly_spend: DataFrame with 'Month' ('YYYY-MM'), 'Category' and
+                'Amount' (withdrawals in paise) columns; rows of the same
+                month and category are added up
+            statement_id: Identifier of the statement (its content hash), so it is only counted once
+
+        Returns:
+            True if the statement was added, False if it was already counted
+        """
+        totals = self.monthly_totals(monthly_spend)
+
+        with self.lock:
+            state = self.load()
+            statements = state['statements'].setdefault(username, [])
+            if statement_id in statements:
+                return False
+
+            self.add_totals(state, username, totals)
+            statements.append(statement_id)
+            self.save(state)
+            return True
+
+    def move(self, username, old_spend, new_spend, statement_id):
+        """
+        Replace part of a counted statement's spend, such as rows whose category was corrected.
+
+        Args:
+            username: Owner of the statement
+            old_spend: monthly_spend of the rows as they were counted
+            new_spend: monthly_spend of the same rows now
+            statement_id: Identifier of the statement
+
+        Returns:
+            True if the totals changed, False if the statement was never counted
+        """
+        removed = {key: -amount for key, amount in self.monthly_totals(old_spend).items()}
+        added = self.monthly_totals(new_spend)
+
+        with self.lock:
+            state = self.load()
+            if statement_id not in state['statements'].get(username, []):
+                return False
+            self.add_totals(state, username, removed)
+            self.add_totals(state, username, added)
+            self.save(state)
+            return True
+
+    def add_totals(self, state, username, totals):
+        """Add (category, month) -> paise amounts to a user's totals, dropping totals that reach zero"""
+        for (category, month), amount in totals.items():
+            users = state['totals'].setdefault(category, {}).setdefault(month, {})
+            total = users.get(username, 0) + amount
+            if total > 0:
+                users[username] = total
+            else:
+                users.pop(username, None)
+
+    def monthly_spend(self, df):
+        """Return a statement's withdrawals as Month ('YYYY-MM'), Category and Amount (paise) totals"""
+        if not {'Date', 'Category', 'Withdrawl'}.issubset(df.columns):
+            return pd.DataFrame({'Month': [], 'Category': [], 'Amount': []})
+
+        withdrawals = df[df['Withdrawl'] > 0]
+        spend = pd.DataFrame({'Month': parse_dates(withdrawals['Date']).dt.strftime('%Y-%m'),
+                              'Category': withdrawals['Category'].astype(str),
+                              'Amount': withdrawals['Withdrawl'].astype('int64')})
+        spend = spend[spend['Month'].notna()]
+        return spend.groupby(['Month', 'Category'], as_index=False)['Amount'].sum()
+
+    def monthly_totals(self, monthly_spend):
+        """Return a dictionary of (category, month) -> total spend in paise, for totals above zero"""
+        totals = monthly_spend.groupby([monthly_spend['Category'].astype(str), 'Month'])['Amount'].sum()
+        return {(category, month): int(amount) for (category, month), amount in totals.items() if amount > 0}
+
+    def peer_totals(self, category, months, username=None):
+        """
+        Return the monthly totals of a category over some months.
+
+        Returns:
+            Tuple of (sorted array of every other user's totals, dictionary of
+            month -> the user's own total for the months they have one)
+        """
+        with self.lock:
+            by_month = self.load()['totals'].get(category, {})
+            peers = [amount for month in months for user, amount in by_month.get(month, {}).items()
+                     if user != username]
+            own = {month: by_month[month][username] for month in months
+                   if username is not None and username in by_month.get(month, {})}
+        return np.sort(np.array(peers, dtype='int64')), own
+
+    def compare(self, df, username=None):
+        """
+        Compare a user's monthly spend per category with the other users' totals of the same months.
+
+        Args:
+            df: Categorized statement DataFrame; its months and categories are compared
+            username: Owner of the statement; their stored totals are used as
+                their monthly spend and left out of the peers
+
+        Returns:
+            DataFrame with 'Category', 'MonthlySpend' (average, paise),
+            'PeerMedian' (paise), 'Percentile' (share of other users' totals
+            at or below the user's, 0-100) and 'Peers' (other users' monthly
+            totals compared), for categories with at least min_peers of
+            them, highest spend first
+        """
+        by_category = {}
+        for (category, month), amount in self.monthly_totals(self.monthly_spend(df)).items():
+            by_category.setdefault(category, {})[month] = amount
+
+        rows = []
+        for category, months in by_category.items():
+            peers, own = self.peer_totals(category, months, username)
+            if len(peers) < self.min_peers:
+                continue
+            # Once the statement is recorded, the stored total covers all of the user's statements of the month
+            months = {**months, **own}
+            average = int(round(sum(months.values()) / len(months)))
+            rows.append({'Category': category, 'MonthlySpend': average, 'PeerMedian': int(np.median(peers)),
+                         'Percentile': 100 * np.searchsorted(peers, average, side='right') / len(peers),
+                         'Peers': len(peers)})
+
+        columns = ['Category', 'MonthlySpend', 'PeerMedian', 'Percentile', 'Peers']
+        return pd.DataFrame(rows, columns=columns).sort_values('MonthlySpend', ascending=False, ignore_index=True)
+
+    def format_for_summary(self, comparison):
+        """Format a comparison as bullet points for text summaries"""
+        if comparison is None or comparison.empty:
+            return "* Not enough data from other users yet\n"
+
+        lines = ""
+        for _, row in comparison.iterrows():
+            lines += (f"* {row['Category']}: {format_rupees(row['MonthlySpend'])} per month, more than "
+                      f"{row['Percentile']:.0f}% of other users who spend in this category "
+                      f"(median {format_rupees(row['PeerMedian'])})\n")
+        return lines
+
+
+def backfill(benchmark, metadata_file):
+    """Add the processed statements listed in metadata_file that are not in the totals yet"""
+    from statement_pipeline import StatementPipeline
+    pipeline = StatementPipeline()
+    pipeline.peer_benchmark = benchmark
+
+    with open(metadata_file, 'r') as f:
+        metadata = json.load(f)
+
+    added = 0
+    for file_data in metadata.values():
+        df = pipeline.load_dataframe(file_data['filename'])
+        # Like the anomaly statistics, the totals only count statements that reconcile
+        if df is None or not pipeline.validate(df)['valid']:
+            continue
+        added += benchmark.update(file_data['username'], benchmark.monthly_spend(df),
+                                  pipeline.statement_id(file_data['filename']))
+    print(f"Added {added} statement(s) to the spend totals")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the distribution of monthly spend per category across users")
+    parser.add_argument('--category', action='append', help="Category to show (repeatable; default: all)")
+    parser.add_argument('--month', action='append', help="Month to include, YYYY-MM (repeatable; default: all)")
+    parser.add_argument('--totals', default='spend_totals.json', help="Spend totals file")
+    parser.add_argument('--backfill', action='store_true',
+                        help="First add processed statements that are not in the totals yet")
+    parser.add_argument('--metadata', default='pdf_metadata.json', help="JSON file listing uploaded statements")
+    args = parser.parse_args()
+
+    benchmark = PeerSpendBenchmark(args.totals)
+    if args.backfill:
+        backfill(benchmark, args.metadata)
+    totals = benchmark.load()['totals']
+
+    print(f"{'category':24} {'totals':>7} {'p25':>14} {'median':>14} {'p75':>14} {'p90':>14}")
+    for category in sorted(args.category or totals):
+        peers, _ = benchmark.peer_totals(category, args.month or sorted(totals.get(category, {})))
+        if len(peers) == 0:
+            continue
+        quantiles = [format_rupees(int(np.quantile(peers, q, method='lower'))) for q in (0.25, 0.5, 0.75, 0.9)]
+        print(f"{category:24} {len(peers):>7} " + " ".join(f"{value:>14}" for value in quantiles))
+
+
+if __name__ == '__main__':
+    main()
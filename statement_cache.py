@@ -0,0 +1,142 @@
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+from instrumentation import metrics
+
+
+class StatementCache:
+    """
+    A class to keep the loaded DataFrame of a statement and everything
+    derived from it (aggregates, summaries, search index, rendered charts)
+    in memory between Streamlit reruns.
+
+    Entries are keyed by username, the content hash of the uploaded PDF and
+    the name of the derived value. Each entry also remembers the version of
+    the processed statement it was computed from, so a re-ingested statement
+    is never served stale, and the least recently used entries are evicted
+    once the cache grows past its memory budget.
+    """
+
+    def __init__(self, version_func, max_bytes=256 * 1024 * 1024, max_hashes=4096):
+        """
+        Initialize the StatementCache.
+
+        Args:
+            version_func: Function returning a stamp of a statement's processed data from its PDF path
+            max_bytes: Approximate memory budget of the cached values
+            max_hashes: Number of file content hashes remembered
+        """
+        self.version_func = version_func
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+        # (path, size, mtime) -> content hash, so unchanged PDFs are hashed once;
+        # least recently used hashes are forgotten past max_hashes
+        self.max_hashes = max_hashes
+        self.hashes = OrderedDict()
+
+    def get(self, username, pdf_path, name, compute, depends_on=None):
+        """
+        Return a cached value for a statement, computing it on a miss.
+
+        Args:
+            username: Owner of the statement
+            pdf_path: Path of the uploaded PDF
+            name: Name of the derived value (e.g. 'df', 'category_summary')
+            compute: Function computing the value; None results are not cached
+            depends_on: Stamp of other data the value is computed from, such
+                as other users' totals; a changed stamp recomputes the value
+
+        Returns:
+            The cached or freshly computed value
+        """
+        key = (username, self.content_hash(pdf_path), name)
+        version = (self.version_func(pdf_path), depends_on)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['version'] == version:
+                self.entries.move_to_end(key)
+                metrics.count('statement_cache_hits')
+                return entry['value']
+        metrics.count('statement_cache_misses')
+
+        value = compute()
+        if value is None:
+            return value
+
+        size = self.estimate_size(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)['size']
+            # Values larger than the whole budget are returned but not kept
+            if size <= self.max_bytes:
+                self.entries[key] = {'value': value, 'version': version, 'size': size}
+                self.total_bytes += size
+                self._evict()
+        return value
+
+    def invalidate(self, username, pdf_path=None):
+        """Drop the cached values of one statement, or of all of a user's statements"""
+        content_hash = self.content_hash(pdf_path) if pdf_path else None
+        with self.lock:
+            for key in [key for key in self.entries
+                        if key[0] == username and (content_hash is None or key[1] == content_hash)]:
+                self.total_bytes -= self.entries.pop(key)['size']
+
+    def clear(self):
+        """Drop every cached value"""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def content_hash(self, path):
+        """Return the SHA-256 of a file, hashing it again only when it changes"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        stamp = (path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            content_hash = self.hashes.get(stamp)
+            if content_hash is not None:
+                self.hashes.move_to_end(stamp)
+                return content_hash
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        content_hash = sha256.hexdigest()
+
+        with self.lock:
+            self.hashes[stamp] = content_hash
+            while len(self.hashes) > self.max_hashes:
+                self.hashes.popitem(last=False)
+        return content_hash
+
+    def estimate_size(self, value):
+        """Approximate the memory held by a cached value"""
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            size = value.memory_usage(deep=True)
+            return int(size.sum() if isinstance(value, pd.DataFrame) else size)
+        if isinstance(value, (bytes, str)):
+            return len(value)
+        if isinstance(value, dict):
+            return sum(self.estimate_size(item) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(self.estimate_size(item) for item in value)
+        return sys.getsizeof(value)
+
+    def _evict(self):
+        """Evict least recently used entries until the cache fits its budget"""
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry['size']
+            metrics.count('statement_cache_evictions')
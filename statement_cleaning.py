@@ -0,0 +1,207 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Column names that hold money, across the layouts we parse
+MONETARY_COLUMN_PATTERN = re.compile(r'withdraw|deposit|balance|debit|credit|amount', re.IGNORECASE)
+
+# Transaction amounts: a blank cell means nothing moved in that direction
+TRANSACTION_AMOUNT_COLUMNS = ['Withdrawl', 'Deposit']
+
+# Amounts are kept as integer paise; rupees only appear when rendering
+PAISE_PER_RUPEE = 100
+
+# Suffix of monetary columns in the persisted statement format
+PAISE_SUFFIX = '_paise'
+
+# Text columns held as categoricals: few distinct values, or repetitive descriptions
+CATEGORICAL_COLUMNS = ['Category', 'Particulars']
+
+# Columns that are always categorical, however many distinct values they have
+ALWAYS_CATEGORICAL_COLUMNS = ['Category']
+
+# Largest share of distinct values for which a description column is made categorical;
+# descriptions that are mostly unique (reference numbers) take more room as categories
+MAX_CATEGORICAL_DISTINCT_SHARE = 0.5
+
+# Currency symbols, Cr/Dr markers, digit grouping and brackets around an amount
+# (the marker may follow the digits without a space, as in '1,234.00Dr')
+AMOUNT_NOISE_PATTERN = r'(?i)(?:(?:cr|dr)\.?$)|₹|\brs\.?|\binr\b|[,\s()+]'
+
+
+def monetary_columns(columns):
+    """Return the columns of a statement table that hold money"""
+    return [col for col in columns if MONETARY_COLUMN_PATTERN.search(str(col))]
+
+
+def clean_amounts(values, signed=False):
+    """
+    Convert a column of printed amounts to float64 with vectorized string operations.
+
+    Handles Indian digit grouping ('1,23,456.00'), currency symbols, 'Cr'/'Dr'
+    markers, bracketed negatives and blank or '-' cells (NaN).
+
+    Args:
+        values: pandas Series of extracted cells
+        signed: Whether a 'Dr' marker makes the amount negative, as on balances
+
+    Returns:
+        float64 Series aligned with values
+
+    Examples:
+        >>> clean_amounts(pd.Series(['1,234.00Dr', '1,234.00 Cr', 'Rs. 50', '-'])).tolist()
+        [1234.0, 1234.0, 50.0, nan]
+        >>> clean_amounts(pd.Series(['1,234.00Dr', '2,000.00 dr.', '500.00Cr']), signed=True).tolist()
+        [-1234.0, -2000.0, 500.0]
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype('float64')
+
+    text = values.where(values.notna(), '').astype(str).str.strip()
+    negative = (text.str.startswith('-') & (text != '-')) | (text.str.startswith('(') & text.str.endswith(')'))
+    if signed:
+        negative |= text.str.contains(r'(?i)dr\.?$', regex=True)
+
+    digits = text.str.replace(AMOUNT_NOISE_PATTERN, '', regex=True).str.lstrip('-')
+    amounts = pd.to_numeric(digits.where(digits != '', None), errors='coerce').astype('float64')
+    return amounts.where(~negative.to_numpy(), -amounts)
+
+
+def to_paise(amounts):
+    """Convert float rupee amounts to nullable int64 paise, rounding to the nearest paisa"""
+    return (amounts.astype('float64') * PAISE_PER_RUPEE).round().astype('Int64')
+
+
+def to_rupees(paise):
+    """Convert paise (a Series or a single value) to float rupees, for display and models"""
+    if isinstance(paise, pd.Series):
+        return paise.astype('float64') / PAISE_PER_RUPEE
+    return int(paise) / PAISE_PER_RUPEE
+
+
+def format_rupees(paise):
+    """Format an amount in paise exactly, e.g. 123456 -> '₹1234.56'"""
+    paise = int(paise)
+    rupees, remainder = divmod(abs(paise), PAISE_PER_RUPEE)
+    return f"₹{'-' if paise < 0 else ''}{rupees}.{remainder:02d}"
+
+
+def rupee_view(df):
+    """Return a copy of a statement with its monetary columns in float rupees, for rendering"""
+    view = df.copy()
+    for col in monetary_columns(view.columns):
+        if pd.api.types.is_integer_dtype(view[col]):
+            view[col] = to_rupees(view[col])
+    return view
+
+
+def clean_statement(df):
+    """
+    Give a statement table typed columns, once, right after extraction.
+
+    Monetary columns become int64 paise. Blank withdrawals and deposits
+    become 0, while blank balances stay missing (nullable Int64) so rows
+    without one can be told apart. Other columns are kept as extracted text.
+
+    Args:
+        df: DataFrame built from the extracted rows, or a legacy processed
+            statement with amounts in rupees
+
+    Returns:
+        Cleaned copy of df
+    """
+    df = df.copy()
+    for col in monetary_columns(df.columns):
+        amounts = clean_amounts(df[col], signed='balance' in str(col).lower())
+
+        present = df[col].notna() & ~df[col].astype(str).str.strip().isin(['', '-'])
+        unreadable = int((amounts.isna() & present).sum())
+        if unreadable:
+            print(f"Could not read {unreadable} amount(s) in column {col}")
+
+        paise = to_paise(amounts)
+        if col in TRANSACTION_AMOUNT_COLUMNS:
+            paise = paise.fillna(0).astype('int64')
+        df[col] = paise
+    return df
+
+
+def compact_statement(df):
+    """
+    Hold the repetitive text columns of a statement as categoricals.
+
+    Each distinct value is then stored once, with a small integer code per
+    row, so the frame takes less memory and groupbys and filters on these
+    columns run on the codes. Descriptions are only converted when they
+    repeat enough to be smaller that way.
+
+    Args:
+        df: Cleaned statement DataFrame
+
+    Returns:
+        df with its categorical columns converted (a copy if anything changed)
+    """
+    converted = {}
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns or isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        if col in ALWAYS_CATEGORICAL_COLUMNS or df[col].nunique() <= MAX_CATEGORICAL_DISTINCT_SHARE * len(df):
+            converted[col] = df[col].astype('category')
+    return df.assign(**converted) if converted else df
+
+
+def distinct_values(values):
+    """
+    Prepare a text column so per-value work runs once per distinct value.
+
+    Categorical columns give their categories, plus a missing value for rows
+    without one; other columns are returned as they are, one value per row.
+
+    Args:
+        values: pandas Series
+
+    Returns:
+        Tuple of (Series of values with a RangeIndex, numpy array giving the
+        position in it of every row of values)
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        codes = values.cat.codes.to_numpy()
+        uniques = pd.Series(list(categories) + [None], dtype=object)
+        return uniques, np.where(codes < 0, len(categories), codes)
+    return values.reset_index(drop=True), np.arange(len(values))
+
+
+def parse_dates(dates):
+    """Parse a statement Date column ('04-Jun-2024' or '2024-06-04'), NaT where it cannot"""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates
+    text = dates.where(dates.map(lambda value: isinstance(value, str)), None)
+    parsed = pd.to_datetime(text, format='%d-%b-%Y', errors='coerce')
+    missing = parsed.isna() & text.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(text[missing], format='%Y-%m-%d', errors='coerce')
+    return parsed
+
+
+def to_persisted(df):
+    """Name monetary columns with their unit for the persisted statement format"""
+    return df.rename(columns={col: f"{col}{PAISE_SUFFIX}" for col in monetary_columns(df.columns)})
+
+
+def from_persisted(df):
+    """
+    Read a persisted statement back into the in-memory format.
+
+    Statements saved before amounts were kept in paise have plain column
+    names and rupee (or unparsed) amounts, and go through clean_statement.
+    """
+    paise_columns = [col for col in df.columns if str(col).endswith(PAISE_SUFFIX)]
+    if not paise_columns:
+        return clean_statement(df)
+
+    df = df.rename(columns={col: col[:-len(PAISE_SUFFIX)] for col in paise_columns})
+    for col in paise_columns:
+        col = col[:-len(PAISE_SUFFIX)]
+        df[col] = df[col].astype('int64' if df[col].notna().all() else 'Int64')
+    return df
@@ -0,0 +1,221 @@
+import os
+import json
+import pandas as pd
+from statement_cleaning import parse_dates
+
+# Bump whenever the stored columns or their meaning change; older files are rebuilt
+CUBE_SCHEMA_VERSION = 1
+
+# Dimensions of a cube cell, and its measures
+CUBE_DIMENSIONS = ['Day', 'Category', 'Type', 'Payee']
+CUBE_MEASURES = ['Count', 'Amount']
+
+# Time levels a cube can be rolled up to
+CUBE_LEVELS = ['day', 'week', 'month']
+
+# Payee of the cells that add up every payee of a day, category and type
+ALL_PAYEES = '*'
+
+# Parquet file metadata keys holding the schema version and the processed statement it was built from
+SCHEMA_METADATA_KEY = b'cube_schema_version'
+SOURCE_METADATA_KEY = b'cube_source_version'
+
+
+class StatementCube:
+    """
+    A class to keep a pre-aggregated cube of every processed statement, so
+    the analysis page can slice it by date range, category, transaction type
+    and payee without regrouping the transactions.
+
+    A cube holds one cell per day, category, type ('Withdrawal' or
+    'Deposit') and payee key, with the number of transactions and their
+    total in paise, plus cells with the payee ALL_PAYEES adding up every
+    payee. Payees are often nearly unique per transaction, so queries that
+    do not filter or group by payee read only those much smaller rollup
+    cells. Weeks and months are rolled up from days when queried.
+    Cubes are stored as Parquet files next to the PDF, together with the
+    version of the processed statement they were built from, so a cube that
+    is older than its statement is treated as missing. Parquet support needs
+    pyarrow; without it nothing is stored.
+    """
+
+    def __init__(self):
+        try:
+            import pyarrow  # noqa: F401
+            self.available = True
+        except ImportError:
+            print("pyarrow is not installed; statement cubes will not be stored")
+            self.available = False
+
+    def cube_path(self, pdf_path):
+        """Return the path of the cube file for a statement"""
+        return pdf_path + ".cube.parquet"
+
+    def build(self, df, payees):
+        """
+        Aggregate a statement into a cube.
+
+        Args:
+            df: Processed statement DataFrame (amounts in paise)
+            payees: Payee keys of its rows, as returned by
+                TransactionCategorizer.normalize_payees
+
+        Returns:
+            DataFrame with the CUBE_DIMENSIONS and CUBE_MEASURES columns,
+            one row per non-empty cell, rollup cells included
+        """
+        days = parse_dates(df['Date']).dt.normalize() if 'Date' in df.columns else pd.Series(pd.NaT, index=df.index)
+        categories = df['Category'].astype(str) if 'Category' in df.columns else pd.Series('OTHER', index=df.index)
+        payees = pd.Series(payees, index=df.index).astype(str)
+
+        parts = []
+        for column, kind in (('Withdrawl', 'Withdrawal'), ('Deposit', 'Deposit')):
+            if column not in df.columns:
+                continue
+            rows = df[column] > 0
+            parts.append(pd.DataFrame({'Day': days[rows], 'Category': categories[rows], 'Type': kind,
+                                       'Payee': payees[rows], 'Amount': df.loc[rows, column].astype('int64')}))
+        if not parts:
+            return self.compact(pd.DataFrame(columns=CUBE_DIMENSIONS + CUBE_MEASURES))
+
+        entries = pd.concat(parts, ignore_index=True).dropna(subset=['Day'])
+        cells = entries.groupby(CUBE_DIMENSIONS, sort=True)['Amount'].agg(Count='size', Amount='sum').reset_index()
+        return self.with_rollup(cells)
+
+    def with_rollup(self, cells):
+        """Add the ALL_PAYEES cells to the payee cells of a cube"""
+        rollup = cells.groupby(['Day', 'Category', 'Type'], observed=True, sort=True)[CUBE_MEASURES].sum()
+        rollup = rollup.reset_index().assign(Payee=ALL_PAYEES)
+        cube = pd.concat([cells.astype({'Category': str, 'Type': str, 'Payee': str}),
+                          rollup.astype({'Category': str, 'Type': str})], ignore_index=True)
+        return self.compact(cube.sort_values(CUBE_DIMENSIONS, ignore_index=True))
+
+    def compact(self, cube):
+        """Give a cube its stored dtypes: dictionary-encoded dimensions and integer measures"""
+        return pd.DataFrame({
+            'Day': pd.to_datetime(cube['Day']).astype('datetime64[ns]'),
+            'Category': cube['Category'].astype(str).astype('category'),
+            'Type': cube['Type'].astype(str).astype('category'),
+            'Payee': cube['Payee'].astype(str).astype('category'),
+            'Count': cube['Count'].astype('int32'),
+            'Amount': cube['Amount'].astype('int64'),
+        })
+
+    def replace_payee(self, cube, payee, df, payees):
+        """
+        Rebuild the cells of one payee, leaving every other cell as it is.
+
+        Args:
+            cube: Cube of the statement
+            payee: Payee key whose transactions changed
+            df: Every row of the statement with that payee key
+            payees: Payee keys of those rows
+
+        Returns:
+            Updated cube
+        """
+        kept = cube[~cube['Payee'].astype(str).isin([payee, ALL_PAYEES])]
+        rebuilt = self.build(df, payees)
+        rebuilt = rebuilt[rebuilt['Payee'].astype(str) != ALL_PAYEES]
+        # The payee's transactions may have moved category, so the rollup is added up again
+        cells = pd.concat([kept.astype({col: str for col in ('Category', 'Type', 'Payee')}),
+                           rebuilt.astype({col: str for col in ('Category', 'Type', 'Payee')})], ignore_index=True)
+        return self.with_rollup(cells)
+
+    def save(self, pdf_path, cube, source_version):
+        """
+        Store the cube of a statement.
+
+        Args:
+            pdf_path: Path of the uploaded PDF
+            cube: Cube from build
+            source_version: Version of the processed statement it was built from
+
+        Returns:
+            Path of the cube file, or None if cubes cannot be stored
+        """
+        if not self.available:
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(cube.reset_index(drop=True), preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               SCHEMA_METADATA_KEY: json.dumps(CUBE_SCHEMA_VERSION).encode(),
+                                               SOURCE_METADATA_KEY: json.dumps(source_version).encode()})
+
+        path = self.cube_path(pdf_path)
+        temp_file = f"{path}.tmp"
+        pq.write_table(table, temp_file, compression='zstd')
+        os.replace(temp_file, path)
+        return path
+
+    def load(self, pdf_path, source_version):
+        """
+        Load the cube of a statement.
+
+        Returns:
+            Cube DataFrame, or None if it is missing, of another schema
+            version or built from another version of the statement
+        """
+        path = self.cube_path(pdf_path)
+        if not self.available or not os.path.exists(path):
+            return None
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        metadata = table.schema.metadata or {}
+        try:
+            schema_version = json.loads(metadata.get(SCHEMA_METADATA_KEY, b'null'))
+            stored_source = json.loads(metadata.get(SOURCE_METADATA_KEY, b'null'))
+        except ValueError:
+            return None
+        if schema_version != CUBE_SCHEMA_VERSION or stored_source != json.loads(json.dumps(source_version)):
+            return None
+        return self.compact(table.to_pandas())
+
+    def query(self, cube, level='month', start=None, end=None, categories=None, types=None, payees=None,
+              by=('Period',)):
+        """
+        Slice and roll up a cube.
+
+        Args:
+            cube: Cube of a statement
+            level: Time level of the 'Period' dimension, one of CUBE_LEVELS
+            start: First day included (default: the earliest)
+            end: Last day included (default: the latest)
+            categories: Categories included (default: all)
+            types: Transaction types included (default: both)
+            payees: Payee keys included (default: all)
+            by: Dimensions to group by, from 'Period', 'Category', 'Type' and 'Payee'
+
+        Returns:
+            DataFrame with the by columns, Count and Amount (paise), one row
+            per non-empty group in order of the by columns
+        """
+        if level not in CUBE_LEVELS:
+            raise ValueError(f"Unknown cube level: {level}")
+
+        # Only the rollup cells are needed unless payees are filtered or grouped by
+        rollup = cube['Payee'] == ALL_PAYEES
+        selected = ~rollup if payees is not None or 'Payee' in by else rollup
+        if start is not None:
+            selected &= cube['Day'] >= pd.Timestamp(start)
+        if end is not None:
+            selected &= cube['Day'] <= pd.Timestamp(end)
+        for column, values in (('Category', categories), ('Type', types), ('Payee', payees)):
+            if values is not None:
+                selected &= cube[column].isin(list(values))
+        cells = cube[selected]
+
+        if 'Period' in by:
+            if level == 'day':
+                period = cells['Day']
+            elif level == 'week':
+                # Weeks start on Monday
+                period = cells['Day'] - pd.to_timedelta(cells['Day'].dt.dayofweek, unit='D')
+            else:
+                period = cells['Day'].dt.to_period('M').dt.start_time
+            cells = cells.assign(Period=period)
+
+        return cells.groupby(list(by), observed=True, sort=True)[CUBE_MEASURES].sum().reset_index()
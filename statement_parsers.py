@@ -0,0 +1,291 @@
+import os
+import pdfplumber
+from instrumentation import metrics
+
+
+class StatementParser:
+    """
+    Base class for bank statement layouts.
+
+    Each layout declares a cheap signature that is checked against the text
+    of the first page only, and knows where its transaction table sits on
+    each page. This generic parser is the fallback for unknown layouts and
+    lets pdfplumber guess the table on every page.
+
+    Layouts with a known table area can also use the text-layer fast path:
+    column x-ranges are learned from the header row on page 1, and the words
+    of every later page are bucketed into those columns instead of running
+    pdfplumber's table finder again. This only saves the table finder;
+    pdfminer still reads every page's characters, which dominates
+    extraction, so the gain is modest.
+    """
+
+    name = 'Generic'
+
+    # pdfplumber table settings; empty means let pdfplumber guess
+    table_settings = {}
+
+    # Only layouts with a fixed table area can skip table detection
+    supports_text_layer = False
+
+    # Vertical distance (points) within which words belong to the same line
+    line_tolerance = 3
+
+    def __init__(self):
+        self.mode = 'table detection'
+
+    def matches(self, first_page_text):
+        """Return True if the first page text looks like this layout"""
+        return True
+
+    def table_area(self, page, page_num):
+        """Return the (x0, top, x1, bottom) area holding the table, or None for the whole page"""
+        return None
+
+    def extract(self, pdf, progress_callback=None, fast=True):
+        """
+        Extract the transaction table from an open PDF.
+
+        Args:
+            pdf: Open pdfplumber PDF
+            progress_callback: Optional function called as (page_num, page_count, rows_found)
+            fast: Try the text-layer fast path when the layout supports it
+
+        Returns:
+            Tuple of (column_names, rows), or (None, []) if no table was found.
+            A 'Page' column holding each row's page number is appended.
+        """
+        all_data = []
+        row_pages = []
+        column_names = None
+        columns_x = None
+
+        for page_num, page in enumerate(pdf.pages, 1):
+            if page_num == 1 and fast and self.supports_text_layer:
+                extracted_table, columns_x = self.learn_text_layer(page)
+            elif columns_x:
+                extracted_table = self.extract_page_words(page, page_num, columns_x)
+            else:
+                extracted_table = self.extract_page_table(page, page_num)
+
+            if extracted_table:
+                # For the first table with data, get column names
+                if column_names is None:
+                    column_names = extracted_table[0]
+                    page_rows = extracted_table[1:]
+                elif extracted_table[0] == column_names:
+                    # Same structure, skip header
+                    page_rows = extracted_table[1:]
+                else:
+                    # Different header structure, add as is
+                    page_rows = extracted_table
+                all_data.extend(page_rows)
+                row_pages.extend([page_num] * len(page_rows))
+
+            if progress_callback:
+                progress_callback(page_num, len(pdf.pages), len(extracted_table) if extracted_table else 0)
+
+        if column_names is None:
+            return None, []
+
+        # Rows from other pages can be wider or narrower than the header
+        width = len(column_names)
+        all_data = [(row + [None] * width)[:width] + [page] for row, page in zip(all_data, row_pages)]
+        return column_names + ['Page'], all_data
+
+    def extract_page_table(self, page, page_num):
+        """Extract the table of a single page with pdfplumber's table finder"""
+        return self.clean_table(self.crop(page, page_num).extract_table(self.table_settings))
+
+    def learn_text_layer(self, page):
+        """
+        Learn column x-ranges from the page 1 header row and verify the fast path.
+
+        The page is read with the table finder, the header cells give the
+        column boundaries, and the same page is re-read from its words. The
+        fast path is only enabled when both readings agree exactly.
+
+        Returns:
+            Tuple of (page 1 table, column x-ranges or None on mismatch)
+        """
+        found = self.crop(page, 1).find_table(self.table_settings)
+        if found is None:
+            return None, None
+
+        table = self.clean_table(found.extract())
+        header_cells = found.rows[0].cells
+        if any(cell is None for cell in header_cells) or len(header_cells) != len(table[0]):
+            return table, None
+
+        columns_x = [(cell[0], cell[2]) for cell in header_cells]
+        if self.extract_page_words(page, 1, columns_x) != table:
+            # Reported in the extraction mode and the metrics, so layouts that drift can be found
+            metrics.count('text_layer_mismatches')
+            self.mode = 'table detection, text layer mismatch'
+            return table, None
+
+        self.mode = 'text layer'
+        return table, columns_x
+
+    def extract_page_words(self, page, page_num, columns_x):
+        """
+        Extract the table of a single page by bucketing words into known columns.
+
+        A line with text in the first column starts a new row; lines without
+        it continue the previous row, matching how wrapped cells are read by
+        the table finder.
+        """
+        # Filtering words by the table area is much cheaper than cropping the
+        # page, which would copy every line and curve object too
+        area = self.table_area(page, page_num)
+        words = page.extract_words()
+        if area:
+            words = [word for word in words
+                     if word['x0'] >= area[0] and word['top'] >= area[1]
+                     and word['x1'] <= area[2] and word['bottom'] <= area[3]]
+        words.sort(key=lambda word: (word['top'], word['x0']))
+
+        rows = []
+        line_top = None
+        line_cells = None
+        for word in words + [None]:
+            if word is None or line_top is None or word['top'] - line_top > self.line_tolerance:
+                if line_cells is not None:
+                    self.add_line(rows, [' '.join(cell) for cell in line_cells])
+                if word is None:
+                    break
+                line_top = word['top']
+                line_cells = [[] for _ in columns_x]
+
+            middle = (word['x0'] + word['x1']) / 2
+            for index, (x0, x1) in enumerate(columns_x):
+                if x0 <= middle < x1:
+                    line_cells[index].append(word['text'])
+                    break
+
+        return rows
+
+    def add_line(self, rows, texts):
+        """Start a new row from a line, or append it to the row it continues"""
+        if not any(texts):
+            return
+        if texts[0] or not rows:
+            rows.append(texts)
+            return
+        for index, text in enumerate(texts):
+            if text:
+                rows[-1][index] = f"{rows[-1][index]}\n{text}" if rows[-1][index] else text
+
+    def crop(self, page, page_num):
+        """Crop a page to its table area when the layout declares one"""
+        area = self.table_area(page, page_num)
+        return page.crop(area) if area else page
+
+    def clean_table(self, table):
+        """Drop placeholder columns from an extracted table"""
+        if not table:
+            return table
+
+        # pdfplumber reports cells spanned by a merged cell as None; columns
+        # that are mostly None are artifacts of the ruling, not data
+        keep = [col for col in range(len(table[0]))
+                if sum(row[col] is None for row in table) * 2 <= len(table)]
+        return [[row[col] for col in keep] for row in table]
+
+
+class IndusIndStatementParser(StatementParser):
+    """
+    Parser for IndusInd Bank account statements.
+
+    The transaction table sits at a fixed position below the account banner
+    and uses fixed column rulings, so each page is cropped to the table and
+    read with explicit vertical lines instead of letting pdfplumber search
+    the whole page for tables.
+    """
+
+    name = 'IndusInd'
+
+    # Column rulings and table area shared by every page of the statement
+    VERTICAL_LINES = [30, 107, 251, 328, 405, 482, 565]
+    CONTINUATION_TOP = 82
+    TABLE_BOTTOM = 760
+
+    table_settings = {
+        'vertical_strategy': 'explicit',
+        'explicit_vertical_lines': VERTICAL_LINES,
+        'horizontal_strategy': 'lines',
+    }
+
+    supports_text_layer = True
+
+    def __init__(self):
+        super().__init__()
+        self.first_page_top = None
+
+    def matches(self, first_page_text):
+        """IndusInd statements name the bank and carry the standard header row"""
+        return ('IndusInd Bank' in first_page_text
+                and 'Particulars' in first_page_text and 'Withdrawl' in first_page_text)
+
+    def table_area(self, page, page_num):
+        """The table starts at the header row on page 1 and below the banner afterwards"""
+        if page_num == 1:
+            if self.first_page_top is None:
+                self.first_page_top = self.find_header_top(page)
+            top = self.first_page_top
+        else:
+            top = self.CONTINUATION_TOP
+
+        if top is None:
+            return None
+        return (self.VERTICAL_LINES[0], top, self.VERTICAL_LINES[-1], self.TABLE_BOTTOM)
+
+    def find_header_top(self, page):
+        """Return the top of the transaction header row on the first page"""
+        for word in page.extract_words():
+            if word['text'] == 'Particulars':
+                return word['top'] - 5
+        return None
+
+
+# Layout-specific parsers are tried in order; the generic parser always matches
+STATEMENT_PARSERS = [IndusIndStatementParser, StatementParser]
+
+
+def detect_parser(pdf):
+    """
+    Pick the parser for a statement by looking at its first page only.
+
+    Args:
+        pdf: Open pdfplumber PDF
+
+    Returns:
+        StatementParser instance for the detected layout
+    """
+    first_page_text = (pdf.pages[0].extract_text() or '') if pdf.pages else ''
+    for parser_class in STATEMENT_PARSERS:
+        parser = parser_class()
+        if parser.matches(first_page_text):
+            return parser
+    return StatementParser()
+
+
+def extract_statement_table(pdf_path, password=None, progress_callback=None, fast=True):
+    """
+    Detect the layout of a statement PDF and extract its transaction table.
+
+    Args:
+        pdf_path: Path to the statement PDF
+        password: Password for protected PDFs
+        progress_callback: Optional function called as (page_num, page_count, rows_found)
+        fast: Try the text-layer fast path when the layout supports it
+
+    Returns:
+        Tuple of (column_names, rows, description of the parser and mode used)
+    """
+    with metrics.span('extract') as span:
+        with pdfplumber.open(pdf_path, password=password) as pdf:
+            parser = detect_parser(pdf)
+            column_names, rows = parser.extract(pdf, progress_callback, fast)
+            span.add(pages=len(pdf.pages), rows=len(rows), bytes=os.path.getsize(pdf_path))
+    return column_names, rows, f"{parser.name} ({parser.mode})"
@@ -0,0 +1,574 @@
+import os
+import json
+import uuid
+import threading
+from datetime import datetime
+import pandas as pd
+from transaction_categorizer import TransactionCategorizer
+from anomaly_detector import CategoryAnomalyDetector
+from statement_parsers import extract_statement_table
+from statement_vault import StatementVault
+from statement_cache import StatementCache
+from statement_cleaning import (clean_statement, compact_statement, rupee_view, to_persisted, from_persisted,
+                                parse_dates)
+from statement_validation import BalanceContinuityValidator
+from merchant_knowledge import MerchantKnowledgeBase
+from merchant_sketches import MerchantSketchStore
+from spend_quantiles import PeerSpendBenchmark
+from feature_store import FeatureStore
+from statement_cube import StatementCube
+from shadow_model import ShadowModelEvaluator
+from instrumentation import metrics
+
+# Uploads and batch runs add statements to the same metadata file
+_metadata_lock = threading.Lock()
+
+
+def register_statement(username, filename, original_filename, metadata_file='pdf_metadata.json'):
+    """
+    Add a statement to the metadata file listing every user's statements.
+
+    The pages, the re-score job and the sketch backfills find statements
+    through this file, so every way of adding a statement registers it here.
+
+    Args:
+        username: Owner of the statement
+        filename: Path of the PDF, next to which the processed statement is saved
+        original_filename: Name of the file as uploaded
+        metadata_file: Path to the metadata file
+
+    Returns:
+        ID of the entry; a statement registered before keeps its entry
+    """
+    # The app registers paths relative to its working directory; other callers
+    # pass absolute ones, which are stored the same way when they lie inside it
+    filename = os.path.abspath(filename)
+    if os.path.commonpath([filename, os.getcwd()]) == os.getcwd():
+        filename = os.path.relpath(filename)
+
+    with _metadata_lock:
+        try:
+            with open(metadata_file, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            metadata = {}
+
+        for file_id, file_data in metadata.items():
+            if file_data['username'] == username and os.path.abspath(file_data['filename']) == os.path.abspath(filename):
+                return file_id
+
+        file_id = str(uuid.uuid4())
+        metadata[file_id] = {
+            'username': username,
+            'filename': filename,
+            'original_filename': original_filename,
+            'upload_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'file_size': os.path.getsize(filename)
+        }
+
+        temp_file = f"{metadata_file}.{threading.get_ident()}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(temp_file, metadata_file)
+        return file_id
+
+
+class StatementPipeline:
+    """
+    A class that runs the statement ingestion pipeline without any UI:
+    extraction (or a vault hit), cleaning, categorization, anomaly scoring
+    and persistence.
+
+    It is shared by the Streamlit pages and the background ingestion
+    workers, so it reports progress through callbacks instead of writing
+    to the page.
+    """
+
+    # Rows categorized between two progress reports
+    CATEGORIZE_CHUNK_SIZE = 500
+
+    def __init__(self, base_dir=None, shadow=True):
+        """
+        Initialize the pipeline and its components.
+
+        Args:
+            base_dir: Directory holding the model files (default: this file's directory)
+            shadow: Whether a configured candidate model is evaluated in shadow;
+                off in worker processes, so one process owns the shadow statistics
+        """
+        base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+
+        # Shared merchant categories and per-user corrections
+        self.knowledge_base = MerchantKnowledgeBase()
+
+        # Initialize transaction categorizer
+        model_path = os.path.join(base_dir, 'transaction_categorizer_model.pkl')
+        preprocessor_path = os.path.join(base_dir, 'transaction_preprocessor.pkl')
+        self.categorizer = TransactionCategorizer(model_path if os.path.exists(model_path) else None,
+                                                  preprocessor_path if os.path.exists(preprocessor_path) else None,
+                                                  knowledge_base=self.knowledge_base)
+        self.model_path = model_path
+        self.preprocessor_path = preprocessor_path
+
+        # Candidate model scored in shadow on a sample of rows, when configured
+        self.categorizer.shadow = ShadowModelEvaluator.from_env() if shadow else None
+
+        # Initialize per-category anomaly detector
+        self.anomaly_detector = CategoryAnomalyDetector()
+
+        # Top merchants per user and month, and across all users
+        self.merchant_sketches = MerchantSketchStore()
+
+        # Distribution of every user's monthly spend per category, for peer comparisons
+        self.peer_benchmark = PeerSpendBenchmark()
+
+        # Balance-continuity checks and repairs of extracted tables
+        self.validator = BalanceContinuityValidator()
+
+        # Categorizer features of processed statements, for re-scoring with new models
+        self.feature_store = FeatureStore()
+
+        # Pre-aggregated cube of each processed statement, for drilldowns on the analysis page
+        self.cube = StatementCube()
+
+        # Processed statements are kept as Parquet when pyarrow is installed
+        self.parquet_available = self.feature_store.available
+
+        # Encrypted store of extracted statements, so PDFs are decrypted only once
+        self.statement_vault = StatementVault()
+
+        # Loaded statements and derived views, kept between page reruns
+        cache_mb = int(os.getenv('STATEMENT_CACHE_MB', '256'))
+        self.statement_cache = StatementCache(self.processed_version, max_bytes=cache_mb * 1024 * 1024)
+
+    def extract_rows(self, pdf_path, password=None, progress_callback=None):
+        """
+        Return the raw extracted table of a statement, parsing the PDF only once.
+
+        Args:
+            pdf_path: Path of the uploaded PDF
+            password: Password for protected PDFs (only needed on first extraction)
+            progress_callback: Optional function called as (page_num, page_count, rows_found)
+
+        Returns:
+            Tuple of (column_names, rows, parser_name)
+        """
+        # Reuse the decrypted table from the vault if this PDF was already parsed
+        cached = self.statement_vault.load(pdf_path)
+        if cached is not None:
+            metrics.count('vault_hits')
+            return cached
+        metrics.count('vault_misses')
+
+        # Detect the statement layout from page 1 and extract every page with it
+        column_names, rows, parser_name = extract_statement_table(pdf_path, password, progress_callback)
+
+        # Keep the decrypted table encrypted at rest for later re-processing
+        if rows and column_names:
+            self.statement_vault.store(pdf_path, column_names, rows, parser_name)
+        return column_names, rows, parser_name
+
+    def build_dataframe(self, column_names, rows):
+        """Build a cleaned transaction DataFrame from extracted rows, repairing extraction artifacts"""
+        with metrics.span('clean') as span:
+            df = pd.DataFrame(rows, columns=column_names)
+
+            # Header rows merged in from pages with a different header
+            df, headers_removed = self.validator.remove_header_rows(df)
+
+            # Monetary columns are typed once here, as int64 paise
+            df = clean_statement(df)
+
+            # Drop NaN rows that don't contain essential information
+            if 'Particulars' in df.columns:
+                df = df.dropna(subset=['Particulars'])
+            if 'Balance' in df.columns:
+                df = df.dropna(subset=['Balance'])
+                df['Balance'] = df['Balance'].astype('int64')
+
+            # Rows read twice where a table continues on the next page
+            df, seam_duplicates_removed = self.validator.remove_seam_duplicates(df)
+            span.add(rows=len(df))
+
+        if headers_removed or seam_duplicates_removed:
+            print(f"Repaired extraction: removed {headers_removed} repeated header row(s) "
+                  f"and {seam_duplicates_removed} page-seam duplicate(s)")
+            metrics.count('repaired_header_rows', headers_removed)
+            metrics.count('repaired_seam_duplicates', seam_duplicates_removed)
+        return df.reset_index(drop=True)
+
+    def validate(self, df):
+        """Check that a statement reconciles with its running balance"""
+        with metrics.span('validate') as span:
+            report = self.validator.validate(df)
+            span.add(rows=len(df))
+        if report['checked'] and not report['valid']:
+            metrics.count('balance_breaks', report['breaks'])
+        return report
+
+    def categorize(self, df, progress_callback=None, username=None):
+        """
+        Categorize a DataFrame in chunks so progress can be reported.
+
+        Args:
+            df: Cleaned transaction DataFrame
+            progress_callback: Optional function called as (rows_done, rows_total)
+            username: User whose merchant corrections apply, if any
+
+        Returns:
+            DataFrame with added 'Category' column
+        """
+        return self.categorize_with_features(df, progress_callback, username)[0]
+
+    def categorize_with_features(self, df, progress_callback=None, username=None):
+        """
+        Categorize a DataFrame in chunks, keeping the extracted features.
+
+        The categorizer's rules and model work in rupees, so it is given a
+        rupee view of each chunk while the amounts in df stay in paise.
+
+        Returns:
+            Tuple of (DataFrame with added categorical 'Category' column,
+            features DataFrame with a 'PayeeKey' column, aligned with it)
+        """
+        chunks = []
+        feature_chunks = []
+        with metrics.span('categorize') as span:
+            for start in range(0, len(df), self.CATEGORIZE_CHUNK_SIZE):
+                chunk = df.iloc[start:start + self.CATEGORIZE_CHUNK_SIZE]
+                features = self.extract_features(chunk)
+                known = self.categorizer.known_payee_categories(features['PayeeKey'], username)
+                chunks.append(chunk.assign(Category=self.categorizer.categorize_features(features, known)))
+                feature_chunks.append(features)
+                if progress_callback:
+                    progress_callback(min(start + self.CATEGORIZE_CHUNK_SIZE, len(df)), len(df))
+            span.add(rows=len(df))
+
+        if not chunks:
+            return compact_statement(df.assign(Category=pd.Series(dtype=object))), self.extract_features(df)
+        # Categories and repetitive descriptions are held as categoricals from here on
+        return compact_statement(pd.concat(chunks)), pd.concat(feature_chunks)
+
+    def extract_features(self, df):
+        """Extract the categorizer features of a statement, with the payee key used by the knowledge base"""
+        features = self.categorizer.extract_features_batch(rupee_view(df))
+        if 'Particulars' in df.columns:
+            features['PayeeKey'] = self.categorizer.normalize_payees(df['Particulars'])
+        else:
+            features['PayeeKey'] = ''
+        return features
+
+    def process(self, pdf_path, password=None, page_callback=None, row_callback=None, username=None):
+        """
+        Extract, clean, categorize and validate one statement, without changing
+        any per-user state, so it can run in a separate worker process.
+
+        Args:
+            pdf_path: Path of the uploaded PDF
+            password: Password for protected PDFs
+            page_callback: Optional function called as (page_num, page_count, rows_found)
+            row_callback: Optional function called as (rows_done, rows_total)
+            username: User whose merchant corrections apply, if any
+
+        Returns:
+            Tuple of (categorized DataFrame, balance-continuity report), or
+            (None, None) if no transaction table was found
+        """
+        column_names, rows, parser_name = self.extract_rows(pdf_path, password, page_callback)
+        if not rows or not column_names:
+            return None, None
+
+        df = self.build_dataframe(column_names, rows)
+        categorized_df, features = self.categorize_with_features(df, row_callback, username)
+
+        # Features are kept, so a new model can re-score without extracting again
+        with metrics.span('save_features') as span:
+            self.feature_store.save(pdf_path, features)
+            span.add(rows=len(features))
+        return categorized_df, self.validate(categorized_df)
+
+    def record(self, username, categorized_df, validation, pdf_path):
+        """
+        Score a processed statement against the user's history and persist it.
+
+        Statements that do not reconcile are scored but kept out of the history.
+
+        Returns:
+            Scored DataFrame; its attrs['validation'] holds the balance-continuity report
+        """
+        # A statement uploaded again under another name is still counted once
+        statement_id = self.statement_id(pdf_path)
+
+        # Score withdrawals against the user's category history
+        with metrics.span('anomaly_score') as span:
+            if validation['valid']:
+                categorized_df = self.anomaly_detector.score_and_update(username, categorized_df, statement_id)
+            else:
+                print(f"{pdf_path}: {self.validator.describe(validation)}")
+                categorized_df = self.anomaly_detector.score(username, categorized_df)
+            span.add(rows=len(categorized_df))
+        categorized_df.attrs['validation'] = validation
+
+        # The sketches and spend totals, like the category statistics, only count statements that reconcile
+        if validation['valid']:
+            self.record_merchants(username, categorized_df, statement_id)
+            self.record_spend(username, categorized_df, statement_id)
+
+        self.save_dataframe(categorized_df, pdf_path)
+        self.save_cube(pdf_path, self.build_cube(categorized_df))
+
+        # New statements change the user's category statistics, which feed
+        # the summaries of every statement, so drop all of the user's views
+        self.statement_cache.invalidate(username)
+        return categorized_df
+
+    def statement_id(self, pdf_path):
+        """Identify a statement by the content hash of its PDF (its path if the file is gone)"""
+        return self.statement_cache.content_hash(pdf_path) or pdf_path
+
+    def merchant_activity(self, df):
+        """Return the withdrawals of a statement as Month ('YYYY-MM'), Merchant and Amount (paise) rows"""
+        if not {'Date', 'Particulars', 'Withdrawl'}.issubset(df.columns):
+            return pd.DataFrame({'Month': [], 'Merchant': [], 'Amount': []})
+
+        withdrawals = df[df['Withdrawl'] > 0]
+        activity = pd.DataFrame({'Month': parse_dates(withdrawals['Date']).dt.strftime('%Y-%m'),
+                                 'Merchant': self.categorizer.normalize_payees(withdrawals['Particulars']),
+                                 'Amount': withdrawals['Withdrawl'].astype('int64')})
+        return activity[activity['Month'].notna() & (activity['Merchant'] != '')]
+
+    def record_merchants(self, username, df, statement_id):
+        """Merge a statement's withdrawals into the top-merchant sketches, once per statement_id"""
+        with metrics.span('merchant_sketch') as span:
+            activity = self.merchant_activity(df)
+            self.merchant_sketches.update(username, activity, statement_id)
+            span.add(rows=len(activity))
+
+    def record_spend(self, username, df, statement_id):
+        """Add a statement's monthly category totals to the peer spend totals, once per statement_id"""
+        with metrics.span('spend_totals') as span:
+            spend = self.peer_benchmark.monthly_spend(df)
+            self.peer_benchmark.update(username, spend, statement_id)
+            span.add(rows=len(spend))
+
+    def ingest(self, username, pdf_path, password=None, page_callback=None, row_callback=None):
+        """
+        Run the full pipeline for one statement and persist the result.
+
+        Args:
+            username: Owner of the statement
+            pdf_path: Path of the uploaded PDF
+            password: Password for protected PDFs
+            page_callback: Optional function called as (page_num, page_count, rows_found)
+            row_callback: Optional function called as (rows_done, rows_total)
+
+        Returns:
+            Categorized DataFrame, or None if no transaction table was found.
+            Its attrs['validation'] holds the balance-continuity report.
+        """
+        categorized_df, validation = self.process(pdf_path, password, page_callback, row_callback, username)
+        if categorized_df is None:
+            return None
+        return self.record(username, categorized_df, validation, pdf_path)
+
+    def recategorize_payee(self, username, payee, pdf_paths):
+        """
+        Re-categorize one payee's transactions after its category was corrected.
+
+        Only the matching rows of each processed statement are categorized
+        again, through the knowledge base, and only statements that changed
+        are saved; nothing is extracted again. The rows are moved between
+        categories in the anomaly statistics and the peer spend totals too.
+
+        Args:
+            username: Owner of the statements
+            payee: Payee key, as returned by TransactionCategorizer.normalize_payees
+            pdf_paths: Paths of the user's statements
+
+        Returns:
+            Number of transactions whose category changed
+        """
+        changed = 0
+        with metrics.span('recategorize_payee') as span:
+            for pdf_path in pdf_paths:
+                df = self.load_dataframe(pdf_path)
+                if df is None or 'Category' not in df.columns or 'Particulars' not in df.columns:
+                    continue
+
+                matches = (self.categorizer.normalize_payees(df['Particulars']) == payee).to_numpy()
+                if not matches.any():
+                    continue
+
+                categories = self.categorizer.categorize_batch(rupee_view(df[matches]), username, observe=False)
+                updated = df['Category'].to_numpy(dtype=object).copy()
+                moved = int((updated[matches] != categories).sum())
+                if moved:
+                    # Only the payee's cells of the cube change, if it is up to date
+                    cube = self.cube.load(pdf_path, self.processed_version(pdf_path))
+
+                    old_rows = df[matches].copy()
+
+                    # The corrected category may be new to the categorical column
+                    updated[matches] = categories
+                    df['Category'] = pd.Categorical(updated)
+                    self.save_dataframe(df, pdf_path)
+
+                    # The derived stores only hold the statement if it reconciled; they check that themselves
+                    statement_id = self.statement_id(pdf_path)
+                    self.anomaly_detector.move(username, old_rows, df[matches], statement_id)
+                    self.peer_benchmark.move(username, self.peer_benchmark.monthly_spend(old_rows),
+                                             self.peer_benchmark.monthly_spend(df[matches]), statement_id)
+                    if cube is None:
+                        cube = self.build_cube(df)
+                    else:
+                        cube = self.cube.replace_payee(cube, payee, df[matches], [payee] * int(matches.sum()))
+                    self.save_cube(pdf_path, cube)
+                    changed += moved
+                span.add(rows=int(matches.sum()))
+
+        # Category totals and summaries of the user's statements are stale now
+        self.statement_cache.invalidate(username)
+        return changed
+
+    def rescore(self, username, pdf_path, save=True):
+        """
+        Re-categorize a processed statement with the current model from its stored features.
+
+        Statements processed before features were stored have them rebuilt
+        from the processed statement, which also needs no extraction.
+
+        Args:
+            username: Owner of the statement
+            pdf_path: Path of the uploaded PDF
+            save: Whether to save the statement when categories change
+
+        Returns:
+            Dictionary with 'rows', 'changed' and 'rebuilt' (whether features
+            had to be rebuilt), or None if the statement has not been processed
+        """
+        df = self.load_dataframe(pdf_path)
+        if df is None:
+            return None
+
+        features = self.feature_store.load(pdf_path)
+        rebuilt = features is None or len(features) != len(df)
+        if rebuilt:
+            features = self.extract_features(df)
+            self.feature_store.save(pdf_path, features)
+
+        with metrics.span('rescore') as span:
+            known = self.categorizer.known_payee_categories(features['PayeeKey'], username)
+            # Re-scoring stored statements is not live traffic for the shadow comparison
+            categories = self.categorizer.categorize_features(features, known, observe=False)
+            span.add(rows=len(df))
+
+        previous = df['Category'].to_numpy(dtype=object) if 'Category' in df.columns else None
+        changed = len(df) if previous is None else int((previous != categories).sum())
+        if changed and save:
+            df['Category'] = pd.Categorical(categories)
+            self.save_dataframe(df, pdf_path)
+            self.save_cube(pdf_path, self.build_cube(df, features['PayeeKey']))
+            self.statement_cache.invalidate(username, pdf_path)
+        return {'rows': len(df), 'changed': changed, 'rebuilt': rebuilt}
+
+    def build_cube(self, df, payees=None):
+        """
+        Aggregate a processed statement into its cube.
+
+        Args:
+            df: Processed statement DataFrame
+            payees: Payee keys of its rows, if already known (e.g. from stored features)
+        """
+        with metrics.span('build_cube') as span:
+            if payees is None:
+                payees = (self.categorizer.normalize_payees(df['Particulars']) if 'Particulars' in df.columns
+                          else pd.Series('', index=df.index))
+            cube = self.cube.build(df, payees.to_numpy() if isinstance(payees, pd.Series) else payees)
+            span.add(rows=len(df), cells=len(cube))
+        return cube
+
+    def save_cube(self, pdf_path, cube):
+        """Store the cube of a statement, stamped with the version of the statement just saved"""
+        self.cube.save(pdf_path, cube, self.processed_version(pdf_path))
+
+    def load_cube(self, pdf_path, df=None):
+        """
+        Load the cube of a processed statement, building it if it is missing or out of date.
+
+        Args:
+            pdf_path: Path of the uploaded PDF
+            df: The processed statement, if already loaded
+
+        Returns:
+            Cube DataFrame, or None if the statement has not been processed
+        """
+        cube = self.cube.load(pdf_path, self.processed_version(pdf_path))
+        if cube is not None:
+            return cube
+
+        # Statements processed before cubes existed, or saved without updating theirs
+        df = self.load_dataframe(pdf_path) if df is None else df
+        if df is None:
+            return None
+        cube = self.build_cube(df)
+        self.save_cube(pdf_path, cube)
+        return cube
+
+    def processed_path(self, pdf_path):
+        """
+        Return the path of the processed statement for a PDF.
+
+        Statements are kept as Parquet; statements processed before, or
+        without pyarrow, are CSV files until they are saved again.
+        """
+        parquet_path = pdf_path + ".parquet"
+        csv_path = pdf_path + ".csv"
+        if self.parquet_available and (os.path.exists(parquet_path) or not os.path.exists(csv_path)):
+            return parquet_path
+        return csv_path
+
+    def processed_version(self, pdf_path):
+        """Return a stamp that changes whenever a statement is processed again"""
+        try:
+            stat = os.stat(self.processed_path(pdf_path))
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def save_dataframe(self, df, pdf_path):
+        """
+        Save a processed statement next to its PDF.
+
+        Categorical columns are written to Parquet as dictionary-encoded
+        columns and read back as categoricals. A CSV file of the statement
+        from before is replaced.
+        """
+        persisted = to_persisted(compact_statement(df))
+        persisted.attrs = {}
+        with metrics.span('save_statement') as span:
+            if self.parquet_available:
+                path = pdf_path + ".parquet"
+                temp_file = f"{path}.tmp"
+                persisted.to_parquet(temp_file, index=False, compression='zstd')
+                os.replace(temp_file, path)
+                if os.path.exists(pdf_path + ".csv"):
+                    os.remove(pdf_path + ".csv")
+            else:
+                path = pdf_path + ".csv"
+                persisted.to_csv(path, index=False)
+            span.add(rows=len(df), bytes=os.path.getsize(path))
+        return path
+
+    def load_dataframe(self, pdf_path):
+        """Load a processed statement, or None if it has not been processed"""
+        path = self.processed_path(pdf_path)
+        if os.path.exists(path):
+            with metrics.span('load_statement') as span:
+                if path.endswith(".parquet"):
+                    df = from_persisted(pd.read_parquet(path))
+                else:
+                    # Statements processed before amounts were kept in paise are converted
+                    df = compact_statement(from_persisted(pd.read_csv(path)))
+                span.add(rows=len(df), bytes=os.path.getsize(path))
+            return df
+        return None
@@ -0,0 +1,179 @@
+from instrumentation import metrics
+from statement_cleaning import format_rupees
+
+
+class StatementSummarizer:
+    """
+    A class to build the text summaries of a categorized statement that are
+    shown on the analysis page and sent to Gemini.
+
+    It has no UI dependencies, so the same summaries can be built by the
+    Streamlit pages and by offline tools such as the benchmark.
+    """
+
+    def __init__(self, recurring_detector, anomaly_detector, merchant_sketches=None, peer_benchmark=None):
+        """
+        Initialize the StatementSummarizer.
+
+        Args:
+            recurring_detector: RecurringPaymentDetector used for the recurring payments section
+            anomaly_detector: CategoryAnomalyDetector used for the unusual transactions section
+            merchant_sketches: Optional MerchantSketchStore used for the top merchants
+                across the user's statements
+            peer_benchmark: Optional PeerSpendBenchmark used to compare category
+                spend with other users
+        """
+        self.recurring_detector = recurring_detector
+        self.anomaly_detector = anomaly_detector
+        self.merchant_sketches = merchant_sketches
+        self.peer_benchmark = peer_benchmark
+
+    @metrics.timed('gemini_summary')
+    def build_gemini_summary(self, df, username):
+        """Extract category data from DataFrame in a format optimized for Gemini AI"""
+        if df is None or 'Category' not in df.columns:
+            return "No category data available."
+            
+        try:
+            # Create a detailed summary specifically formatted for Gemini
+            gemini_summary = "Transaction Analysis:\n\n"
+            
+            # 1. Basic transaction stats
+            gemini_summary += f"Total Transactions: {len(df)}\n"
+            gemini_summary += f"Date Range: {df['Date'].min()} to {df['Date'].max() if 'Date' in df.columns else 'Unknown'}\n\n"
+            
+            # 2. Category breakdown
+            gemini_summary += "## Category Distribution:\n"
+            category_counts = df['Category'].value_counts()
+            # Categorical columns also count categories no row uses
+            category_counts = category_counts[category_counts > 0]
+            total_count = len(df)
+            for category, count in category_counts.items():
+                percentage = (count / total_count) * 100
+                gemini_summary += f"* {category}: {count} transactions ({percentage:.1f}%)\n"
+            
+            # 3. Financial summary - if withdrawal/deposit columns exist
+            if 'Withdrawl' in df.columns and 'Deposit' in df.columns:
+                # Amounts are int64 paise, so every total below is exact
+                totals = self.category_totals(df)
+                total_expense = int(totals['Withdrawl'].sum())
+                total_income = int(totals['Deposit'].sum())
+                net_flow = total_income - total_expense
+                
+                gemini_summary += "\n## Financial Summary:\n"
+                gemini_summary += f"* Total Expenses: {format_rupees(total_expense)}\n"
+                gemini_summary += f"* Total Income: {format_rupees(total_income)}\n"
+                gemini_summary += f"* Net Cash Flow: {format_rupees(net_flow)} ({net_flow >= 0 and 'Positive' or 'Negative'})\n\n"
+                
+                # 4. Category-wise spending
+                gemini_summary += "## Spending by Category:\n"
+                category_expenses = totals['Withdrawl'].sort_values(ascending=False)
+                for category, amount in category_expenses.items():
+                    if amount > 0:  # Only include categories with expenses
+                        percent = (amount / total_expense) * 100
+                        gemini_summary += f"* {category}: {format_rupees(amount)} ({percent:.1f}% of total expenses)\n"
+                
+                # 5. Category-wise income
+                if total_income > 0:
+                    gemini_summary += "\n## Income by Category:\n"
+                    category_income = totals['Deposit'].sort_values(ascending=False)
+                    for category, amount in category_income.items():
+                        if amount > 0:  # Only include categories with income
+                            percent = (amount / total_income) * 100
+                            gemini_summary += f"* {category}: {format_rupees(amount)} ({percent:.1f}% of total income)\n"
+            
+            # 6. Common merchants/particulars if available
+            if 'Particulars' in df.columns:
+                gemini_summary += "\n## Common Transaction Descriptions:\n"
+                common_descriptions = df['Particulars'].value_counts().head(5)
+                common_descriptions = common_descriptions[common_descriptions > 0]
+                for desc, count in common_descriptions.items():
+                    gemini_summary += f"* \"{desc}\": {count} transactions\n"
+            
+            # Top merchants across all of the user's statements, from the merchant sketches
+            if self.merchant_sketches is not None:
+                gemini_summary += "\n## Top Merchants Across All Statements:\n"
+                top = self.merchant_sketches.top(5, [username])
+                gemini_summary += self.merchant_sketches.format_for_summary(top)
+            
+            # Monthly category spend against all other users, from the spend totals
+            if self.peer_benchmark is not None:
+                gemini_summary += "\n## Spending Compared With Other Users:\n"
+                gemini_summary += self.peer_benchmark.format_for_summary(self.peer_benchmark.compare(df, username))
+            
+            # 7. Recurring payments and subscriptions
+            if 'Particulars' in df.columns and 'Withdrawl' in df.columns:
+                gemini_summary += "\n## Recurring Payments & Subscriptions:\n"
+                recurring = self.recurring_detector.detect(df)
+                gemini_summary += self.recurring_detector.format_for_summary(recurring)
+            
+            # 8. Unusual spends compared with the user's history per category
+            if 'Withdrawl' in df.columns:
+                gemini_summary += "\n## Unusual Transactions:\n"
+                scored_df = df if 'AnomalyScore' in df.columns else self.anomaly_detector.score(username, df)
+                flagged = self.anomaly_detector.flagged(scored_df)
+                gemini_summary += self.anomaly_detector.format_for_summary(flagged, username)
+            
+            return gemini_summary
+        
+        except Exception as e:
+            return f"Error generating category data for Gemini: {str(e)}"
+
+    def build_category_summary(self, df):
+        """Generate a summary of spending by category"""
+        if 'Category' not in df.columns:
+            return "No category data available"
+            
+        try:
+            # Handle withdrawals and deposits if they exist
+            if 'Withdrawl' in df.columns and 'Deposit' in df.columns:
+                # Calculate withdrawals (expenses) and deposits (income) by category
+                totals = self.category_totals(df)
+                category_expenses = totals['Withdrawl'].sort_values(ascending=False)
+                category_income = totals['Deposit'].sort_values(ascending=False)
+                
+                # Generate summary text
+                summary_text = "Transaction Summary:\n\n"
+                
+                summary_text += "Expenses by Category:\n"
+                for category, amount in category_expenses.items():
+                    if amount > 0:  # Only include categories with expenses
+                        summary_text += f"- {category}: {format_rupees(amount)}\n"
+                
+                summary_text += "\nIncome by Category:\n"
+                for category, amount in category_income.items():
+                    if amount > 0:  # Only include categories with income
+                        summary_text += f"- {category}: {format_rupees(amount)}\n"
+                
+                # Calculate totals
+                total_expense = int(totals['Withdrawl'].sum())
+                total_income = int(totals['Deposit'].sum())
+                net_flow = total_income - total_expense
+                
+                summary_text += f"\nTotal Expense: {format_rupees(total_expense)}"
+                summary_text += f"\nTotal Income: {format_rupees(total_income)}"
+                summary_text += f"\nNet Cash Flow: {format_rupees(net_flow)} ({'Positive' if net_flow >= 0 else 'Negative'})"
+                
+                return summary_text
+            else:
+                # If no withdrawals/deposits columns, just count transactions by category
+                category_counts = df['Category'].value_counts()
+                category_counts = category_counts[category_counts > 0]
+                
+                summary_text = "Transaction Categories:\n\n"
+                for category, count in category_counts.items():
+                    summary_text += f"- {category}: {count} transactions\n"
+                
+                return summary_text
+                
+        except Exception as e:
+            return f"Error generating summary: {str(e)}"
+
+    def category_totals(self, df):
+        """
+        Sum withdrawals and deposits (int64 paise) per category in one integer groupby.
+
+        The categorical Category column is grouped on its codes, and only
+        categories that occur are returned.
+        """
+        return df.groupby('Category', observed=True)[['Withdrawl', 'Deposit']].sum()
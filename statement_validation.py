@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+
+class BalanceContinuityValidator:
+    """
+    A class to check that an extracted statement is complete and in order.
+
+    Every row must satisfy previous balance - withdrawal + deposit = balance.
+    The check runs as one vectorized diff over the int64 paise columns, so
+    it is exact and costs about the same as a column sum. Breaks are
+    reported per page, which is where extraction goes wrong: headers read
+    as data, rows repeated across a page seam, or rows dropped.
+    """
+
+    REQUIRED_COLUMNS = ['Withdrawl', 'Deposit', 'Balance']
+
+    def remove_header_rows(self, df):
+        """
+        Drop rows that repeat the table header, before amounts are parsed.
+
+        Pages whose header differs slightly from page 1 are merged as whole
+        tables, so their header row ends up among the transactions.
+
+        Returns:
+            Tuple of (DataFrame without header rows, number of rows removed)
+        """
+        data_columns = [col for col in df.columns if col != 'Page']
+        if df.empty or not data_columns:
+            return df, 0
+
+        cells = df[data_columns].astype(str).apply(lambda col: col.str.strip().str.lower())
+        names = pd.Series([str(col).strip().lower() for col in data_columns], index=data_columns)
+        is_header = cells.eq(names, axis=1).sum(axis=1) * 2 > len(data_columns)
+        return df[~is_header], int(is_header.sum())
+
+    def remove_seam_duplicates(self, df):
+        """
+        Drop rows repeated across a page boundary.
+
+        A row identical to the row before it, down to the balance, that is
+        the first row of a new page is the previous page's last row read
+        twice; a genuine repeat payment would have moved the balance.
+
+        Returns:
+            Tuple of (DataFrame without seam duplicates, number of rows removed)
+        """
+        if len(df) < 2 or 'Page' not in df.columns:
+            return df, 0
+
+        data_columns = [col for col in df.columns if col != 'Page']
+        current = df[data_columns]
+        previous = current.shift(1)
+        same_as_previous = (current.eq(previous) | (current.isna() & previous.isna())).all(axis=1)
+        new_page = df['Page'].ne(df['Page'].shift(1))
+        duplicate = same_as_previous & new_page
+        duplicate.iloc[0] = False
+        return df[~duplicate], int(duplicate.sum())
+
+    def validate(self, df):
+        """
+        Check the balance continuity of a cleaned statement.
+
+        Args:
+            df: Statement with int64 paise 'Withdrawl', 'Deposit' and 'Balance'
+                columns and, when available, a 'Page' column
+
+        Returns:
+            Dictionary with 'checked', 'valid', 'rows', 'breaks', 'pages_with_breaks'
+            ({page: break count}) and 'break_rows' (details of the first breaks)
+        """
+        report = {'checked': False, 'valid': True, 'rows': len(df), 'breaks': 0,
+                  'pages_with_breaks': {}, 'break_rows': []}
+        if not all(col in df.columns for col in self.REQUIRED_COLUMNS) or len(df) < 2:
+            return report
+        if df['Balance'].isna().any():
+            report.update(checked=True, valid=False, breaks=int(df['Balance'].isna().sum()))
+            return report
+
+        withdrawl = df['Withdrawl'].to_numpy(dtype=np.int64)
+        deposit = df['Deposit'].to_numpy(dtype=np.int64)
+        balance = df['Balance'].to_numpy(dtype=np.int64)
+
+        # Oldest-first statements carry the balance forward; newest-first ones backward
+        forward = balance[:-1] - withdrawl[1:] + deposit[1:] - balance[1:]
+        backward = balance[1:] - withdrawl[:-1] + deposit[:-1] - balance[:-1]
+        if np.count_nonzero(backward) < np.count_nonzero(forward):
+            differences, offset = backward, 0
+        else:
+            differences, offset = forward, 1
+
+        break_positions = np.flatnonzero(differences) + offset
+        report.update(checked=True, valid=len(break_positions) == 0, breaks=len(break_positions))
+        if len(break_positions) == 0:
+            return report
+
+        breaks = df.iloc[break_positions]
+        if 'Page' in df.columns:
+            report['pages_with_breaks'] = {int(page): int(count)
+                                           for page, count in breaks['Page'].value_counts().sort_index().items()}
+        report['break_rows'] = [
+            {'row': int(position),
+             'page': int(df['Page'].iloc[position]) if 'Page' in df.columns else None,
+             'date': str(df['Date'].iloc[position]) if 'Date' in df.columns else '',
+             'difference': int(differences[position - offset])}
+            for position in break_positions[:20]
+        ]
+        return report
+
+    def describe(self, report):
+        """Describe a validation report in one sentence for the UI"""
+        if not report['checked']:
+            return "Balance continuity could not be checked for this statement layout."
+        if report['valid']:
+            return f"All {report['rows']} rows reconcile with the running balance."
+        if report['pages_with_breaks']:
+            pages = ', '.join(str(page) for page in report['pages_with_breaks'])
+            return f"{report['breaks']} row(s) do not reconcile with the running balance (page(s) {pages})."
+        return f"{report['breaks']} row(s) do not reconcile with the running balance."
@@ -0,0 +1,110 @@
+import os
+import json
+from cryptography.fernet import Fernet, InvalidToken
+
+
+class StatementVault:
+    """
+    A class to keep the extracted contents of uploaded statements encrypted
+    at rest, so a statement is only decrypted and parsed once.
+
+    The password of a protected PDF is only available at upload time. The
+    extracted table is stored next to the PDF, encrypted with a server key,
+    and every later re-processing (for example re-categorizing with a new
+    model) reads it from the vault instead of opening the PDF again.
+    """
+
+    # Version 2 tables end with a 'Page' column; version 1 tables have none,
+    # which the balance validator handles by skipping the page checks
+    VAULT_VERSION = 2
+    READABLE_VERSIONS = (1, 2)
+
+    def __init__(self, key_file='statement_vault.key'):
+        """
+        Initialize the StatementVault.
+
+        The server key is read from the STATEMENT_VAULT_KEY environment
+        variable. Without it, a key is generated once and kept in key_file.
+
+        Args:
+            key_file: Path of the fallback key file
+        """
+        key = os.getenv('STATEMENT_VAULT_KEY')
+        if not key:
+            key = self.load_or_create_key(key_file)
+        self.fernet = Fernet(key)
+
+    def load_or_create_key(self, key_file):
+        """Read the server key from key_file, generating it on first use"""
+        if os.path.exists(key_file):
+            with open(key_file, 'rb') as f:
+                return f.read().strip()
+
+        key = Fernet.generate_key()
+        with open(key_file, 'wb') as f:
+            f.write(key)
+        os.chmod(key_file, 0o600)
+        print(f"Generated statement vault key in {key_file}")
+        return key
+
+    def vault_path(self, pdf_path):
+        """Return the path of the encrypted copy for a statement"""
+        return pdf_path + ".vault"
+
+    def store(self, pdf_path, column_names, rows, parser_name):
+        """
+        Encrypt and store the extracted table of a statement.
+
+        Args:
+            pdf_path: Path of the uploaded PDF
+            column_names: Extracted header row
+            rows: Extracted data rows
+            parser_name: Parser that produced the table
+        """
+        payload = json.dumps({
+            'version': self.VAULT_VERSION,
+            'parser': parser_name,
+            'columns': column_names,
+            'rows': rows,
+        }).encode('utf-8')
+
+        # A crash while writing must not leave a truncated, undecryptable vault
+        path = self.vault_path(pdf_path)
+        temp_file = f"{path}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(self.fernet.encrypt(payload))
+        os.replace(temp_file, path)
+
+    def load(self, pdf_path):
+        """
+        Load the decrypted table of a statement.
+
+        Returns:
+            Tuple of (column_names, rows, parser_name), or None if the
+            statement is not in the vault or cannot be decrypted
+        """
+        path = self.vault_path(pdf_path)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                payload = json.loads(self.fernet.decrypt(f.read()))
+        except (OSError, InvalidToken, ValueError) as e:
+            print(f"Error reading statement vault {path}: {e}")
+            return None
+
+        if payload.get('version') not in self.READABLE_VERSIONS:
+            return None
+        return payload['columns'], payload['rows'], payload['parser']
+
+    def encrypt_secret(self, secret):
+        """Encrypt a short secret (such as a PDF password) with the server key"""
+        return self.fernet.encrypt(secret.encode('utf-8')).decode('ascii')
+
+    def decrypt_secret(self, token):
+        """Decrypt a secret produced by encrypt_secret, or None if it is invalid"""
+        try:
+            return self.fernet.decrypt(token.encode('ascii')).decode('utf-8')
+        except (InvalidToken, ValueError):
+            return None
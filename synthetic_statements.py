@@ -0,0 +1,354 @@
+import argparse
+import random
+from datetime import date, timedelta
+import pandas as pd
+
+
+class SyntheticStatementGenerator:
+    """
+    A class to generate synthetic bank statements in the IndusInd layout.
+
+    Transactions mix UPI, POS, IMPS and interest credits with recurring
+    subscriptions and a monthly salary, and carry a running balance that is
+    consistent with every withdrawal and deposit. Statements can be written
+    as PDFs that the IndusInd parser reads like real ones, or as CSVs, so
+    the pipeline can be exercised and benchmarked without any real data.
+    """
+
+    COLUMNS = ['Date', 'Particulars', 'Chq./Ref.No.', 'Withdrawl', 'Deposit', 'Balance']
+
+    # Page geometry of the IndusInd statement, in points from the page top
+    PAGE_WIDTH = 595
+    PAGE_HEIGHT = 842
+    VERTICAL_LINES = [30, 107, 251, 328, 405, 482, 565]
+    FIRST_HEADER_TOP = 201
+    FIRST_ROWS_TOP = 219
+    CONTINUATION_TOP = 82
+    TABLE_BOTTOM = 760
+    FONT_SIZE = 8
+
+    # A row is one line of padding plus one line per line of wrapped text
+    LINE_HEIGHT = 9
+
+    # Particulars are wrapped to the width of their column, like the bank does
+    PARTICULARS_WIDTH = 132
+
+    UPI_PAYEES = [
+        ('KAVI', 'SBIN', 'sur2014-1@oksbi'), ('RAHU', 'HDFC', 'rahul.k@okhdfcbank'),
+        ('CHAR', 'YESB', 'q588180672@ybl'), ('SWIG', 'ICIC', 'swiggy@icici'),
+        ('ZOMA', 'HDFC', 'zomato@hdfcbank'), ('AMAZ', 'YESB', 'amazon@yapl'),
+        ('FLIP', 'AXIS', 'flipkart@axisbank'), ('JIOP', 'SBIN', 'jiomobility@sbi'),
+        ('CMRL', 'ICIC', 'cmrl@icici'), ('BOOK', 'HDFC', 'bookmyshow@hdfcbank'),
+    ]
+    POS_MERCHANTS = ['AMAZON PAY INDIA', 'RELIANCE SMART', 'DMART CHENNAI', 'BOOKMYSHOW',
+                     'INDIAN RAILWAY', 'SHELL PETROL']
+    IMPS_BANKS = ['HDFC', 'SBIN', 'ICIC', 'IDFB', 'HSBC']
+    NOTES = ['UPI', 'food', 'pass', 'rent', 'bill', 'Payment']
+
+    # (particulars, day of month, amount) of monthly subscriptions
+    SUBSCRIPTIONS = [
+        ('UPI/{ref}/DR/NETF/HDFC/netflix@hdfcbank/Subscription', 5, 649.0),
+        ('UPI/{ref}/DR/JIOP/SBIN/jiomobility@sbi/recharge', 12, 299.0),
+    ]
+
+    # Helvetica advance widths (per 1000 units of font size) for right-aligning and wrapping
+    CHAR_WIDTHS = {'.': 278, ',': 278, '/': 278, ':': 278, '-': 333, '@': 1015, ' ': 278, '_': 556}
+
+    def __init__(self, seed=0, start_date=date(2024, 4, 1), opening_balance=25000.0,
+                 salary=45000.0, account_number='159025785636'):
+        """
+        Initialize the SyntheticStatementGenerator.
+
+        Args:
+            seed: Seed of the random generator, so statements are reproducible
+            start_date: Date of the first transaction
+            opening_balance: Balance before the first transaction
+            salary: Amount credited on the first of every month
+            account_number: Account number printed on the statement
+        """
+        self.seed = seed
+        self.start_date = start_date
+        self.opening_balance = opening_balance
+        self.salary = salary
+        self.account_number = account_number
+
+    def generate_transactions(self, n_rows):
+        """
+        Generate a statement of n_rows transactions.
+
+        Args:
+            n_rows: Number of transactions
+
+        Returns:
+            DataFrame with the statement columns; empty amount cells are NaN
+        """
+        rng = random.Random(self.seed)
+        balance = self.opening_balance
+        rows = []
+        day = self.start_date
+        month_seen = None
+
+        while len(rows) < n_rows:
+            for particulars, withdrawl, deposit in self._transactions_on(rng, day, month_seen):
+                if withdrawl and withdrawl > balance:
+                    continue
+                balance = round(balance - (withdrawl or 0) + (deposit or 0), 2)
+                rows.append({
+                    'Date': day.strftime('%d-%b-%Y'),
+                    'Particulars': particulars,
+                    'Chq./Ref.No.': f"S{rng.randrange(10 ** 7, 10 ** 8)}",
+                    'Withdrawl': withdrawl,
+                    'Deposit': deposit,
+                    'Balance': balance,
+                })
+                if len(rows) == n_rows:
+                    break
+            month_seen = (day.year, day.month)
+            day += timedelta(days=1)
+
+        return pd.DataFrame(rows, columns=self.COLUMNS)
+
+    def _transactions_on(self, rng, day, month_seen):
+        """Yield (particulars, withdrawl, deposit) for the transactions of one day"""
+        if month_seen is not None and month_seen != (day.year, day.month):
+            # Interest for the previous month, then the salary
+            month_start = (day - timedelta(days=1)).replace(day=1)
+            yield (f"{self.account_number}:Int.Pd:{month_start.strftime('%d-%m-%Y')} to "
+                   f"{(day - timedelta(days=1)).strftime('%d-%m-%Y')}", None, float(rng.randint(20, 400)))
+            yield (f"IMPS/P2A/{self._reference(rng)}/HDFC/ACME PAYROLL SALARY", None, self.salary)
+
+        for particulars, day_of_month, amount in self.SUBSCRIPTIONS:
+            if day.day == day_of_month:
+                yield particulars.format(ref=self._reference(rng)), amount, None
+
+        for _ in range(rng.choice([0, 1, 1, 2, 2, 3])):
+            kind = rng.random()
+            if kind < 0.6:
+                name, bank, vpa = rng.choice(self.UPI_PAYEES)
+                amount = float(rng.choice([rng.randint(10, 199), rng.randint(200, 3000)]))
+                if rng.random() < 0.1:
+                    yield f"UPI/{self._reference(rng)}/CR/{name}/{bank}/{vpa}/{rng.choice(self.NOTES)}", None, amount
+                else:
+                    yield f"UPI/{self._reference(rng)}/DR/{name}/{bank}/{vpa}/{rng.choice(self.NOTES)}", amount, None
+            elif kind < 0.85:
+                amount = round(rng.uniform(100, 5000), 2)
+                yield f"POS/{rng.randrange(10 ** 5, 10 ** 6)}XXXXXX/{rng.choice(self.POS_MERCHANTS)}", amount, None
+            else:
+                amount = float(rng.randint(100, 10000))
+                yield (f"IMPS/P2A/{self._reference(rng)}/{rng.choice(self.IMPS_BANKS)}/"
+                       f"{rng.choice(['Kavitha', 'Rahul', 'Priya'])}", amount, None)
+
+    def _reference(self, rng):
+        return str(rng.randrange(10 ** 11, 10 ** 12))
+
+    def write_csv(self, path, transactions):
+        """Write transactions as a CSV with the statement columns"""
+        transactions.to_csv(path, index=False)
+        return path
+
+    def write_pdf(self, path, transactions):
+        """
+        Write transactions as a statement PDF in the IndusInd layout.
+
+        Every page carries the bank banner; page 1 also carries the account
+        details and the table header. Text uses the standard Helvetica font,
+        so no font files are embedded.
+
+        Args:
+            path: Output PDF path
+            transactions: DataFrame from generate_transactions
+
+        Returns:
+            Number of pages written
+        """
+        pages = self._paginate(transactions.to_dict('records'))
+        _write_pdf(path, [self._page_content(records, first=page_num == 0) for page_num, records in enumerate(pages)],
+                   self.PAGE_WIDTH, self.PAGE_HEIGHT)
+        return len(pages)
+
+    def write_statement(self, path, pages):
+        """
+        Generate a statement that fills the given number of PDF pages and write it.
+
+        Returns:
+            DataFrame of the transactions written
+        """
+        # Rows wrap to one or more lines, so generate enough for the densest pages
+        rows_per_page = (self.TABLE_BOTTOM - self.CONTINUATION_TOP) // (2 * self.LINE_HEIGHT)
+        transactions = self.generate_transactions(rows_per_page * pages)
+        kept = sum(len(records) for records in self._paginate(transactions.to_dict('records'))[:pages])
+        transactions = transactions.iloc[:kept]
+        self.write_pdf(path, transactions)
+        return transactions
+
+    def _paginate(self, records):
+        """Split records into pages by the height of their wrapped rows"""
+        pages = [[]]
+        top = self.FIRST_ROWS_TOP
+        for record in records:
+            height = self._row_height(record)
+            if top + height > self.TABLE_BOTTOM and pages[-1]:
+                pages.append([])
+                top = self.CONTINUATION_TOP
+            pages[-1].append(record)
+            top += height
+        return pages
+
+    def _row_height(self, record):
+        return self.LINE_HEIGHT * (1 + len(self._wrap(record['Particulars'])))
+
+    def _page_content(self, records, first):
+        """Build the content stream of one page"""
+        ops = [self._text(45, 42, 'IndusInd Bank', size=12),
+               self._text(407, 48, 'Statement of Account')]
+
+        if first:
+            ops.append(self._text(36, 99, 'SYNTHETIC CUSTOMER'))
+            ops.append(self._text(311, 133, f"Account No. : {self.account_number}"))
+            ops.append(self._text(311, 145, 'Account Type : SAVINGS ACCOUNT'))
+            ops.append(self._text(311, 165, 'Currency : INR'))
+            table_top = self.FIRST_HEADER_TOP
+            ops.extend(self._row(self.COLUMNS, table_top, self.FIRST_ROWS_TOP - table_top))
+            top = self.FIRST_ROWS_TOP
+        else:
+            ops.append(self._text(429, 77, f"Account No. : {self.account_number}"))
+            table_top = top = self.CONTINUATION_TOP
+
+        for record in records:
+            cells = [record['Date'], self._wrap(record['Particulars']), record['Chq./Ref.No.'],
+                     self._amount(record['Withdrawl']), self._amount(record['Deposit']),
+                     self._amount(record['Balance'])]
+            height = self._row_height(record)
+            ops.extend(self._row(cells, top, height))
+            top += height
+
+        # Column rulings across the table
+        for x in self.VERTICAL_LINES:
+            ops.append(self._line(x, table_top, x, top))
+        return '\n'.join(ops)
+
+    def _row(self, cells, top, height):
+        """Draw one table row: its top and bottom rulings and its cell text"""
+        ops = [self._line(self.VERTICAL_LINES[0], top, self.VERTICAL_LINES[-1], top),
+               self._line(self.VERTICAL_LINES[0], top + height, self.VERTICAL_LINES[-1], top + height)]
+        for index, cell in enumerate(cells):
+            lines = cell if isinstance(cell, list) else [cell]
+            left, right = self.VERTICAL_LINES[index], self.VERTICAL_LINES[index + 1]
+            for line_num, text in enumerate(lines):
+                if not text:
+                    continue
+                baseline = top + 11 + self.LINE_HEIGHT * line_num
+                # Amounts are right-aligned in their column, everything else left-aligned
+                if index >= 3:
+                    ops.append(self._text(right - 2 - self._width(text), baseline, text))
+                else:
+                    ops.append(self._text(left + 6, baseline, text))
+        return ops
+
+    def _wrap(self, text):
+        """Wrap text to the particulars column, breaking mid-word like the bank does"""
+        lines = ['']
+        for char in text:
+            if self._width(lines[-1] + char) > self.PARTICULARS_WIDTH:
+                lines.append('')
+            lines[-1] += char
+        return lines
+
+    def _width(self, text, size=None):
+        size = size or self.FONT_SIZE
+        units = 0
+        for char in text:
+            if char in self.CHAR_WIDTHS:
+                units += self.CHAR_WIDTHS[char]
+            elif char.isupper():
+                units += 722 if char in 'MW' else 667
+            elif char in 'ijlft':
+                units += 278
+            else:
+                units += 556
+        return units * size / 1000
+
+    def _amount(self, value):
+        """Format an amount with Indian digit grouping, as the bank prints it"""
+        if value is None or pd.isna(value):
+            return ''
+        rupees, paise = f"{value:.2f}".split('.')
+        head, tail = rupees[:-3], rupees[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        text = ','.join(groups + [tail])
+        return text if paise == '00' else f"{text}.{paise}"
+
+    def _text(self, x, baseline, text, size=None):
+        """Place text with its baseline at a distance from the page top"""
+        escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        return (f"BT /F1 {size or self.FONT_SIZE} Tf {x:.2f} {self.PAGE_HEIGHT - baseline:.2f} Td "
+                f"({escaped}) Tj ET")
+
+    def _line(self, x0, top0, x1, top1):
+        return f"{x0} {self.PAGE_HEIGHT - top0} m {x1} {self.PAGE_HEIGHT - top1} l S"
+
+
+def _write_pdf(path, page_contents, width, height):
+    """Write a minimal uncompressed PDF with one Helvetica font and the given page streams"""
+    page_count = len(page_contents)
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and its content stream per page
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            ' '.join(f"{4 + 2 * index} 0 R" for index in range(page_count)), page_count),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for index, content in enumerate(page_contents):
+        stream = content.encode('latin-1')
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>")
+        objects.append((f"<< /Length {len(stream)} >>\nstream\n".encode('latin-1'), stream))
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, obj in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode('latin-1'))
+            if isinstance(obj, tuple):
+                f.write(obj[0] + obj[1] + b"\nendstream")
+            else:
+                f.write(obj.encode('latin-1'))
+            f.write(b"\nendobj\n")
+
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1'))
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode('latin-1'))
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic IndusInd-style bank statements")
+    parser.add_argument('output', help="Output file (.pdf or .csv)")
+    parser.add_argument('--pages', type=int, default=10, help="Number of PDF pages")
+    parser.add_argument('--rows', type=int, help="Number of transactions (default: enough to fill --pages, 1000 for CSV)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    generator = SyntheticStatementGenerator(seed=args.seed)
+    if args.output.lower().endswith('.csv'):
+        transactions = generator.generate_transactions(args.rows or 1000)
+        generator.write_csv(args.output, transactions)
+        print(f"Wrote {len(transactions)} transactions to {args.output}")
+    elif args.rows:
+        transactions = generator.generate_transactions(args.rows)
+        pages = generator.write_pdf(args.output, transactions)
+        print(f"Wrote {len(transactions)} transactions on {pages} pages to {args.output}")
+    else:
+        transactions = generator.write_statement(args.output, args.pages)
+        print(f"Wrote {len(transactions)} transactions on {args.pages} pages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
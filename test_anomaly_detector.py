@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+from anomaly_detector import CategoryAnomalyDetector
+
+
+def withdrawals(categories, amounts):
+    return pd.DataFrame({'Category': categories, 'Withdrawl': np.array(amounts, dtype='int64')})
+
+
+def exact_stats(amounts):
+    log_amounts = np.log1p(np.array(amounts) / 100)
+    return len(log_amounts), log_amounts.mean(), ((log_amounts - log_amounts.mean()) ** 2).sum()
+
+
+@pytest.fixture
+def detector(tmp_path):
+    return CategoryAnomalyDetector(str(tmp_path / 'stats.json'))
+
+
+def test_merged_batches_match_the_statistics_of_all_rows(detector):
+    first = [12000, 45000, 9900, 30000]
+    second = [15000, 70000, 22000]
+    detector.update('u', withdrawals(['FOOD'] * 4, first), 's1')
+    categories = detector.update('u', withdrawals(['FOOD'] * 3, second), 's2')
+
+    count, mean, m2 = exact_stats(first + second)
+    assert categories['FOOD']['count'] == count
+    assert categories['FOOD']['mean'] == pytest.approx(mean)
+    assert categories['FOOD']['m2'] == pytest.approx(m2)
+
+
+def test_a_statement_is_counted_once(detector):
+    df = withdrawals(['FOOD', 'FOOD'], [10000, 20000])
+    detector.update('u', df, 's1')
+    categories = detector.update('u', df, 's1')
+    assert categories['FOOD']['count'] == 2
+
+
+def test_deposits_are_not_counted(detector):
+    categories = detector.update('u', withdrawals(['FOOD', 'FOOD', 'FOOD'], [10000, 0, 20000]), 's1')
+    assert categories['FOOD']['count'] == 2
+
+
+def test_unmerge_reverses_merge(detector):
+    batch_a = detector._batch_stats(withdrawals(['FOOD'] * 4, [1000, 2500, 4000, 8000]))
+    batch_b = detector._batch_stats(withdrawals(['FOOD'] * 2, [300000, 5000]))
+    empty = {'count': 0, 'mean': 0.0, 'm2': 0.0}
+
+    only_a = detector._merge(empty, batch_a.loc['FOOD'])
+    both = detector._merge(only_a, batch_b.loc['FOOD'])
+    remaining = detector._unmerge(both, batch_b.loc['FOOD'])
+
+    assert remaining['count'] == only_a['count']
+    assert remaining['mean'] == pytest.approx(only_a['mean'])
+    assert remaining['m2'] == pytest.approx(only_a['m2'])
+    assert detector._unmerge(only_a, batch_a.loc['FOOD']) is None
+
+
+def test_move_matches_statistics_built_from_the_corrected_statement(detector, tmp_path):
+    df = withdrawals(['FOOD', 'SHOP', 'FOOD', 'SHOP', 'FOOD', 'SHOP'], [1000, 2000, 3000, 40000, 5000, 6000])
+    detector.update('u', df, 's1')
+
+    moved = df.index[:2]
+    corrected = df.copy()
+    corrected.loc[moved, 'Category'] = 'TRAVEL'
+    assert detector.move('u', df.loc[moved], corrected.loc[moved], 's1')
+    assert not detector.move('u', df.loc[moved], corrected.loc[moved], 'never-counted')
+
+    rebuilt = CategoryAnomalyDetector(str(tmp_path / 'rebuilt.json')).update('u', corrected, 's1')
+    categories = detector.load_stats()['u']['categories']
+    assert sorted(categories) == sorted(rebuilt)
+    for category, expected in rebuilt.items():
+        assert categories[category]['count'] == expected['count']
+        assert categories[category]['mean'] == pytest.approx(expected['mean'])
+        assert categories[category]['m2'] == pytest.approx(expected['m2'], abs=1e-9)
+
+
+def test_an_outlier_is_scored_before_it_joins_the_history(detector):
+    history = withdrawals(['FOOD'] * 6, [10000, 11000, 9000, 10500, 9500, 10200])
+    detector.update('u', history, 's1')
+
+    scored = detector.score_and_update('u', withdrawals(['FOOD', 'FOOD'], [10000, 5000000]), 's2')
+    assert scored['AnomalyScore'].iloc[1] > detector.threshold
+    assert abs(scored['AnomalyScore'].iloc[0]) < detector.threshold
+    assert detector.load_stats()['u']['categories']['FOOD']['count'] == 8
+
+
+def test_categories_without_enough_history_are_not_scored(detector):
+    detector.update('u', withdrawals(['FOOD'] * 2, [10000, 12000]), 's1')
+    scored = detector.score('u', withdrawals(['FOOD'], [900000]))
+    assert scored['AnomalyScore'].tolist() == [0.0]
@@ -0,0 +1,58 @@
+import time
+import threading
+import pytest
+from deadline_advice import DeadlineRunner
+
+
+@pytest.fixture
+def runner():
+    runner = DeadlineRunner(max_workers=2)
+    yield runner
+    runner.executor.shutdown(wait=True)
+
+
+def test_a_call_past_its_deadline_is_picked_up_later(runner):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return 'advice'
+
+    future = runner.submit('k', slow)
+    assert runner.wait(future, 0.01) == (False, None)
+
+    release.set()
+    assert runner.submit('k', lambda: 'requested again') is future
+    assert runner.wait(future, 5) == (True, 'advice')
+
+
+def test_a_finished_call_is_reused(runner):
+    calls = []
+    first = runner.submit('k', lambda: calls.append(1) or 'advice')
+    runner.wait(first, 5)
+    assert runner.submit('k', lambda: calls.append(1) or 'again') is first
+    assert len(calls) == 1
+    assert runner.submit('other', lambda: 'other advice') is not first
+
+
+def test_a_failed_call_is_raised_and_not_kept(runner):
+    def failing():
+        raise RuntimeError('quota exceeded')
+
+    future = runner.submit('k', failing)
+    with pytest.raises(RuntimeError):
+        runner.wait(future, 5)
+
+    retried = runner.submit('k', lambda: 'advice')
+    assert retried is not future
+    assert runner.wait(retried, 5) == (True, 'advice')
+
+
+def test_old_results_are_forgotten(runner):
+    runner.keep_seconds = 0
+    first = runner.submit('k', lambda: 'advice')
+    runner.wait(first, 5)
+    while runner.calls['k']['finished'] is None:
+        time.sleep(0.001)
+    time.sleep(0.01)
+    assert runner.submit('k', lambda: 'fresh advice') is not first
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+from merchant_sketches import MerchantSketchStore, SpaceSavingSketch
+
+
+def activity(month, merchants, amount=10000):
+    return pd.DataFrame({'Month': month, 'Merchant': merchants, 'Amount': amount})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MerchantSketchStore(str(tmp_path / 'sketches.json'), capacity=3)
+
+
+def test_from_counts_keeps_the_most_frequent_merchants():
+    sketch = SpaceSavingSketch.from_counts({'A': (5, 500), 'B': (1, 100), 'C': (3, 300), 'D': (2, 200)}, capacity=3)
+    assert sorted(sketch.items) == ['A', 'C', 'D']
+    assert sketch.total == 11
+    assert sketch.min_count == 2
+
+
+def test_min_count_is_zero_until_the_sketch_is_full():
+    assert SpaceSavingSketch.from_counts({'A': (5, 500)}, capacity=3).min_count == 0
+
+
+def test_merge_of_sketches_with_room_is_exact():
+    a = SpaceSavingSketch.from_counts({'A': (4, 400), 'B': (1, 100)}, capacity=5)
+    b = SpaceSavingSketch.from_counts({'A': (2, 200), 'C': (3, 300)}, capacity=5)
+    merged = a.merge(b)
+    assert merged.items == {'A': [6, 0, 600], 'C': [3, 0, 300], 'B': [1, 0, 100]}
+    assert merged.total == 10
+
+
+def test_merge_bounds_the_count_of_merchants_missing_from_a_full_sketch():
+    exact_a = {'A': (10, 1000), 'B': (4, 400), 'X': (3, 300)}
+    exact_b = {'X': (6, 600), 'C': (5, 500), 'A': (1, 100)}
+    a = SpaceSavingSketch.from_counts(exact_a, capacity=2)
+    b = SpaceSavingSketch.from_counts(exact_b, capacity=2)
+    merged = a.merge(b)
+
+    assert merged.total == 29
+    assert len(merged.items) == 2
+    for merchant, (count, error, _) in merged.items.items():
+        true_count = exact_a.get(merchant, (0, 0))[0] + exact_b.get(merchant, (0, 0))[0]
+        assert count - error <= true_count <= count
+
+    # A merchant paid more than total / capacity times is always kept
+    assert 'A' in merged.items
+
+
+def test_top_reports_guaranteed_counts():
+    sketch = SpaceSavingSketch(3, {'A': [7, 2, 700], 'B': [9, 0, 900]}, total=16)
+    assert sketch.top(1) == [{'merchant': 'B', 'count': 9, 'error': 0, 'guaranteed': 9, 'amount': 900}]
+    assert sketch.top(5)[1]['guaranteed'] == 5
+
+
+def test_dict_round_trip():
+    sketch = SpaceSavingSketch.from_counts({'A': (2, 250), 'B': (1, 75)}, capacity=4)
+    restored = SpaceSavingSketch.from_dict(sketch.to_dict())
+    assert (restored.capacity, restored.items, restored.total) == (sketch.capacity, sketch.items, sketch.total)
+
+
+def test_store_counts_a_statement_once(store):
+    assert store.update('u', activity('2024-06', ['A', 'A', 'B']), 's1')
+    assert not store.update('u', activity('2024-06', ['A', 'A', 'B']), 's1')
+    assert store.sketch(['u']).total == 3
+    assert store.sketch().total == 3
+
+
+def test_store_merges_users_and_months(store):
+    store.update('u', activity('2024-05', ['A', 'B']), 's1')
+    store.update('u', activity('2024-06', ['A']), 's2')
+    store.update('v', activity('2024-06', ['A', 'C', 'C']), 's3')
+
+    assert store.months('u') == ['2024-05', '2024-06']
+    assert store.top(1)[0]['merchant'] == 'A'
+    assert store.top(1)[0]['count'] == 3
+    assert store.sketch(['u'], start='2024-06').total == 1
+    assert store.sketch(['v']).top(1)[0]['merchant'] == 'C'
@@ -0,0 +1,126 @@
+import time
+import threading
+from request_coalescing import CoalescingModel, SingleFlight
+
+
+class SlowModel:
+    """Model stub that blocks until released and counts its calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return f"advice for {prompt}"
+
+
+def run_concurrently(func, callers):
+    results = [None] * callers
+    errors = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = func()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    return threads, results, errors
+
+
+def wait_for_waiters(flight, key, waiters):
+    deadline = time.monotonic() + 5
+    while flight.calls[key].waiters < waiters:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        entered.set()
+        release.wait(5)
+        return 42
+
+    threads, results, _ = run_concurrently(lambda: flight.do('k', slow), 4)
+    threads[0].start()
+    entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for_waiters(flight, 'k', 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda result: result[1]) == [(42, False)] + [(42, True)] * 3
+    assert flight.in_flight() == 0
+
+
+def test_errors_reach_every_waiter_and_are_not_kept():
+    flight = SingleFlight()
+    entered = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        entered.set()
+        release.wait(5)
+        raise ValueError('quota exceeded')
+
+    threads, _, errors = run_concurrently(lambda: flight.do('k', failing), 3)
+    threads[0].start()
+    entered.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for_waiters(flight, 'k', 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.do('k', lambda: 'retried') == ('retried', False)
+
+
+def test_identical_prompts_share_one_request():
+    model = SlowModel()
+    coalescing = CoalescingModel(model, 'test-model', flight=SingleFlight(), semaphore=threading.Semaphore(2))
+
+    threads, results, _ = run_concurrently(lambda: coalescing.generate_content('budget'), 3)
+    threads[0].start()
+    model.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for_waiters(coalescing.flight, coalescing.fingerprint('budget', {}), 2)
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert model.calls == 1
+    assert results == ['advice for budget'] * 3
+
+
+def test_fingerprint_depends_on_model_prompt_and_options():
+    a = CoalescingModel(object(), 'model-a')
+    b = CoalescingModel(object(), 'model-b')
+    assert a.fingerprint('p', {}) == a.fingerprint('p', {})
+    assert a.fingerprint('p', {}) != b.fingerprint('p', {})
+    assert a.fingerprint('p', {}) != a.fingerprint('q', {})
+    assert a.fingerprint('p', {'temperature': 0}) != a.fingerprint('p', {'temperature': 1})
+
+
+def test_different_prompts_are_not_shared():
+    prompts = ['a', 'b', 'c']
+    model = SlowModel()
+    model.release.set()
+    coalescing = CoalescingModel(model, 'test-model', flight=SingleFlight(), semaphore=threading.Semaphore(2))
+    assert [coalescing.generate_content(prompt) for prompt in prompts] == [f"advice for {prompt}" for prompt in prompts]
+    assert model.calls == 3
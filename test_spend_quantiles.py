@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+from spend_quantiles import PeerSpendBenchmark
+
+
+def spend(rows):
+    return pd.DataFrame(rows, columns=['Month', 'Category', 'Amount'])
+
+
+def statement(dates, categories, withdrawals):
+    return pd.DataFrame({'Date': dates, 'Category': categories, 'Withdrawl': withdrawals, 'Deposit': 0})
+
+
+@pytest.fixture
+def benchmark(tmp_path):
+    return PeerSpendBenchmark(str(tmp_path / 'totals.json'), min_peers=3)
+
+
+def test_a_statement_is_counted_once(benchmark):
+    assert benchmark.update('u', spend([('2024-06', 'FOOD', 1000)]), 's1')
+    assert not benchmark.update('u', spend([('2024-06', 'FOOD', 1000)]), 's1')
+    assert benchmark.load()['totals'] == {'FOOD': {'2024-06': {'u': 1000}}}
+
+
+def test_statements_of_the_same_month_are_added_up(benchmark):
+    benchmark.update('u', spend([('2024-06', 'FOOD', 1000), ('2024-06', 'FOOD', 500)]), 's1')
+    benchmark.update('u', spend([('2024-06', 'FOOD', 250), ('2024-06', 'TRAVEL', 0)]), 's2')
+    assert benchmark.load()['totals'] == {'FOOD': {'2024-06': {'u': 1750}}}
+
+
+def test_monthly_spend_groups_withdrawals():
+    df = statement(['01-Jun-2024', '15-Jun-2024', '02-Jul-2024', '03-Jul-2024'],
+                   ['FOOD', 'FOOD', 'FOOD', 'SALARY'], [1000, 2000, 500, 0])
+    monthly = PeerSpendBenchmark().monthly_spend(df)
+    assert monthly.to_dict('records') == [{'Month': '2024-06', 'Category': 'FOOD', 'Amount': 3000},
+                                          {'Month': '2024-07', 'Category': 'FOOD', 'Amount': 500}]
+
+
+def test_comparison_is_exact_and_leaves_the_user_out(benchmark):
+    for i, amount in enumerate([1000, 2000, 3000, 4000]):
+        benchmark.update(f"peer{i}", spend([('2024-06', 'FOOD', amount)]), f"p{i}")
+    df = statement(['10-Jun-2024'], ['FOOD'], [2500])
+    benchmark.update('u', benchmark.monthly_spend(df), 's1')
+
+    comparison = benchmark.compare(df, 'u')
+    assert comparison.to_dict('records') == [{'Category': 'FOOD', 'MonthlySpend': 2500, 'PeerMedian': 2500,
+                                              'Percentile': 50.0, 'Peers': 4}]
+
+
+def test_categories_with_few_peers_are_not_compared(benchmark):
+    benchmark.update('peer', spend([('2024-06', 'FOOD', 1000)]), 'p')
+    assert benchmark.compare(statement(['10-Jun-2024'], ['FOOD'], [2500]), 'u').empty
+
+
+def test_move_matches_totals_built_from_the_corrected_statement(benchmark, tmp_path):
+    df = statement(['01-Jun-2024', '02-Jun-2024', '03-Jun-2024'], ['FOOD', 'FOOD', 'SHOP'], [1000, 2000, 3000])
+    benchmark.update('u', benchmark.monthly_spend(df), 's1')
+    version = benchmark.version()
+
+    moved = df.index[:1]
+    corrected = df.copy()
+    corrected.loc[moved, 'Category'] = 'SHOP'
+    assert benchmark.move('u', benchmark.monthly_spend(df.loc[moved]),
+                          benchmark.monthly_spend(corrected.loc[moved]), 's1')
+    assert not benchmark.move('u', benchmark.monthly_spend(df.loc[moved]),
+                              benchmark.monthly_spend(corrected.loc[moved]), 'never-counted')
+    assert benchmark.version() != version
+
+    rebuilt = PeerSpendBenchmark(str(tmp_path / 'rebuilt.json'))
+    rebuilt.update('u', rebuilt.monthly_spend(corrected), 's1')
+    assert benchmark.load()['totals'] == rebuilt.load()['totals']
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from statement_cleaning import (clean_amounts, clean_statement, format_rupees, from_persisted, to_paise,
+                                to_persisted, to_rupees)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1,23,456.78', 123456.78),
+    ('12,345.00', 12345.0),
+    ('₹ 1,500.00', 1500.0),
+    ('Rs. 50', 50.0),
+    ('INR 75.25', 75.25),
+    ('1,234.00Dr', 1234.0),
+    ('1,234.00 Cr', 1234.0),
+    ('(250.00)', -250.0),
+    ('-99.50', -99.5),
+    ('+10.00', 10.0),
+])
+def test_printed_amounts(text, expected):
+    assert clean_amounts(pd.Series([text])).iloc[0] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('text', ['', '-', '  ', None, 'n/a'])
+def test_blank_and_unreadable_cells_are_missing(text):
+    assert np.isnan(clean_amounts(pd.Series([text], dtype=object)).iloc[0])
+
+
+def test_debit_marker_makes_signed_amounts_negative():
+    amounts = clean_amounts(pd.Series(['1,234.00Dr', '2,000.00 dr.', '500.00Cr', '(10.00)']), signed=True)
+    assert amounts.tolist() == [-1234.0, -2000.0, 500.0, -10.0]
+
+
+def test_numeric_columns_are_kept():
+    values = pd.Series([1, 2, 3], index=[5, 6, 7])
+    amounts = clean_amounts(values)
+    assert amounts.dtype == 'float64'
+    assert amounts.index.tolist() == [5, 6, 7]
+
+
+def test_rupees_are_rounded_to_the_nearest_paisa():
+    paise = to_paise(pd.Series([0.1 + 0.2, 1234.56, -0.004, np.nan]))
+    assert str(paise.dtype) == 'Int64'
+    assert paise.iloc[:3].tolist() == [30, 123456, 0]
+    assert paise.isna().iloc[3]
+
+
+@pytest.mark.parametrize('paise, text', [
+    (123456, '₹1234.56'),
+    (5, '₹0.05'),
+    (-5, '₹-0.05'),
+    (-100000, '₹-1000.00'),
+])
+def test_format_rupees(paise, text):
+    assert format_rupees(paise) == text
+
+
+def test_to_rupees():
+    assert to_rupees(12345) == 123.45
+    assert to_rupees(pd.Series([100, -250])).tolist() == [1.0, -2.5]
+
+
+def test_clean_statement_keeps_blank_balances_missing():
+    df = pd.DataFrame({
+        'Date': ['01-Jun-2024', '02-Jun-2024'],
+        'Particulars': ['UPI/SHOP', 'SALARY'],
+        'Withdrawl': ['1,000.50', ''],
+        'Deposit': ['', '50,000.00'],
+        'Balance': ['9,000.00Cr', None],
+    })
+    cleaned = clean_statement(df)
+
+    assert cleaned['Withdrawl'].dtype == 'int64'
+    assert cleaned['Withdrawl'].tolist() == [100050, 0]
+    assert cleaned['Deposit'].tolist() == [0, 5000000]
+    assert str(cleaned['Balance'].dtype) == 'Int64'
+    assert cleaned['Balance'].iloc[0] == 900000
+    assert cleaned['Balance'].isna().iloc[1]
+    assert cleaned['Particulars'].tolist() == ['UPI/SHOP', 'SALARY']
+    assert df['Withdrawl'].tolist() == ['1,000.50', '']
+
+
+def test_persisted_statements_round_trip():
+    df = clean_statement(pd.DataFrame({'Withdrawl': ['10.00'], 'Deposit': [''], 'Balance': ['90.00']}))
+    persisted = to_persisted(df)
+    assert list(persisted.columns) == ['Withdrawl_paise', 'Deposit_paise', 'Balance_paise']
+    restored = from_persisted(persisted)
+    assert restored.to_dict('list') == {'Withdrawl': [1000], 'Deposit': [0], 'Balance': [9000]}
+    assert restored['Balance'].dtype == 'int64'
+
+
+def test_legacy_rupee_statements_are_converted():
+    restored = from_persisted(pd.DataFrame({'Withdrawl': [12.5], 'Deposit': [0.0], 'Balance': [87.5]}))
+    assert restored.to_dict('list') == {'Withdrawl': [1250], 'Deposit': [0], 'Balance': [8750]}
@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+from statement_validation import BalanceContinuityValidator
+
+
+def statement(withdrawals, deposits, balances, pages=None):
+    df = pd.DataFrame({'Withdrawl': withdrawals, 'Deposit': deposits, 'Balance': balances}, dtype='int64')
+    if pages is not None:
+        df['Page'] = pages
+    return df
+
+
+@pytest.fixture
+def validator():
+    return BalanceContinuityValidator()
+
+
+def test_oldest_first_statement_reconciles(validator):
+    report = validator.validate(statement([0, 2500, 0, 1000], [0, 0, 10000, 0], [50000, 47500, 57500, 56500]))
+    assert report['checked'] and report['valid']
+    assert report['breaks'] == 0
+
+
+def test_newest_first_statement_reconciles(validator):
+    report = validator.validate(statement([1000, 0, 2500, 0], [0, 10000, 0, 0], [56500, 57500, 47500, 50000]))
+    assert report['checked'] and report['valid']
+
+
+def test_dropped_row_is_reported_with_its_page(validator):
+    # The 10000 deposit between the second and third rows was not extracted
+    df = statement([0, 2500, 1000, 500], [0, 0, 0, 0], [50000, 47500, 56500, 56000], pages=[1, 1, 2, 2])
+    report = validator.validate(df)
+    assert report['checked'] and not report['valid']
+    assert report['breaks'] == 1
+    assert report['pages_with_breaks'] == {2: 1}
+    assert report['break_rows'][0]['row'] == 2
+    assert report['break_rows'][0]['difference'] == -10000
+    assert 'page(s) 2' in validator.describe(report)
+
+
+def test_missing_balance_fails_the_check(validator):
+    df = statement([0, 100], [0, 0], [1000, 900])
+    df['Balance'] = df['Balance'].astype('Int64')
+    df.loc[1, 'Balance'] = pd.NA
+    report = validator.validate(df)
+    assert report['checked'] and not report['valid']
+
+
+def test_layout_without_balances_is_not_checked(validator):
+    report = validator.validate(pd.DataFrame({'Withdrawl': [1, 2], 'Deposit': [0, 0]}))
+    assert not report['checked'] and report['valid']
+    assert 'could not be checked' in validator.describe(report)
+
+
+def test_repeated_header_rows_are_removed(validator):
+    df = pd.DataFrame({
+        'Date': ['01-Jun-2024', 'Date ', '02-Jun-2024'],
+        'Particulars': ['SHOP', 'particulars', 'SALARY'],
+        'Withdrawl': ['100.00', 'Withdrawl', ''],
+        'Deposit': ['', 'Deposits', '500.00'],
+        'Page': [1, 2, 2],
+    })
+    cleaned, removed = validator.remove_header_rows(df)
+    assert removed == 1
+    assert cleaned['Date'].tolist() == ['01-Jun-2024', '02-Jun-2024']
+
+
+def test_rows_repeated_across_a_page_seam_are_removed(validator):
+    df = statement([100, 200, 200, 200], [0, 0, 0, 0], [900, 700, 700, 500], pages=[1, 1, 2, 2])
+    cleaned, removed = validator.remove_seam_duplicates(df)
+    assert removed == 1
+    assert cleaned.index.tolist() == [0, 1, 3]
+    assert validator.validate(cleaned)['valid']
+
+
+def test_repeat_payments_within_a_page_are_kept(validator):
+    df = statement([100, 200, 200], [0, 0, 0], [900, 700, 700], pages=[1, 1, 1])
+    cleaned, removed = validator.remove_seam_duplicates(df)
+    assert removed == 0
+    assert len(cleaned) == 3
@@ -1,25 +1,57 @@
 import pandas as pd
 import numpy as np
+import os
 import re
 import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from statement_cleaning import clean_amounts, distinct_values, parse_dates
+
+# Categorizer of the current worker process, set once by _init_chunk_worker
+_worker_categorizer = None
+
+
+def _init_chunk_worker(categorizer):
+    """Keep the categorizer in a worker process, so the model is sent to it once"""
+    global _worker_categorizer
+    # Shadow statistics are only kept by the parent process; a worker would
+    # keep its own copy of the stats file and overwrite the others' counts
+    categorizer.shadow = None
+    _worker_categorizer = categorizer
+
+
+def _categorize_chunk(chunk):
+    """Categorize one chunk of a CSV in a worker process"""
+    return chunk.assign(Category=_worker_categorizer.categorize_batch(chunk) if len(chunk) else [])
+
 
 class TransactionCategorizer:
     """
     A class to categorize bank transactions into different expense categories
     using both rule-based logic and machine learning.
     """
+
+    # Features the ML model is trained on, in order
+    MODEL_FEATURES = ['TransactionType', 'HasPayee', 'TransactionAmount',
+                      'DayOfWeek', 'IsWeekend', 'Month', 'IsRoundAmount',
+                      'is_small_upi_no_payee', 'is_upi_with_payee', 'is_large_amount']
     
-    def __init__(self, model_path=None, preprocessor_path=None):
+    def __init__(self, model_path=None, preprocessor_path=None, knowledge_base=None):
         """
         Initialize the TransactionCategorizer with optional model paths.
         
         Args:
             model_path: Path to the trained model pickle file
             preprocessor_path: Path to the preprocessor pickle file
+            knowledge_base: Optional MerchantKnowledgeBase consulted before the rules and the model
         """
         self.model = None
         self.preprocessor = None
+        self.knowledge_base = knowledge_base
+
+        # Optional ShadowModelEvaluator comparing a candidate model on batch calls
+        self.shadow = None
         
         if model_path and preprocessor_path:
             self.load_model(model_path, preprocessor_path)
@@ -137,6 +169,110 @@ class TransactionCategorizer:
         
         return features
     
+    def extract_features_batch(self, df):
+        """
+        Extract features for every transaction of a DataFrame at once.
+
+        Produces the same values as calling extract_features on each row,
+        with column operations instead of a Python loop per row.
+
+        Args:
+            df: pandas DataFrame containing transaction data
+
+        Returns:
+            DataFrame of extracted features, indexed like df
+        """
+        features = pd.DataFrame(index=df.index)
+
+        # Description features are computed once per distinct description of
+        # categorical columns and spread to the rows by position
+        if 'Particulars' in df.columns:
+            particulars, positions = distinct_values(df['Particulars'])
+            is_text = particulars.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+            text = particulars.where(is_text, '').astype(str)
+        else:
+            positions = np.arange(len(df))
+            is_text = np.zeros(len(df), dtype=bool)
+            text = pd.Series('', index=range(len(df)))
+        upper = text.str.upper()
+        lower = text.str.lower()
+
+        # Transaction type, checked in the same order as extract_transaction_type
+        conditions = [upper.str.contains('UPI', regex=False),
+                      upper.str.contains('POS', regex=False) | upper.str.contains('BOOKMYSHOW', regex=False),
+                      upper.str.contains('IMPS', regex=False),
+                      upper.str.contains('INT.PD', regex=False),
+                      upper.str.contains('REFUND', regex=False),
+                      upper.str.contains('CMS', regex=False)]
+        choices = ['UPI', 'CARD_PAYMENT', 'IMPS', 'INTEREST', 'REFUND', 'CMS']
+        transaction_type = np.select(conditions, choices, default='OTHER')
+        transaction_type[~is_text] = 'OTHER'
+        features['TransactionType'] = transaction_type[positions]
+
+        # Payee name, using the patterns of extract_payee_name in order
+        payee = pd.Series(None, index=text.index, dtype=object)
+        for pattern in [r'/([A-Z]{2,}?)/', r'/([A-Za-z]{2,}?)/', r'([A-Za-z]{3,})@']:
+            missing = payee.isna()
+            if not missing.any():
+                break
+            payee[missing] = text[missing].str.extract(pattern, expand=False)
+        payee[transaction_type != 'UPI'] = None
+        features['PayeeName'] = pd.Series(payee.to_numpy()[positions], index=df.index, dtype=object)
+        features['HasPayee'] = features['PayeeName'].notna().astype(int)
+
+        # Transaction amount: withdrawals are negative, deposits positive
+        if 'Withdrawl' in df.columns and 'Deposit' in df.columns:
+            withdrawl = self._to_amounts(df['Withdrawl']).to_numpy(dtype=float)
+            deposit = self._to_amounts(df['Deposit']).to_numpy(dtype=float)
+            features['TransactionAmount'] = np.where(withdrawl > 0, -withdrawl,
+                                                     np.where(deposit > 0, deposit, 0.0))
+        elif 'TransactionAmount' in df.columns:
+            features['TransactionAmount'] = self._to_amounts(df['TransactionAmount'])
+        else:
+            features['TransactionAmount'] = 0.0
+
+        # Keyword flags used by the category rules
+        shopping = (lower.str.contains('amazon', regex=False)
+                    | lower.str.contains('meesho', regex=False)
+                    | lower.str.contains('flipkart', regex=False))
+        entertainment = (lower.str.contains('bookmyshow', regex=False)
+                         | lower.str.contains('entertainment', regex=False))
+        travel = lower.str.contains(r'railway|travel|cmrl', regex=True)
+        telecom = lower.str.contains(r'jio|airtel|voda', regex=True)
+        features['HasShoppingKeyword'] = shopping.to_numpy(dtype=bool)[positions]
+        features['HasEntertainmentKeyword'] = entertainment.to_numpy(dtype=bool)[positions]
+        features['HasTravelKeyword'] = travel.to_numpy(dtype=bool)[positions]
+        features['HasTelecomKeyword'] = telecom.to_numpy(dtype=bool)[positions]
+
+        # Time-based features
+        if 'Date' in df.columns:
+            dates = self._parse_dates(df['Date'])
+            features['DayOfWeek'] = dates.dt.weekday.fillna(0).astype(int)
+            features['IsWeekend'] = (features['DayOfWeek'] >= 5).astype(int).where(dates.notna(), 0)
+            features['Month'] = dates.dt.month.fillna(1).astype(int)
+        else:
+            features['DayOfWeek'] = 0
+            features['IsWeekend'] = 0
+            features['Month'] = 1
+
+        # Amount-based and rule-based features
+        amount = features['TransactionAmount'].abs()
+        is_upi = features['TransactionType'] == 'UPI'
+        features['IsRoundAmount'] = (amount % 10 == 0).astype(int)
+        features['is_small_upi_no_payee'] = (is_upi & (features['HasPayee'] == 0) & (amount < 200)).astype(int)
+        features['is_upi_with_payee'] = (is_upi & (features['HasPayee'] == 1)).astype(int)
+        features['is_large_amount'] = (amount > 200).astype(int)
+
+        return features
+
+    def _to_amounts(self, values):
+        """Convert an amount column to floats, treating blanks as 0"""
+        return clean_amounts(values).fillna(0)
+
+    def _parse_dates(self, dates):
+        """Parse a Date column the way extract_features does, NaT where it cannot"""
+        return parse_dates(dates)
+
     def extract_transaction_type(self, description):
         """Extract the transaction type from the description."""
         if not isinstance(description, str):
@@ -176,7 +312,48 @@ class TransactionCategorizer:
                 return matches[0]
         
         return None
-    
+
+    def normalize_payee(self, description):
+        """Return a stable payee key for a single transaction description."""
+        return self.normalize_payees(pd.Series([description])).iloc[0]
+
+    def normalize_payees(self, descriptions):
+        """
+        Normalize transaction descriptions into stable payee keys.
+
+        UPI transactions are keyed on their VPA (e.g. 'amazon@yapl'), which
+        identifies the payee better than the short name returned by
+        extract_payee_name. Other descriptions drop reference numbers and
+        direction markers so repeated payments to the same payee match.
+
+        Categorical descriptions are normalized once per distinct value.
+
+        Args:
+            descriptions: pandas Series of 'Particulars' strings
+
+        Returns:
+            pandas Series of lowercase payee keys ('' when nothing is left),
+            indexed like descriptions
+        """
+        values, positions = distinct_values(descriptions)
+
+        # Statement cells wrap mid-word, so join wrapped lines without spaces
+        text = values.fillna('').astype(str).str.replace('\n', '', regex=False)
+
+        payees = text.str.extract(r'([A-Za-z0-9._\-]+@[A-Za-z0-9]+)', expand=False).str.lower()
+
+        # Only descriptions without a VPA need the slower generic cleanup
+        missing = payees.isna()
+        if missing.any():
+            payees[missing] = (text[missing].str.upper()
+                               .str.replace(r'[^A-Z0-9]+', ' ', regex=True)
+                               .str.replace(r'\b\w*\d\w*\b', ' ', regex=True)
+                               .str.replace(r'\b(UPI|DR|CR)\b', ' ', regex=True)
+                               .str.split().str.join(' ')
+                               .str.lower())
+
+        return pd.Series(payees.fillna('').to_numpy(dtype=object)[positions], index=descriptions.index)
+
     def extract_keywords(self, description):
         """Extract keywords from the description."""
         if not isinstance(description, str):
@@ -211,16 +388,44 @@ class TransactionCategorizer:
         
         return ','.join(found_keywords) if found_keywords else 'other'
     
-    def categorize(self, transaction):
+    def known_categories(self, descriptions, username=None):
+        """
+        Look up the payees of descriptions in the merchant knowledge base.
+
+        Args:
+            descriptions: pandas Series of 'Particulars' strings
+            username: User whose corrections apply, if any
+
+        Returns:
+            numpy object array of categories ('' where nothing is known), or
+            None when the knowledge base has nothing that could apply
         """
-        Categorize a transaction using hybrid approach (rules first, then ML).
+        if self.knowledge_base is None or self.knowledge_base.is_empty(username):
+            return None
+        return self.knowledge_base.lookup(self.normalize_payees(descriptions).to_numpy(), username)
+
+    def known_payee_categories(self, payees, username=None):
+        """Like known_categories, for payee keys that were already normalized"""
+        if self.knowledge_base is None or self.knowledge_base.is_empty(username):
+            return None
+        return self.knowledge_base.lookup(np.asarray(payees, dtype=object), username)
+
+    def categorize(self, transaction, username=None):
+        """
+        Categorize a transaction using hybrid approach (known merchants, rules, then ML).
         
         Args:
             transaction: Dictionary containing transaction data
+            username: User whose merchant corrections apply, if any
             
         Returns:
             Predicted category as a string
         """
+        # Payees with a known category skip the rules and the model
+        known = self.known_categories(pd.Series([transaction.get('Particulars', '')]), username)
+        if known is not None and known[0]:
+            return known[0]
+        
         # Extract features
         features = self.extract_features(transaction)
         
@@ -268,6 +473,77 @@ class TransactionCategorizer:
             
         return 'OTHER'  # Default category if no rules match and no model is loaded
     
+    def categorize_batch(self, df, username=None, observe=True):
+        """
+        Categorize all transactions of a DataFrame at once.
+
+        Applies the same knowledge base lookups and rules as categorize, in
+        the same order, to whole columns, then sends every transaction still
+        without a category to the model in a single predict call.
+
+        Args:
+            df: pandas DataFrame containing transaction data
+            username: User whose merchant corrections apply, if any
+            observe: Whether the shadow evaluator counts these rows as live traffic
+
+        Returns:
+            numpy array of predicted categories, aligned with df
+        """
+        features = self.extract_features_batch(df)
+        known = self.known_categories(df['Particulars'], username) if 'Particulars' in df.columns else None
+        return self.categorize_features(features, known, observe)
+
+    def categorize_features(self, features, known=None, observe=True):
+        """
+        Categorize transactions from features already extracted by extract_features_batch.
+
+        Args:
+            features: DataFrame of extracted features
+            known: Optional array of known merchant categories ('' where unknown)
+            observe: Whether the shadow evaluator counts these rows as live
+                traffic (not for re-scoring or re-categorizing stored statements)
+
+        Returns:
+            numpy array of predicted categories, aligned with features
+        """
+        transaction_type = features['TransactionType']
+        has_payee = features['HasPayee'] == 1
+        amount = features['TransactionAmount']
+
+        # Rule-based logic first, in the order used by categorize
+        conditions = [
+            (transaction_type == 'UPI') & ~has_payee & (amount.abs() < 200),
+            (transaction_type == 'UPI') & has_payee & (amount < 0),
+            (amount.abs() > 200) & (amount < 0),
+            (transaction_type == 'INTEREST') | (amount > 0),
+            features['HasShoppingKeyword'],
+            features['HasEntertainmentKeyword'],
+            features['HasTravelKeyword'],
+            features['HasTelecomKeyword'],
+        ]
+        choices = ['FOOD', 'FRIENDS_FAMILY', 'PURCHASES', 'INCOME',
+                   'SHOPPING', 'ENTERTAINMENT', 'TRAVEL', 'UTILITIES']
+        categories = np.select(conditions, choices, default='').astype(object)
+
+        # Known merchants take precedence over the rules
+        if known is not None:
+            categories = np.where(known != '', known, categories)
+
+        # Transactions no rule matched go to the ML model in one batch
+        unmatched = categories == ''
+        if unmatched.any() and self.model is not None and self.preprocessor is not None:
+            features_processed = self.preprocessor.transform(features.loc[unmatched, self.MODEL_FEATURES])
+            categories[unmatched] = self.model.predict(features_processed)
+            model_rows = unmatched
+        else:
+            categories[unmatched] = 'OTHER'
+            model_rows = np.zeros(len(categories), dtype=bool)
+
+        if observe and self.shadow is not None:
+            self.shadow.observe(features, categories, model_rows)
+
+        return categories
+
     def categorize_dataframe(self, df):
         """
         Categorize all transactions in a DataFrame.
@@ -278,12 +554,8 @@ class TransactionCategorizer:
         Returns:
             DataFrame with added 'Category' column
         """
-        categories = []
-        for _, row in df.iterrows():
-            categories.append(self.categorize(row))
-            
         result_df = df.copy()
-        result_df['Category'] = categories
+        result_df['Category'] = self.categorize_batch(df) if len(df) else []
         return result_df
     
     def categorize_csv(self, input_file, output_file=None):
@@ -296,6 +568,8 @@ class TransactionCategorizer:
             
         Returns:
             DataFrame with added 'Category' column, and saves to output_file if provided
+
+        The whole file is loaded at once; use categorize_csv_chunked for large exports.
         """
         try:
             # Load the CSV
@@ -315,22 +589,106 @@ class TransactionCategorizer:
             print(f"Error processing CSV file: {e}")
             return None
 
+    def categorize_csv_chunked(self, input_file, output_file, chunksize=100000, workers=1):
+        """
+        Categorize a CSV file of any size with bounded memory.
 
-from transaction_categorizer import TransactionCategorizer
-import pandas as pd
+        The file is read chunksize rows at a time, each chunk is categorized
+        in batch and appended to output_file, so memory depends on the chunk
+        size and not on the file size. Cells are read as text, so every chunk
+        has the same schema and the output keeps the input's values exactly.
+
+        Args:
+            input_file: Path to input CSV file
+            output_file: Path to output file; a '.parquet' extension writes
+                Parquet (one row group per chunk, needs pyarrow), anything
+                else writes CSV
+            chunksize: Rows read and categorized at a time
+            workers: Worker processes categorizing chunks in parallel; the
+                output keeps the input order
+
+        Returns:
+            Number of rows written, or None if the file could not be processed
+        """
+        parquet = output_file.lower().endswith('.parquet')
+        if parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                print("Writing Parquet requires pyarrow (pip install pyarrow)")
+                return None
+
+        # Written under a temporary name, so a failed run never leaves a partial output
+        temp_file = f"{output_file}.tmp"
+        rows_written = 0
+        writer = None
+        try:
+            chunks = pd.read_csv(input_file, chunksize=chunksize, dtype=str)
+            for result in self._categorize_chunks(chunks, workers):
+                if parquet:
+                    if writer is None:
+                        schema = pa.schema([(str(col), pa.string()) for col in result.columns])
+                        writer = pq.ParquetWriter(temp_file, schema)
+                    writer.write_table(pa.Table.from_pandas(result, schema=schema, preserve_index=False))
+                else:
+                    result.to_csv(temp_file, mode='w' if rows_written == 0 else 'a',
+                                  header=rows_written == 0, index=False)
+                rows_written += len(result)
+                print(f"Categorized {rows_written} transactions")
+
+            if writer is not None:
+                writer.close()
+                writer = None
+            if rows_written == 0:
+                print(f"No transactions found in {input_file}")
+                return 0
+
+            os.replace(temp_file, output_file)
+            print(f"Categorized transactions saved to {output_file}")
+            return rows_written
+
+        except Exception as e:
+            print(f"Error processing CSV file: {e}")
+            if writer is not None:
+                writer.close()
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            return None
+
+    def _categorize_chunks(self, chunks, workers):
+        """Yield categorized chunks in input order, categorizing up to workers chunks at once"""
+        if workers <= 1:
+            for chunk in chunks:
+                yield chunk.assign(Category=self.categorize_batch(chunk) if len(chunk) else [])
+            return
+
+        # At most two chunks per worker are in flight, which bounds memory
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_chunk_worker,
+                                 initargs=(self,)) as executor:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(executor.submit(_categorize_chunk, chunk))
+                if len(in_flight) >= workers * 2:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+
+
+
+if __name__ == "__main__":
+    # Create sample data
+    data = {
+        'Date': ['15-Mar-2025', '16-Mar-2025', '17-Mar-2025'],
+        'Particulars': ['UPI/123456/PAYMENT', 'UPI/JOHNDOE/GPAY', 'POS AMAZON'],
+        'Withdrawl': [150, 500, 2000],
+        'Deposit': [0, 0, 0]
+    }
+    df = pd.DataFrame(data)
+
+    # Initialize categorizer
+    categorizer = TransactionCategorizer()
 
-# Create sample data
-data = {
-    'Date': ['15-Mar-2025', '16-Mar-2025', '17-Mar-2025'],
-    'Particulars': ['UPI/123456/PAYMENT', 'UPI/JOHNDOE/GPAY', 'POS AMAZON'],
-    'Withdrawl': [150, 500, 2000],
-    'Deposit': [0, 0, 0]
-}
-df = pd.DataFrame(data)
-
-# Initialize categorizer
-categorizer = TransactionCategorizer()
-
-# Categorize dataframe
-categorized_df = categorizer.categorize_dataframe(df)
-print(categorized_df)
\ No newline at end of file
+    # Categorize dataframe
+    categorized_df = categorizer.categorize_dataframe(df)
+    print(categorized_df)